@@ -12,8 +12,10 @@ https://docs.djangoproject.com/en/3.2/ref/settings/
 
 '''
 Apr 9 2024 - added media stuff
+Oct 18 2026 - added SCRAPBOOK_CACHE_ROOT and PDF_ settings for exporting
 '''
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -46,6 +48,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'scrapbooks.metrics.MetricsMiddleware', # first, so it times the other middleware too
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -80,13 +83,56 @@ WSGI_APPLICATION = 'DigitalScrapbook.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/3.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# SQLite by default. To use a database server set DB_ENGINE (e.g. postgresql, which needs psycopg2 installed),
+# DB_NAME, DB_USER, DB_PASSWORD, DB_HOST and DB_PORT in the environment.
+DB_ENGINE = os.environ.get('DB_ENGINE', 'sqlite3')
+
+if DB_ENGINE == 'sqlite3':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('DB_NAME', BASE_DIR / 'db.sqlite3'),
+            'OPTIONS': {
+                'timeout': 20, # seconds to wait for another connection to finish writing
+            },
+            'TEST': {
+                # a file instead of memory, so tests see the same locking as the real database
+                'NAME': BASE_DIR / 'test_db.sqlite3',
+            },
+        }
     }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': f'django.db.backends.{DB_ENGINE}',
+            'NAME': os.environ.get('DB_NAME', 'digital_scrapbook'),
+            'USER': os.environ.get('DB_USER', ''),
+            'PASSWORD': os.environ.get('DB_PASSWORD', ''),
+            'HOST': os.environ.get('DB_HOST', ''),
+            'PORT': os.environ.get('DB_PORT', ''),
+        }
+    }
+
+# seconds a database connection is kept open for the next request (0 closes it after every request). SQLite
+# connections are only a file being opened, so they aren't kept unless DB_CONN_MAX_AGE is set.
+DATABASES['default']['CONN_MAX_AGE'] = int(os.environ.get('DB_CONN_MAX_AGE', 0 if DB_ENGINE == 'sqlite3' else 60))
+
+# PRAGMAs run on every new SQLite connection (see scrapbooks/database.py). WAL lets pages be read while an
+# upload is being written, and with WAL synchronous=NORMAL is still safe but doesn't wait for the disk on every commit.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+    'busy_timeout': 20000, # milliseconds, the same as 'timeout' above
+    'cache_size': -20000, # negative means KiB, so 20 MB
+    'mmap_size': 128 * 1024 * 1024,
+    'temp_store': 'memory',
 }
 
+# SQLite database files that keep their rollback journal (and synchronous=FULL, which it needs to be safe) instead
+# of the SQLITE_PRAGMAS ones, e.g. a copy that is checked in to a repository (journal_mode is saved in the database
+# file). None by default, set SQLITE_KEEP_JOURNAL in the environment to a list of paths separated by os.pathsep.
+SQLITE_KEEP_JOURNAL = [name for name in os.environ.get('SQLITE_KEEP_JOURNAL', '').split(os.pathsep) if name]
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
@@ -134,4 +180,90 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # based on how this website said to do it:https://testdriven.io/blog/django-static-files/
 MEDIA_URL = '/media/'
-MEDIA_ROOT = BASE_DIR / 'uploads'
\ No newline at end of file
+MEDIA_ROOT = BASE_DIR / 'uploads'
+
+# generated files that can be rebuilt at any time (e.g. images resized for pdfs)
+SCRAPBOOK_CACHE_ROOT = BASE_DIR / 'cache'
+
+# total size of exported pdfs kept in the cache (least recently used ones are deleted first)
+PDF_CACHE_MAX_BYTES = 500 * 1024 * 1024
+
+# reuse pages drawn by earlier exports, so editing a scrapbook only draws the pages that changed
+# (see scrapbooks/page_cache.py), and the total size of the pages kept
+PDF_PAGE_CACHE = True
+PDF_PAGE_CACHE_MAX_BYTES = 500 * 1024 * 1024
+
+# images in tilted boxes (e.g. template1) are put in the pdf upright and turned by the pdf itself, so they stay
+# opaque jpegs (False rotates their pixels instead and saves them as pngs with transparent corners, see
+# scrapbooks/derivatives.py, but only for the lossless profile, images for jpeg profiles are always turned by the pdf)
+PDF_VECTOR_ROTATION = True
+
+# most memory the pages of one export should use (each page is drawn as a pdf of its own, see
+# scrapbooks/pdf_export.py; pages drawn after the first half of this is used are kept in temporary files
+# until they are joined into the export)
+PDF_MEMORY_LIMIT_BYTES = 64 * 1024 * 1024
+
+# export profile used when /save/ has no ?profile= (draft, screen or print, see scrapbooks/export_profiles.py)
+PDF_DEFAULT_PROFILE = 'print'
+
+# folders with the theme files (<name>.json, see scrapbooks/scrapbook_template_info.py), a theme in a
+# later folder replaces one with the same name
+SCRAPBOOK_THEME_DIRS = [BASE_DIR / 'scrapbooks' / 'themes']
+
+# load the fonts, styles & backgrounds of every theme when the server starts (otherwise they are
+# loaded the first time each theme is exported, either way only once per process)
+SCRAPBOOK_WARM_THEMES = False
+
+# processes used to rotate & resize images for pdfs (scrapbooks with fewer than PDF_POOL_MIN_IMAGES
+# images that need preparing are done in the same process, since starting the work elsewhere takes longer)
+PDF_IMAGE_WORKERS = os.cpu_count() or 1
+PDF_POOL_MIN_IMAGES = 4
+
+# background pdf jobs (Scrapbook_project/<code>/save/?job=1)
+PDF_JOB_WORKERS = 2 # number of pdfs rendered at the same time
+# run the workers in the web server process instead of "python manage.py run_pdf_jobs" (only for a single process
+# development server, every web server process would start PDF_JOB_WORKERS threads)
+PDF_JOBS_IN_PROCESS = False
+PDF_JOB_POLL_INTERVAL = 5 # seconds between checks for new jobs from other processes
+PDF_JOB_STALE_SECONDS = 600 # a job still running after this long on another machine is assumed to be lost
+
+# number of media shown at a time on a scrapbook's page
+MEDIA_PAGE_SIZE = 24
+
+# limits for one bulk upload (Scrapbook_project/<code>/upload/), so one request can't use up the server's
+# memory or disk (DATA_UPLOAD_MAX_NUMBER_FILES, which is 100 by default, has to be at least BULK_UPLOAD_MAX_FILES)
+BULK_UPLOAD_MAX_FILES = 60
+BULK_UPLOAD_MAX_BYTES = 200 * 1024 * 1024 # size of the whole request
+
+# resumable uploads (Scrapbook_project/<code>/uploads/, see scrapbooks/chunked_uploads.py)
+CHUNKED_UPLOAD_MAX_BYTES = 100 * 1024 * 1024 # size of one file
+CHUNKED_UPLOAD_MAX_CHUNK_BYTES = 8 * 1024 * 1024 # size of one PUT request
+CHUNKED_UPLOAD_EXPIRE_SECONDS = 24 * 60 * 60 # unfinished uploads are deleted after this long without a chunk
+
+# new images are turned the right way up, shrunk to fit in INGEST_MAX_DIMENSION pixels and saved again without
+# their metadata (see scrapbooks/ingest.py). The uploaded files can be kept in INGEST_ARCHIVE_ROOT (not served).
+INGEST_NORMALIZE = True
+INGEST_MAX_DIMENSION = 2400 # the biggest box in a theme needs about 800 pixels in a print quality pdf
+INGEST_JPEG_QUALITY = 88
+INGEST_ARCHIVE_ORIGINALS = False
+INGEST_ARCHIVE_ROOT = BASE_DIR / 'archive'
+
+# files of deleted scrapbooks are deleted by "python manage.py collect_garbage" (run it regularly, e.g. from cron)
+GARBAGE_BATCH_SIZE = 500 # files handled at a time
+# files saved or reused by an upload more recently than this aren't deleted yet (and "collect_garbage --reconcile"
+# ignores them), so an upload of the same photo as one being deleted keeps the file
+GARBAGE_MIN_AGE_SECONDS = 60 * 60
+
+# remember codes typed on the homepage that don't exist for this many seconds, so checking them again
+# doesn't query the database (0 turns this off; other processes can create a code in the meantime)
+SCRAPBOOK_CODE_NEGATIVE_CACHE_SECONDS = 0
+SCRAPBOOK_CODE_NEGATIVE_CACHE_SIZE = 10000 # most codes remembered at once
+
+# threads that async views use the database, render templates & draw pdfs in when served with ASGI
+# (see scrapbooks/offload.py). Pdfs get their own threads so exports can't hold up page loads.
+ASYNC_PAGE_THREADS = 8
+ASYNC_EXPORT_THREADS = 2
+
+# time every request and show the totals at /metrics (see scrapbooks/metrics.py). Only turn this on where
+# /metrics can't be reached from outside (it is also a 404 when this is False).
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '') == '1'
@@ -16,6 +16,7 @@ Including another URLconf
 
 '''
 Apr 9 2024 - added the thing for user uploaded media
+Oct 18 2026 - added "metrics" path
 '''
 
 from django.contrib import admin
@@ -23,10 +24,12 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 from django.contrib.staticfiles.urls import staticfiles_urlpatterns
+from scrapbooks.views import prometheus_metrics
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path("Scrapbook_project/", include("scrapbooks.urls")),
+    path("metrics", prometheus_metrics, name="metrics"), # request totals for Prometheus (if METRICS_ENABLED is True)
     path("", include("home.urls"))
 ]
 
@@ -3,13 +3,14 @@ Forms for the home app
 History:
 (forgot to add history until recently)
 Feb 21 2024 - Finished ScrapCodeForm
+Oct 18 2026 - clean_scrapcode() looks up the one code instead of loading every scrapbook
 '''
 
 from django import forms
 
 from django.core.exceptions import ValidationError
 from django.utils.translation import gettext_lazy as _
-from scrapbooks.models import Scrapbook
+from scrapbooks.codes import code_exists
 
 class ScrapCodeForm(forms.Form):
     '''
@@ -21,8 +22,7 @@ class ScrapCodeForm(forms.Form):
         data = self.cleaned_data['scrapcode']
 
         # check if scrapbook code matches an existing scrapbook
-        valid_codes = [s.scrapbook_code for s in Scrapbook.objects.all()] # codes of all scrapbooks
-        if data not in valid_codes:
+        if not code_exists(data):
             raise ValidationError(_('Invalid code – this scrapbook does not exist'))
 
         return data
\ No newline at end of file
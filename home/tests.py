@@ -1,3 +1,80 @@
-from django.test import TestCase
+from django.db import connection, IntegrityError
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from home.forms import ScrapCodeForm
+from scrapbooks.codes import clear_missing_codes, code_exists
+from scrapbooks.models import Scrapbook
+
+
+@skipUnless(connection.vendor == 'sqlite', 'the scrapbooks are inserted with SQLite syntax')
+class ScrapCodeFormTests(TestCase):
+    '''
+    Checking a code on the homepage should take the same single query however many scrapbooks there are
+    '''
+
+    SCRAPBOOK_COUNT = 1000000
+
+    @classmethod
+    def setUpTestData(cls):
+        # codes 000000, 000001, ... in hex, so they are all different
+        with connection.cursor() as cursor:
+            cursor.execute(f'''
+                WITH RECURSIVE n(i) AS (SELECT 0 UNION ALL SELECT i + 1 FROM n WHERE i < {cls.SCRAPBOOK_COUNT - 1})
+                INSERT INTO scrapbooks_scrapbook (scrapbook_code, scrapbook_name, scrapbook_theme, updated_at)
+                SELECT printf('%06X', i), 'Untitled Scrapbook', 'template1', CURRENT_TIMESTAMP FROM n
+            ''')
+
+    def setUp(self):
+        clear_missing_codes()
+
+    def test_existing_code_is_one_query(self):
+        self.assertEqual(Scrapbook.objects.count(), self.SCRAPBOOK_COUNT)
+        with self.assertNumQueries(1):
+            form = ScrapCodeForm({'scrapcode': '0F423F'}) # the last one inserted
+            self.assertTrue(form.is_valid())
+
+    def test_missing_code_is_one_query(self):
+        with self.assertNumQueries(1):
+            form = ScrapCodeForm({'scrapcode': 'ZZZZZZ'})
+            self.assertFalse(form.is_valid())
+
+    def test_code_check_uses_index(self):
+        with CaptureQueriesContext(connection) as queries:
+            code_exists('0F423F')
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + queries.captured_queries[0]['sql'])
+            plan = ' '.join(row[-1] for row in cursor.fetchall())
+        self.assertIn('USING COVERING INDEX', plan)
+        self.assertNotIn('SCAN', plan)
+
+    @override_settings(SCRAPBOOK_CODE_NEGATIVE_CACHE_SECONDS=60)
+    def test_missing_code_is_remembered_until_created(self):
+        self.assertFalse(code_exists('ABCDEF'))
+        with self.assertNumQueries(0):
+            self.assertFalse(code_exists('ABCDEF'))
+
+        Scrapbook.objects.create(scrapbook_code='ABCDEF', scrapbook_name='New')
+        self.assertTrue(code_exists('ABCDEF'))
+
+
+class CreateScrapbookTests(TestCase):
+    '''
+    Scrapbook.create_scrapbook() should never give two scrapbooks the same code
+    '''
+
+    def test_taken_code_is_retried(self):
+        Scrapbook.objects.create(scrapbook_code='AAAAAA', scrapbook_name='Taken')
+        with mock.patch('scrapbooks.models.generate_code', side_effect=['AAAAAA', 'AAAAAA', 'BBBBBB']):
+            scrapbook = Scrapbook.create_scrapbook('New', 'template2')
+
+        self.assertEqual(scrapbook.scrapbook_code, 'BBBBBB')
+        self.assertEqual(Scrapbook.objects.filter(scrapbook_code='AAAAAA').count(), 1)
+
+    def test_gives_up_when_every_code_is_taken(self):
+        Scrapbook.objects.create(scrapbook_code='AAAAAA', scrapbook_name='Taken')
+        with mock.patch('scrapbooks.models.generate_code', return_value='AAAAAA'):
+            with self.assertRaises(IntegrityError):
+                Scrapbook.create_scrapbook()
+        self.assertEqual(Scrapbook.objects.count(), 1)
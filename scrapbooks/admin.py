@@ -4,7 +4,10 @@ from django.contrib import admin
 
 from django.contrib import admin
 
-from .models import Scrapbook, Media
+from .models import Scrapbook, Media, PdfJob, UploadSession, OrphanedFile
 
 admin.site.register(Scrapbook)
-admin.site.register(Media)
\ No newline at end of file
+admin.site.register(Media)
+admin.site.register(PdfJob)
+admin.site.register(UploadSession)
+admin.site.register(OrphanedFile)
\ No newline at end of file
@@ -1,6 +1,17 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class ScrapbooksConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'scrapbooks'
+
+    def ready(self):
+        # set up SQLite connections (WAL, busy timeout, ...)
+        from scrapbooks import database
+
+        # load fonts, styles & backgrounds of every theme now instead of in the first export
+        if settings.SCRAPBOOK_WARM_THEMES:
+            from scrapbooks import pdf_export # sets reportlab's options before the backgrounds are made
+            from scrapbooks.theme_assets import warm_up
+            warm_up()
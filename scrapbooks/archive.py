@@ -0,0 +1,211 @@
+'''
+Exporting many scrapbooks to a folder ("python manage.py export_scrapbooks")
+History:
+Oct 18 2026 - file creation
+Oct 18 2026 - the .revision file only has the revision, which now changes when an image is replaced
+Oct 18 2026 - the pool's processes pass image_workers=1 to render_scrapbook_pdf() instead of changing the settings
+
+Each scrapbook is written to <folder>/<code>-<profile>.pdf, and its revision (see pdf_cache.py) when
+it was exported goes in <code>-<profile>.revision next to it. The pdf is up to date, and isn't
+exported again, while the revision is the same. Files are written to a temporary file in
+the folder first and then moved, so the folder never has half a pdf even if an export is stopped.
+Pdfs that are in the pdf cache are copied from there instead of being drawn again.
+
+Scrapbooks are exported in a pool of processes ("spawn", like the image pool in derivatives.py),
+each of which sets up Django and prepares the images of its pdfs itself. Which pdfs are up to date
+is checked before anything is sent to the pool, so it isn't even started if nothing changed.
+'''
+
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+
+import django
+from django.db import close_old_connections
+
+from scrapbooks import pdf_cache
+from scrapbooks.export_profiles import profiles
+from scrapbooks.models import Scrapbook
+from scrapbooks.pdf_export import render_scrapbook_pdf
+
+# what happened to a scrapbook
+EXPORTED = 'exported'
+UP_TO_DATE = 'up to date'
+MISSING = 'missing' # deleted after it was selected
+FAILED = 'failed'
+
+
+class ExportResult():
+    '''
+    What happened when a scrapbook was exported
+    Attributes:
+        scrapbook_id (int): primary key of the scrapbook
+        code (str): the scrapbook's code (None if it is MISSING)
+        status (str): EXPORTED, UP_TO_DATE, MISSING or FAILED
+        size (int): size of the pdf in bytes (0 unless it was EXPORTED)
+        seconds (float): time taken
+        error (str): what went wrong if it FAILED
+    '''
+    def __init__(self, scrapbook_id, code, status, size=0, seconds=0.0, error=''):
+        self.scrapbook_id = scrapbook_id
+        self.code = code
+        self.status = status
+        self.size = size
+        self.seconds = seconds
+        self.error = error
+
+
+def select_scrapbooks(codes=None, since=None, until=None):
+    '''
+    :param codes: list of scrapbook codes (None for any)
+    :param since: only scrapbooks updated at or after this aware datetime (None for any)
+    :param until: only scrapbooks updated before this aware datetime (None for any)
+    :return: QuerySet of the ids of the scrapbooks, in order
+    '''
+    scrapbooks = Scrapbook.objects.all()
+    if codes is not None:
+        scrapbooks = scrapbooks.filter(scrapbook_code__in=codes)
+    if since is not None:
+        scrapbooks = scrapbooks.filter(updated_at__gte=since)
+    if until is not None:
+        scrapbooks = scrapbooks.filter(updated_at__lt=until)
+    return scrapbooks.order_by('id').values_list('id', flat=True)
+
+def output_paths(folder, code, profile):
+    '''
+    :param folder: Path of the output folder
+    :param code: the scrapbook's code
+    :param profile: the ExportProfile
+    :return: (Path of the pdf, Path of the file with its revision)
+    '''
+    return folder / f'{code}-{profile.name}.pdf', folder / f'{code}-{profile.name}.revision'
+
+def _write_atomically(folder, path, write):
+    '''
+    Writes a temporary file in the folder and then moves it to path
+    :param write: function that writes the contents to the (binary) file object it is given
+    '''
+    fd, tmp_path = tempfile.mkstemp(dir=folder, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as tmp_file:
+            write(tmp_file)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+def check_scrapbook(scrapbook_id, profile, folder, force=False):
+    '''
+    Finds out whether a scrapbook needs exporting
+    :param scrapbook_id: primary key of the scrapbook
+    :param profile: the ExportProfile
+    :param folder: Path of the output folder
+    :param force: True to export it even if it is up to date
+    :return: (ExportResult if it doesn't need exporting (MISSING or UP_TO_DATE) or None,
+    the Scrapbook, its revision)
+    '''
+    start = time.perf_counter()
+    scrapbook = Scrapbook.objects.filter(pk=scrapbook_id).first()
+    if scrapbook is None:
+        return ExportResult(scrapbook_id, None, MISSING), None, None
+
+    revision = pdf_cache.scrapbook_revision(scrapbook)
+    pdf_path, revision_path = output_paths(folder, scrapbook.scrapbook_code, profile)
+    if not force and pdf_path.is_file():
+        try:
+            if revision_path.read_text() == revision:
+                result = ExportResult(scrapbook_id, scrapbook.scrapbook_code, UP_TO_DATE,
+                                      seconds=time.perf_counter() - start)
+                return result, scrapbook, revision
+        except FileNotFoundError:
+            pass
+    return None, scrapbook, revision
+
+def export_scrapbook(scrapbook_id, profile_name, folder, force=False, image_workers=None):
+    '''
+    Exports a scrapbook unless its pdf in the folder is up to date
+    :param scrapbook_id: primary key of the scrapbook
+    :param profile_name: name of the ExportProfile
+    :param folder: the output folder
+    :param force: True to export it even if it is up to date
+    :param image_workers: passed to render_scrapbook_pdf() (PDF_IMAGE_WORKERS if None)
+    :return: ExportResult
+    '''
+    start = time.perf_counter()
+    folder = Path(folder)
+    profile = profiles[profile_name]
+    try:
+        result, scrapbook, revision = check_scrapbook(scrapbook_id, profile, folder, force)
+    except Exception as e:
+        return ExportResult(scrapbook_id, None, FAILED, seconds=time.perf_counter() - start, error=repr(e))
+    if result is not None:
+        return result
+
+    try:
+        pdf_path, revision_path = output_paths(folder, scrapbook.scrapbook_code, profile)
+        cached_path = pdf_cache.cached_pdf_path(scrapbook, revision, profile)
+        if cached_path is not None:
+            def write(pdf_file):
+                with open(cached_path, 'rb') as cached_file:
+                    shutil.copyfileobj(cached_file, pdf_file)
+        else:
+            def write(pdf_file):
+                render_scrapbook_pdf(scrapbook, pdf_file, profile, image_workers)
+        _write_atomically(folder, pdf_path, write)
+        # written after the pdf, so a pdf is never taken as up to date before it is finished
+        _write_atomically(folder, revision_path, lambda revision_file: revision_file.write(revision.encode()))
+    except Exception as e:
+        return ExportResult(scrapbook_id, scrapbook.scrapbook_code, FAILED, seconds=time.perf_counter() - start,
+                            error=repr(e))
+    return ExportResult(scrapbook_id, scrapbook.scrapbook_code, EXPORTED, size=pdf_path.stat().st_size,
+                        seconds=time.perf_counter() - start)
+
+def _export_in_worker(scrapbook_id, profile_name, folder, force):
+    '''
+    export_scrapbook() in a process of the pool, which prepares images itself (the processes already use every core)
+    '''
+    close_old_connections() # the process keeps its connection between scrapbooks
+    return export_scrapbook(scrapbook_id, profile_name, folder, force, image_workers=1)
+
+def export_scrapbooks(scrapbook_ids, profile, folder, workers, force=False):
+    '''
+    Exports scrapbooks to a folder, in a pool of processes if workers is more than 1
+    :param scrapbook_ids: iterable of scrapbook primary keys (e.g. from select_scrapbooks())
+    :param profile: the ExportProfile
+    :param folder: the output folder (made if it doesn't exist)
+    :param workers: number of processes
+    :param force: True to export scrapbooks even if they are up to date
+    :return: generator of ExportResult, in the order the exports finish
+    '''
+    folder = Path(folder)
+    folder.mkdir(parents=True, exist_ok=True)
+    if workers <= 1:
+        for scrapbook_id in scrapbook_ids:
+            yield export_scrapbook(scrapbook_id, profile.name, folder, force)
+        return
+
+    # the processes set up Django (DJANGO_SETTINGS_MODULE is passed on to them) before they are sent anything,
+    # and are only started when the first scrapbook is sent
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                             initializer=django.setup) as pool:
+        # only a few exports are waiting at a time, so millions of ids don't all become futures at once
+        waiting = set()
+        for scrapbook_id in scrapbook_ids:
+            try:
+                result = check_scrapbook(scrapbook_id, profile, folder, force)[0]
+            except Exception as e:
+                result = ExportResult(scrapbook_id, None, FAILED, error=repr(e))
+            if result is not None:
+                yield result
+                continue
+            if len(waiting) >= workers * 2:
+                done, waiting = wait(waiting, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+            waiting.add(pool.submit(_export_in_worker, scrapbook_id, profile.name, str(folder), force))
+        for future in wait(waiting).done:
+            yield future.result()
@@ -0,0 +1,306 @@
+'''
+Resumable uploads of large images
+History:
+Oct 18 2026 - file creation
+Oct 18 2026 - finished uploads are stored under their checksum (see storage.py)
+Oct 18 2026 - finished uploads are normalized like other uploads (see ingest.py)
+Oct 18 2026 - the checksum is worked out when the upload is finished (chunks can go to any process),
+              abandoned uploads are also deleted by "python manage.py collect_garbage"
+Oct 18 2026 - chunks are written with the upload's file locked, and only counted if nothing else
+              moved the upload on in the meantime
+Oct 18 2026 - the checksum is worked out as the chunks are written (only the chunks another process
+              wrote are read again), and a finished image is opened once to normalize it or get its size
+
+An upload is started with POST Scrapbook_project/<code>/uploads/, then the file is sent in
+pieces with PUT Scrapbook_project/<code>/uploads/<upload_id>/?offset=<bytes sent so far>, and
+finished with POST Scrapbook_project/<code>/uploads/<upload_id>/finalize/. If the connection
+drops, GET Scrapbook_project/<code>/uploads/<upload_id>/ says where to carry on from.
+
+The pieces are written straight into a temporary file under MEDIA_ROOT/partial_uploads (so
+the finished file can be moved into place instead of copied), and every piece can be sent to a
+different server process, since everything about an upload is in its UploadSession and that file.
+The file is locked while a chunk is written to it (and while the upload is finished), and a chunk is
+only added to UploadSession.received if it still starts there, so a chunk sent twice at once is
+only counted once.
+Each process works out the checksum of the chunks it writes as they arrive, so when the upload is
+finished only what another process wrote has to be read from the file. Uploads that haven't received
+anything for CHUNKED_UPLOAD_EXPIRE_SECONDS are deleted the next time an upload is started and by
+"python manage.py collect_garbage".
+'''
+
+import hashlib
+import os
+import threading
+from contextlib import contextmanager
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.core.files import locks
+from django.utils import timezone
+
+from scrapbooks.ingest import prepare_image
+from scrapbooks.storage import content_name
+from scrapbooks.thumbnails import image_dimensions
+
+READ_SIZE = 64 * 1024 # bytes read from the request at a time
+
+# checksums of the start of uploads written by this process: upload_id: (sha256 hasher, bytes it has seen)
+_hashers = {}
+_hashers_lock = threading.Lock()
+
+
+class ChunkError(Exception):
+    '''
+    Raised when a chunk can't be added to an upload
+    Attributes:
+        message (str): what went wrong
+        status (int): HTTP status code to respond with
+    '''
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def partial_uploads_root():
+    '''
+    :return: the folder where files are kept while they are being uploaded
+    '''
+    return Path(settings.MEDIA_ROOT) / 'partial_uploads'
+
+def partial_file_path(session):
+    '''
+    :param session: an UploadSession object
+    :return: path of the file the session's chunks are written to
+    '''
+    return partial_uploads_root() / f'{session.upload_id}.part'
+
+
+@contextmanager
+def _locked_partial_file(session):
+    '''
+    Opens the file of an upload and locks it (so only one chunk is written at a time by any process),
+    then reads how much of the upload has been received
+    :param session: the UploadSession object (its received is updated)
+    :return: the open file (a context manager)
+    '''
+    from scrapbooks.models import UploadSession
+
+    try:
+        partial_file = open(partial_file_path(session), 'r+b')
+    except FileNotFoundError:
+        raise ChunkError('the upload was finished or has expired', status=404)
+    with partial_file:
+        locks.lock(partial_file, locks.LOCK_EX)
+        try:
+            try:
+                session.refresh_from_db(fields=['received'])
+            except UploadSession.DoesNotExist: # it was finished while this waited for the lock
+                raise ChunkError('the upload was finished or has expired', status=404)
+            yield partial_file
+        finally:
+            locks.unlock(partial_file)
+
+def _take_hasher(upload_id, offset):
+    '''
+    :param upload_id: an UploadSession's upload_id
+    :param offset: where the next chunk starts
+    :return: (sha256 hasher, bytes it has seen), a new one if nothing of the upload has been seen yet
+    '''
+    with _hashers_lock:
+        hasher, seen = _hashers.pop(upload_id, (None, 0))
+    if hasher is None or seen > offset:
+        return hashlib.sha256(), 0
+    return hasher, seen
+
+def _keep_hasher(upload_id, hasher, seen):
+    '''
+    Keeps the checksum of the start of an upload for its next chunk (see _take_hasher())
+    '''
+    with _hashers_lock:
+        _hashers[upload_id] = (hasher, seen)
+
+def _upload_checksum(session, partial_file):
+    '''
+    :param session: the UploadSession object of a complete upload
+    :param partial_file: its open file
+    :return: sha256 hex digest of the file (only the part this process didn't write is read)
+    '''
+    hasher, seen = _take_hasher(session.upload_id, session.size)
+    partial_file.seek(seen)
+    for data in iter(lambda: partial_file.read(READ_SIZE), b''):
+        hasher.update(data)
+    _keep_hasher(session.upload_id, hasher, session.size) # in case the upload isn't finished this time
+    return hasher.hexdigest()
+
+
+def start_upload(scrapbook, file_name, size, caption=''):
+    '''
+    Starts a new upload (and deletes uploads that were abandoned)
+    :param scrapbook: the Scrapbook object the image is for
+    :param file_name: name of the file being uploaded
+    :param size: total size of the file in bytes
+    :param caption: caption for the Media object
+    :return: UploadSession
+    '''
+    from scrapbooks.models import UploadSession
+
+    expire_uploads()
+
+    session = UploadSession.objects.create(scrapbook=scrapbook, file_name=os.path.basename(file_name)[:255],
+                                           size=size, caption=caption)
+    partial_uploads_root().mkdir(parents=True, exist_ok=True)
+    partial_file_path(session).touch()
+    return session
+
+def append_chunk(session, offset, stream, length):
+    '''
+    Writes a chunk of an upload to its file
+    :param session: the UploadSession object
+    :param offset: where the chunk starts in the file (has to be the number of bytes received so far)
+    :param stream: file-like object to read the chunk from (the request)
+    :param length: size of the chunk in bytes
+    :return: number of bytes received so far (after this chunk)
+    '''
+    from scrapbooks.models import UploadSession
+
+    with _locked_partial_file(session) as partial_file:
+        if offset != session.received:
+            raise ChunkError(f'the next chunk starts at {session.received}', status=409)
+        if offset + length > session.size:
+            raise ChunkError(f'the file is only {session.size} bytes', status=413)
+
+        # carries on from the checksum of the chunks before if this process wrote them (otherwise it is
+        # kept as it is, and finish_upload() reads the file from where it stopped)
+        hasher, seen = _take_hasher(session.upload_id, offset)
+        continues = seen == offset
+        position = offset
+        try:
+            partial_file.seek(offset)
+            remaining = length
+            while remaining:
+                data = stream.read(min(READ_SIZE, remaining))
+                if not data:
+                    break # the connection dropped, keep what did arrive
+                partial_file.write(data)
+                if continues:
+                    hasher.update(data)
+                position += len(data)
+                remaining -= len(data)
+            partial_file.truncate(position)
+            partial_file.flush()
+        except OSError:
+            # part of the chunk might not have been written, start again from the last chunk that was saved
+            partial_file.truncate(offset)
+            raise ChunkError('the chunk could not be saved', status=500)
+
+        if position != offset:
+            # only if no other request has added this chunk since received was read
+            if not UploadSession.objects.filter(pk=session.pk, received=offset).update(
+                    received=position, updated=timezone.now()):
+                received = UploadSession.objects.filter(pk=session.pk).values_list('received', flat=True).first()
+                if received is None:
+                    raise ChunkError('the upload was finished or has expired', status=404)
+                session.received = received
+                raise ChunkError(f'the next chunk starts at {received}', status=409)
+            session.received = position
+        _keep_hasher(session.upload_id, hasher, position if continues else seen)
+
+    return position
+
+def finish_upload(session, expected_sha256=''):
+    '''
+    Turns a complete upload into a Media object. Unless the image has to be normalized (see ingest.py)
+    the file is moved into the images folder, not copied. The file is only opened once, to lock it.
+    :param session: the UploadSession object
+    :param expected_sha256: checksum the client worked out (checked if it isn't empty)
+    :return: (the new Media object, sha256 checksum of the file)
+    '''
+    from scrapbooks.models import Media
+
+    with _locked_partial_file(session) as partial_file:
+        if session.received != session.size:
+            raise ChunkError(f'only {session.received} of {session.size} bytes have been received', status=409)
+
+        checksum = _upload_checksum(session, partial_file)
+        if expected_sha256 and expected_sha256.lower() != checksum:
+            raise ChunkError('the checksum does not match the file that was received')
+
+        # unless it is normalized only the header is read, to check it is an image and get its size
+        normalized = None
+        try:
+            partial_file.seek(0)
+            if settings.INGEST_NORMALIZE:
+                normalized, width, height = prepare_image(partial_file, session.file_name)
+            else:
+                width, height = image_dimensions(partial_file)
+        except (OSError, ValueError):
+            # it can't be normalized, but it might still be an image that can be kept as it is
+            try:
+                partial_file.seek(0)
+                width, height = image_dimensions(partial_file)
+            except (OSError, ValueError):
+                raise ChunkError('the file is not an image')
+
+        path = partial_file_path(session)
+
+        # the checksum of the uploaded file is already known, so it can go straight to its place in a storage
+        if normalized is None:
+            name = _move_to_storage(path, Media._meta.get_field('image'), checksum, session.file_name)
+            media = Media(scrapbook=session.scrapbook, caption=session.caption, image=name,
+                          image_width=width, image_height=height)
+        else:
+            media = Media(scrapbook=session.scrapbook, caption=session.caption)
+            media.image, media.image_width, media.image_height = normalized, width, height
+            if settings.INGEST_ARCHIVE_ORIGINALS:
+                media.original = _move_to_storage(path, Media._meta.get_field('original'), checksum,
+                                                  session.file_name)
+            # otherwise the uploaded file is deleted with the UploadSession
+        media._ingested = True
+        media.save()
+
+        session.delete()
+    return media, checksum
+
+def _move_to_storage(path, field, checksum, file_name):
+    '''
+    Moves a file into the content-addressed storage of a Media field (see storage.py)
+    :param path: path of the file
+    :param field: the Media field (image or original)
+    :param checksum: sha256 of the file
+    :param file_name: name the file was uploaded with
+    :return: name of the file in the storage
+    '''
+    name = content_name(field.upload_to.rstrip('/'), checksum, file_name)
+    final_path = field.storage.path(name)
+    os.makedirs(os.path.dirname(final_path), exist_ok=True)
+    os.replace(path, final_path) # if the same file was already uploaded this replaces it with an identical copy
+    os.utime(final_path) # it was just used, like files reused by ContentAddressedStorage._save()
+    return name
+
+def discard_partial_file(session):
+    '''
+    Deletes the file of an upload that won't be finished (called when the UploadSession is deleted)
+    :param session: the UploadSession object
+    '''
+    try:
+        partial_file_path(session).unlink()
+    except FileNotFoundError:
+        pass
+    with _hashers_lock:
+        _hashers.pop(session.upload_id, None)
+
+def expire_uploads():
+    '''
+    Deletes uploads that haven't received anything for CHUNKED_UPLOAD_EXPIRE_SECONDS
+    :return: number of uploads deleted
+    '''
+    from scrapbooks.models import UploadSession
+
+    cutoff = timezone.now() - timedelta(seconds=settings.CHUNKED_UPLOAD_EXPIRE_SECONDS)
+    expired = 0
+    for session in UploadSession.objects.filter(updated__lt=cutoff):
+        session.delete() # the file is deleted by the post_delete receiver
+        expired += 1
+    return expired
@@ -0,0 +1,72 @@
+'''
+Scrapbook codes
+History:
+Oct 18 2026 - file creation
+
+Scrapbook.scrapbook_code is unique (and so indexed), so checking a code is a single index
+lookup no matter how many scrapbooks there are. Codes that were checked and don't exist can
+also be remembered for SCRAPBOOK_CODE_NEGATIVE_CACHE_SECONDS, so the same wrong code typed
+again doesn't touch the database.
+'''
+
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+
+CODE_LENGTH = 6
+
+
+def generate_code():
+    '''
+    :return: a random scrapbook code (6 uppercase hex characters), which might already be taken
+    '''
+    return uuid.uuid4().hex[:CODE_LENGTH].upper()
+
+
+_missing_codes = OrderedDict() # code: time it was found not to exist (oldest first)
+_missing_codes_lock = threading.Lock()
+
+def code_exists(code):
+    '''
+    Checks if there is a scrapbook with a code
+    :param code: the scrapbook code
+    :return: True if a scrapbook has that code
+    '''
+    from scrapbooks.models import Scrapbook
+
+    max_age = settings.SCRAPBOOK_CODE_NEGATIVE_CACHE_SECONDS
+    if max_age > 0:
+        with _missing_codes_lock:
+            checked = _missing_codes.get(code)
+            if checked is not None:
+                if time.monotonic() - checked < max_age:
+                    return False
+                del _missing_codes[code]
+
+    exists = Scrapbook.objects.filter(scrapbook_code=code).exists()
+
+    if not exists and max_age > 0:
+        with _missing_codes_lock:
+            _missing_codes[code] = time.monotonic()
+            _missing_codes.move_to_end(code)
+            while len(_missing_codes) > settings.SCRAPBOOK_CODE_NEGATIVE_CACHE_SIZE:
+                _missing_codes.popitem(last=False)
+    return exists
+
+def forget_missing_code(code):
+    '''
+    Removes a code from the codes remembered as not existing (called when a scrapbook is created with it)
+    :param code: the scrapbook code
+    '''
+    with _missing_codes_lock:
+        _missing_codes.pop(code, None)
+
+def clear_missing_codes():
+    '''
+    Forgets every code remembered as not existing
+    '''
+    with _missing_codes_lock:
+        _missing_codes.clear()
@@ -0,0 +1,55 @@
+'''
+Settings applied to every new database connection
+History:
+Oct 18 2026 - file creation
+Oct 18 2026 - queries are timed as the SQL stage of timing.py recordings
+Oct 18 2026 - journal_mode & synchronous aren't changed for the databases in SQLITE_CHECKED_IN
+Oct 18 2026 - queries are only timed when METRICS_ENABLED is True
+Oct 18 2026 - SQLITE_CHECKED_IN is now SQLITE_KEEP_JOURNAL and empty unless it is set, so the pragmas
+              are applied to the configured database by default
+'''
+
+from pathlib import Path
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+from scrapbooks.timing import stage, SQL
+
+# SQLITE_PRAGMAS that change the database file or only make sense with the journal_mode they are set with
+JOURNAL_PRAGMAS = ('journal_mode', 'synchronous')
+
+
+def time_query(execute, sql, params, many, context):
+    '''
+    Database execute wrapper that adds each query to the current timing recording (if there is one)
+    '''
+    with stage(SQL):
+        return execute(sql, params, many, context)
+
+
+@receiver(connection_created)
+def time_queries(sender, connection, **kwargs):
+    """
+    Times every query of a new connection when METRICS_ENABLED is True (connected in ScrapbooksConfig.ready()).
+    """
+
+    if settings.METRICS_ENABLED and time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, time_query)
+
+@receiver(connection_created)
+def apply_sqlite_pragmas(sender, connection, **kwargs):
+    """
+    Runs SQLITE_PRAGMAS on a new SQLite connection (connected in ScrapbooksConfig.ready()).
+    """
+
+    if connection.vendor != 'sqlite':
+        return
+
+    keep_journal = Path(connection.settings_dict['NAME']) in {Path(name) for name in settings.SQLITE_KEEP_JOURNAL}
+    with connection.cursor() as cursor:
+        for pragma, value in settings.SQLITE_PRAGMAS.items():
+            if keep_journal and pragma in JOURNAL_PRAGMAS:
+                continue
+            cursor.execute(f'PRAGMA {pragma} = {value}')
@@ -0,0 +1,312 @@
+'''
+Cache of images that are ready to be drawn in a scrapbook pdf
+History:
+Oct 18 2026 - file creation
+Oct 18 2026 - added iter_derivatives() to make missing derivatives in a process pool
+Oct 18 2026 - derivatives depend on the export profile (jpeg with a separate mask or lossless png)
+Oct 18 2026 - prepare_image() and build_derivative() record their stages (see timing.py)
+Oct 18 2026 - prepare_image() decodes jpegs at a reduced size, resizes in steps and rotates after resizing
+Oct 18 2026 - images in tilted Boxes are left upright when PDF_VECTOR_ROTATION is True (see rotates_pixels())
+Oct 18 2026 - Boxes are in points, derivatives are named after the theme's digest & the Slot they go in
+Oct 18 2026 - derivatives are keyed by the image's name instead of a checksum of the whole file
+Oct 18 2026 - rotated images for jpeg profiles are pngs with transparent corners instead of jpegs with a
+              separate mask (so draw_media() can use canvas.drawImage()), each derivative is one file
+Oct 18 2026 - images for jpeg profiles are always left upright, so they stay jpegs even without PDF_VECTOR_ROTATION
+Oct 18 2026 - iter_derivatives() takes the number of image workers to use (e.g. 1 in export_scrapbooks' processes)
+
+Every image in a scrapbook pdf gets converted to RGBA, resized and rotated to match its Box
+(or left upright for draw_media() to rotate, see rotates_pixels()).
+That only depends on the image file (which its name identifies, see image_key()), the theme,
+which Slot the image goes in and the export profile (resolution & encoding), so the result is saved in
+SCRAPBOOK_CACHE_ROOT/derivatives/<media id>/ and reused by later exports.
+'''
+
+import hashlib
+import math
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+
+from django.conf import settings
+from PIL import Image
+from reportlab.lib.units import cm
+
+from scrapbooks.timing import stage, DECODE, ROTATE, RESIZE, ENCODE
+
+# images are shrunk by a whole number until they are at most this many times bigger than the size
+# they need to be, then resampled the rest of the way (see Image.resize(), 3 looks the same as resampling it all)
+RESIZE_REDUCING_GAP = 3.0
+
+
+def derivatives_root():
+    '''
+    :return: the folder where all derivatives are stored
+    '''
+    return Path(settings.SCRAPBOOK_CACHE_ROOT) / 'derivatives'
+
+def media_derivatives_dir(media_id):
+    '''
+    :param media_id: primary key of a Media object
+    :return: the folder where the derivatives of that Media object are stored
+    '''
+    return derivatives_root() / str(media_id)
+
+def image_key(image_name):
+    '''
+    Images are stored under the hash of their contents (see storage.py) and a file is never
+    changed once it is saved, so a derivative can be keyed by the image's name without reading it
+    :param image_name: name of the image in the storage (Media.image.name)
+    :return: hex digest of the name (the name itself can have characters that don't belong in a file name)
+    '''
+    return hashlib.sha256(image_name.encode()).hexdigest()
+
+def rotates_pixels(dimensions, profile):
+    '''
+    Images in a tilted Box are either rotated here (which needs transparent corners, so they are
+    saved as pngs) or, when PDF_VECTOR_ROTATION is True, left upright and opaque and drawn rotated by draw_media().
+    Images for jpeg profiles are always left upright, a lossless png of them would be many times bigger.
+    :param dimensions: the Box the image goes in
+    :param profile: the ExportProfile
+    :return: True if the image's pixels have to be rotated
+    '''
+    return bool(dimensions.rotation) and not settings.PDF_VECTOR_ROTATION and profile.encoding != 'jpeg'
+
+def prepare_image(image_file, dimensions, resolution_factor, resample=Image.LANCZOS, rotate=True):
+    '''
+    Resizes and rotates an image so it fits in a Box. Only as much of the image is decoded as the
+    Box needs (jpegs can be decoded at 1/2, 1/4 or 1/8 size) and it is resized before it is rotated,
+    so each copy is let go of as soon as the next one is made and only the first copy is big.
+    :param image_file: the image (file path or file object)
+    :param dimensions: the Box the image goes in
+    :param resolution_factor: how many pixels there are for each point in the pdf
+    :param resample: PIL resampling filter used for resizing
+    :param rotate: False to leave the image upright (it is still sized to fit the Box once it is rotated)
+    :return: RGBA PIL Image
+    '''
+    with Image.open(image_file) as image_data:
+        # scale the image so it still fits in the box after it is rotated
+        angle = math.radians(dimensions.rotation)
+        width, height = image_data.size
+        rotated_width = width * abs(math.cos(angle)) + height * abs(math.sin(angle))
+        rotated_height = width * abs(math.sin(angle)) + height * abs(math.cos(angle))
+        scaling_factor = min(dimensions.width / rotated_width, dimensions.height / rotated_height)
+        size = (max(1, int(width * scaling_factor * resolution_factor)),
+                max(1, int(height * scaling_factor * resolution_factor)))
+
+        image_data.draft('RGB', size) # decodes jpegs at the smallest size that is still at least this big
+        with stage(DECODE):
+            image_data.load()
+        with stage(RESIZE):
+            converted = image_data.convert('RGBA')
+
+    with stage(RESIZE):
+        # shrinks by a whole number first (quick) and then resamples the rest of the way
+        resized = converted.resize(size, resample, reducing_gap=RESIZE_REDUCING_GAP)
+    converted.close()
+    if not (rotate and dimensions.rotation):
+        return resized
+
+    with stage(ROTATE):
+        # for rotation of images - from https://stackoverflow.com/questions/5252170/specify-image-filling-color-when-rotating-in-python-with-pil-and-setting-expand
+        # rotated image (bicubic, since it is already small)
+        rot = resized.rotate(dimensions.rotation, Image.BICUBIC, expand=1)
+        resized.close()
+        # a transparent image same size as rotated image
+        all_transparent = Image.new('RGBA', rot.size, (0,) * 4)
+        # create a composite image using the alpha layer of rot as a mask
+        return Image.composite(rot, all_transparent, rot)
+
+def derivative_path(media, theme, slot, dimensions, profile):
+    '''
+    :param media: the Media object
+    :param theme: the Theme (see scrapbook_template_info.py)
+    :param slot: index of the Slot in the theme's slots
+    :param dimensions: the Box the image goes in
+    :param profile: the ExportProfile (see export_profiles.py)
+    :return: where the derivative is (or will be) saved, without the file extension
+    '''
+    # upright images for tilted Boxes are named differently, so changing PDF_VECTOR_ROTATION never reuses the wrong one
+    upright = '-upright' if dimensions.rotation and not rotates_pixels(dimensions, profile) else ''
+    return (media_derivatives_dir(media.id) /
+            f'{image_key(media.image.name)}-{theme.name}-{theme.digest[:12]}-{slot}-{profile.name}-{profile.dpi}{upright}')
+
+def derivative_file(path, rotate, profile):
+    '''
+    :param path: path from derivative_path()
+    :param rotate: whether the image's pixels are rotated (see rotates_pixels())
+    :param profile: the ExportProfile
+    :return: file path of the image
+    '''
+    path = str(path)
+    if profile.encoding == 'jpeg' and not rotate:
+        return path + '.jpg'
+    # jpegs can't be transparent, so rotated images are pngs with transparent corners
+    return path + '.png'
+
+def build_derivative(image_path, dimensions, profile, path, rotate):
+    '''
+    Makes a derivative and saves it (this runs in the worker processes of the image pool, so it
+    only gets file paths, a Box, an ExportProfile and whether to rotate, not the settings)
+    :param image_path: file path of the original image
+    :param dimensions: the Box the image goes in
+    :param profile: the ExportProfile
+    :param path: path from derivative_path()
+    :param rotate: whether to rotate the image's pixels (see rotates_pixels())
+    :return: the file from derivative_file()
+    '''
+    image_file = derivative_file(path, rotate, profile)
+    image_data = prepare_image(image_path, dimensions, profile.resolution_factor, profile.resample, rotate)
+
+    # the image only needs to be transparent if it is rotated
+    with stage(ENCODE):
+        if rotate:
+            _save(image_data, image_file, format='PNG')
+        elif profile.encoding == 'jpeg':
+            _save(image_data.convert('RGB'), image_file, format='JPEG', quality=profile.jpeg_quality, optimize=True)
+        else:
+            _save(image_data.convert('RGB'), image_file, format='PNG')
+
+    return image_file
+
+def _save(image_data, path, **kwargs):
+    '''
+    Saves an image to a temporary file first and then moves it, so another export never reads half an image
+    :param image_data: PIL Image
+    :param path: where to save it
+    :param kwargs: arguments for Image.save()
+    '''
+    folder = os.path.dirname(path)
+    os.makedirs(folder, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=folder, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as tmp_file:
+        image_data.save(tmp_file, **kwargs)
+    os.replace(tmp_path, path)
+
+def get_derivative(media, theme, slot, profile):
+    '''
+    Gets the ready-to-draw version of a Media object's image, making it first if it isn't cached
+    :param media: the Media object
+    :param theme: the Theme
+    :param slot: index of the Slot in the theme's slots
+    :param profile: the ExportProfile
+    :return: the file from derivative_file()
+    '''
+    dimensions = theme.slots[slot].image
+    path = derivative_path(media, theme, slot, dimensions, profile)
+    rotate = rotates_pixels(dimensions, profile)
+    image_file = derivative_file(path, rotate, profile)
+    if not os.path.isfile(image_file):
+        image_file = build_derivative(media.image.path, dimensions, profile, str(path), rotate)
+    return image_file
+
+def iter_derivatives(media_slots, theme, profile, image_workers=None):
+    '''
+    Gets the derivatives for a whole scrapbook in order. Missing derivatives are made in the
+    image pool (a batch at a time) unless there are only a few of them.
+    :param media_slots: iterable of (index of the Slot in the theme's slots, Media object) in the order they go
+    in the pdf (see Theme.paginate())
+    :param theme: the Theme object
+    :param profile: the ExportProfile
+    :param image_workers: 1 to make every derivative in this process, otherwise the image pool is used
+    (PDF_IMAGE_WORKERS if None)
+    :return: generator of (Media, image file)
+    '''
+    if image_workers is None:
+        image_workers = settings.PDF_IMAGE_WORKERS
+    batch_size = max(1, image_workers) * 4 # a few images per worker, so only a batch is in memory
+    batch = []
+    for slot, m in media_slots:
+        dimensions = theme.slots[slot].image
+        batch.append((m, dimensions, derivative_path(m, theme, slot, dimensions, profile),
+                      rotates_pixels(dimensions, profile)))
+        if len(batch) == batch_size:
+            yield from _build_batch(batch, profile, image_workers)
+            batch = []
+    yield from _build_batch(batch, profile, image_workers)
+
+def _build_batch(batch, profile, image_workers):
+    '''
+    Makes the missing derivatives of a batch (see iter_derivatives)
+    :param batch: list of (Media, Box, derivative path, whether to rotate the pixels)
+    :param profile: the ExportProfile
+    :param image_workers: 1 to make them in this process, otherwise the image pool is used
+    :return: generator of (Media, image file)
+    '''
+    missing = [(m.image.path, dimensions, profile, str(path), rotate)
+               for m, dimensions, path, rotate in batch if not os.path.isfile(derivative_file(path, rotate, profile))]
+
+    if len(missing) >= settings.PDF_POOL_MIN_IMAGES and image_workers > 1:
+        try:
+            # map() gives back results in the same order, so the pdf is still drawn in order
+            list(get_image_pool().map(build_derivative, *zip(*missing)))
+        except BrokenProcessPool:
+            # a worker died (e.g. out of memory), start a new pool next time and do this batch here
+            shutdown_image_pool()
+            for args in missing:
+                build_derivative(*args)
+    else:
+        # not worth sending a few images to other processes
+        for args in missing:
+            build_derivative(*args)
+
+    for m, dimensions, path, rotate in batch:
+        yield m, derivative_file(path, rotate, profile)
+
+
+def background_image(theme, profile):
+    '''
+    Gets the background of a theme at the resolution of an export profile. Lossless profiles use
+    the original file, jpeg profiles get a resized jpeg (the backgrounds are big pngs).
+    :param theme: the Theme object
+    :param profile: the ExportProfile
+    :return: file path of the background image
+    '''
+    if profile.encoding != 'jpeg':
+        return theme.bg
+
+    path = derivatives_root() / 'backgrounds' / f'{theme.name}-{theme.digest[:12]}-{profile.name}-{profile.dpi}.jpg'
+    if not path.is_file():
+        with Image.open(theme.bg) as image_data:
+            page_size = (round(21 * cm * profile.resolution_factor), round(29.7 * cm * profile.resolution_factor))
+            if image_data.width > page_size[0]:
+                image_data = image_data.resize(page_size, profile.resample)
+            _save(image_data.convert('RGB'), str(path), format='JPEG', quality=profile.jpeg_quality, optimize=True)
+    return str(path)
+
+
+_image_pool = None
+_image_pool_lock = threading.Lock()
+
+def get_image_pool():
+    '''
+    :return: the process pool used to make derivatives (started the first time this is called)
+    '''
+    global _image_pool
+    with _image_pool_lock:
+        if _image_pool is None:
+            # "spawn" instead of "fork" because the web server process has threads and database connections
+            _image_pool = ProcessPoolExecutor(max_workers=settings.PDF_IMAGE_WORKERS,
+                                              mp_context=multiprocessing.get_context('spawn'))
+        return _image_pool
+
+def shutdown_image_pool():
+    '''
+    Stops the image pool (a new one is started the next time it is needed)
+    '''
+    global _image_pool
+    with _image_pool_lock:
+        if _image_pool is not None:
+            _image_pool.shutdown(wait=False)
+            _image_pool = None
+
+def delete_derivatives(media_id):
+    '''
+    Removes every cached derivative of a Media object
+    :param media_id: primary key of the Media object
+    '''
+    shutil.rmtree(media_derivatives_dir(media_id), ignore_errors=True)
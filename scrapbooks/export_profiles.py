@@ -0,0 +1,48 @@
+'''
+Quality settings for exported scrapbook pdfs
+History:
+Oct 18 2026 - file creation
+'''
+
+from PIL import Image
+
+
+class ExportProfile():
+    '''
+    Stores how the images in a scrapbook pdf are made
+    Attributes:
+        name (str): name used in the url (Scrapbook_project/<code>/save/?profile=<name>)
+        dpi (int): resolution of the images in the pdf
+        encoding (str): 'jpeg' or 'lossless' (png data, bigger but no compression artifacts)
+        jpeg_quality (int = 85): quality of jpeg images (1-95)
+        resample (int = Image.LANCZOS): PIL resampling filter used to resize images
+    '''
+    def __init__(self, name, dpi, encoding, jpeg_quality=85, resample=Image.LANCZOS):
+        self.name = name
+        self.dpi = dpi
+        self.encoding = encoding
+        self.jpeg_quality = jpeg_quality
+        self.resample = resample
+
+    @property
+    def resolution_factor(self):
+        '''
+        :return: how many pixels there are for each point in the pdf (a point is 1/72 of an inch)
+        '''
+        return self.dpi / 72
+
+# small & fast, for checking the layout
+draft = ExportProfile(name='draft', dpi=72, encoding='jpeg', jpeg_quality=60, resample=Image.BILINEAR)
+
+# for looking at on a screen or sending to people
+screen = ExportProfile(name='screen', dpi=150, encoding='jpeg', jpeg_quality=85)
+
+# for printing (the same resolution create_pdf() always used)
+print_quality = ExportProfile(name='print', dpi=216, encoding='lossless')
+
+# dictionary of profiles for each name
+profiles = {
+    'draft': draft,
+    'screen': screen,
+    'print': print_quality
+}
@@ -11,6 +11,7 @@ Mar 27 2024 - changed InfoForm parent class to ModelForm
 Apr 01 2024 - added widgets dictionary to InfoForm for bootstrap CSS
 Apr 12 2024 - UploadContentForm() is now a ModelForm, not regular Form; added EditCaptionForm
 Apr 18 2024 - included changes to UploadContentForm
+Oct 18 2026 - added BulkMediaForm
 '''
 
 from django.forms import ModelForm
@@ -52,4 +53,11 @@ class EditCaptionForm(ModelForm):
     '''
     class Meta:
         model = Media
-        fields = ["caption"]
\ No newline at end of file
+        fields = ["caption"]
+
+class BulkMediaForm(forms.Form):
+    '''
+    Checks one image (and its optional caption) of a bulk upload
+    '''
+    image = forms.ImageField()
+    caption = forms.CharField(max_length=400, required=False)
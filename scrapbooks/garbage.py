@@ -0,0 +1,187 @@
+'''
+Deleting scrapbooks quickly and cleaning up their files later
+History:
+Oct 18 2026 - file creation
+Oct 18 2026 - archived originals (see ingest.py) are deleted with their images
+Oct 18 2026 - files are deleted with ContentAddressedStorage.delete_unused() and only once they haven't been
+              used for GARBAGE_MIN_AGE_SECONDS, so an upload reusing a file at the same time keeps it
+
+delete_scrapbook() removes a scrapbook's media with one DELETE instead of loading every Media
+object to send post_delete, and records the images in OrphanedFile (deleting a single Media object
+records its files too). collect() (run by "python manage.py collect_garbage") deletes those files
+in batches, skipping images that are still used by other Media objects and keeping the ones that an
+upload saved or reused in the last GARBAGE_MIN_AGE_SECONDS for a later run (see storage.py).
+reconcile() looks through MEDIA_ROOT and the cache for files that don't belong to anything in the
+database and records them too.
+'''
+
+import os
+import re
+import time
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from scrapbooks.derivatives import delete_derivatives, derivatives_root
+from scrapbooks.storage import HASHED_NAME
+from scrapbooks.thumbnails import delete_thumbnails, thumbnails_root
+
+HASH_FOLDER = re.compile(r'.*[/\\][0-9a-f]{2}$') # a folder the storage puts hashed images in (e.g. images/3e)
+
+
+def delete_scrapbook(scrapbook):
+    '''
+    Deletes a scrapbook and its media without deleting any files (they are recorded in OrphanedFile)
+    :param scrapbook: the Scrapbook object
+    :return: number of Media objects deleted
+    '''
+    from scrapbooks.models import Media, OrphanedFile
+
+    media_table = Media._meta.db_table
+    orphan_table = OrphanedFile._meta.db_table
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(f'INSERT INTO {orphan_table} (image, original, media_id, created) '
+                           f'SELECT image, original, id, %s FROM {media_table} WHERE scrapbook_id = %s',
+                           [timezone.now(), scrapbook.pk])
+            cursor.execute(f'DELETE FROM {media_table} WHERE scrapbook_id = %s', [scrapbook.pk])
+            deleted = cursor.rowcount
+        # there's no media left, so this only deletes the scrapbook's pdf jobs & uploads
+        scrapbook.delete()
+    return deleted
+
+def collect(batch_size=None, min_age=None):
+    '''
+    Deletes the files recorded in OrphanedFile, a batch at a time
+    :param batch_size: number of OrphanedFile rows handled in each batch (GARBAGE_BATCH_SIZE if None)
+    :param min_age: seconds since a file was last saved or reused before it can be deleted (files used
+    more recently stay recorded for the next time), GARBAGE_MIN_AGE_SECONDS if None
+    :return: (number of files deleted, number still used by other Media objects and kept)
+    '''
+    from scrapbooks.models import Media, OrphanedFile
+
+    batch_size = batch_size or settings.GARBAGE_BATCH_SIZE
+    min_age = settings.GARBAGE_MIN_AGE_SECONDS if min_age is None else min_age
+    storage = Media._meta.get_field('image').storage
+    archive_storage = Media._meta.get_field('original').storage
+    deleted = kept = 0
+    last_id = 0
+
+    while True:
+        batch = list(OrphanedFile.objects.filter(id__gt=last_id).order_by('id')[:batch_size])
+        if not batch:
+            break
+        last_id = batch[-1].id
+
+        # the same image might have been uploaded again since it was recorded
+        names = {orphan.image for orphan in batch if orphan.image}
+        in_use = set(Media.objects.filter(image__in=names).values_list('image', flat=True))
+        originals = {orphan.original for orphan in batch if orphan.original}
+        originals_in_use = set(Media.objects.filter(original__in=originals).values_list('original', flat=True))
+
+        done = []
+        for orphan in batch:
+            finished = True
+            if orphan.image:
+                if orphan.image in in_use:
+                    kept += 1
+                elif orphan.image.startswith('partial_uploads/'):
+                    storage.delete(orphan.image) # left over from an upload that was never finished (see reconcile())
+                    deleted += 1
+                else:
+                    removed, finished = _delete_unused(storage, orphan.image, min_age,
+                                                       Media.objects.filter(image=orphan.image))
+                    deleted += removed
+            if orphan.original and orphan.original not in originals_in_use:
+                removed, original_finished = _delete_unused(archive_storage, orphan.original, min_age,
+                                                            Media.objects.filter(original=orphan.original))
+                deleted += removed
+                finished = finished and original_finished
+            if orphan.media_id is not None:
+                delete_thumbnails(orphan.media_id)
+                delete_derivatives(orphan.media_id)
+            if finished:
+                done.append(orphan.id)
+
+        OrphanedFile.objects.filter(id__in=done).delete()
+
+    return deleted, kept
+
+def _delete_unused(storage, name, min_age, users):
+    '''
+    :param storage: the ContentAddressedStorage the file is in
+    :param name: name of the file
+    :param min_age: seconds since the file was last saved or reused before it can be deleted
+    :param users: QuerySet of the Media objects using the file
+    :return: (True if the file was deleted, False if it was used recently and has to be tried again later)
+    '''
+    if not storage.exists(name):
+        return False, True
+    if storage.delete_unused(name, min_age, users.exists):
+        return True, True
+    # it was kept because something uses it again (so it isn't orphaned any more) or because it was used recently
+    return False, users.exists()
+
+def reconcile(min_age=None):
+    '''
+    Finds files that nothing in the database uses and records them in OrphanedFile. Only images named
+    by their content hash are considered, so files put in MEDIA_ROOT by hand (e.g. images/logo_test.png) stay.
+    :param min_age: seconds since a file was changed before it can count as left over (so uploads that
+    are being saved right now aren't included), GARBAGE_MIN_AGE_SECONDS if None
+    :return: number of leftovers found
+    '''
+    from scrapbooks.models import Media, OrphanedFile, UploadSession
+
+    min_age = settings.GARBAGE_MIN_AGE_SECONDS if min_age is None else min_age
+    cutoff = time.time() - min_age
+    media_root = str(settings.MEDIA_ROOT)
+    orphans = []
+
+    def old_enough(path):
+        try:
+            return os.path.getmtime(path) < cutoff
+        except FileNotFoundError:
+            return False
+
+    # images (and temporary files the storage didn't get to rename)
+    recorded = set(OrphanedFile.objects.exclude(image='').values_list('image', flat=True))
+    candidates = []
+    for folder, subfolders, files in os.walk(os.path.join(media_root, 'images')):
+        for file_name in files:
+            path = os.path.join(folder, file_name)
+            name = os.path.relpath(path, media_root).replace(os.sep, '/')
+            made_by_storage = HASHED_NAME.match(name) or (file_name.endswith('.tmp') and HASH_FOLDER.match(folder))
+            if made_by_storage and name not in recorded and old_enough(path):
+                candidates.append(name)
+    for start in range(0, len(candidates), settings.GARBAGE_BATCH_SIZE):
+        names = candidates[start:start + settings.GARBAGE_BATCH_SIZE]
+        in_use = set(Media.objects.filter(image__in=names).values_list('image', flat=True))
+        orphans += [OrphanedFile(image=name) for name in names if name not in in_use]
+
+    # uploads that were never finished and whose UploadSession is gone
+    partial_folder = os.path.join(media_root, 'partial_uploads')
+    if os.path.isdir(partial_folder):
+        sessions = {str(upload_id) for upload_id in UploadSession.objects.values_list('upload_id', flat=True)}
+        for file_name in os.listdir(partial_folder):
+            upload_id = file_name.split('.')[0]
+            name = f'partial_uploads/{file_name}'
+            if upload_id not in sessions and name not in recorded and old_enough(os.path.join(partial_folder, file_name)):
+                orphans.append(OrphanedFile(image=name))
+
+    # thumbnails & pdf derivatives of Media objects that don't exist
+    recorded_ids = set(OrphanedFile.objects.filter(media_id__isnull=False).values_list('media_id', flat=True))
+    cached_ids = set()
+    for root in (thumbnails_root(), derivatives_root()):
+        if root.is_dir():
+            cached_ids.update(int(entry.name) for entry in root.iterdir() if entry.name.isdigit())
+    cached_ids -= recorded_ids
+    existing_ids = set()
+    cached_list = sorted(cached_ids)
+    for start in range(0, len(cached_list), settings.GARBAGE_BATCH_SIZE):
+        existing_ids.update(Media.objects.filter(id__in=cached_list[start:start + settings.GARBAGE_BATCH_SIZE])
+                            .values_list('id', flat=True))
+    orphans += [OrphanedFile(media_id=media_id) for media_id in cached_list if media_id not in existing_ids]
+
+    OrphanedFile.objects.bulk_create(orphans, batch_size=settings.GARBAGE_BATCH_SIZE)
+    return len(orphans)
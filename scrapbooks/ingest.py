@@ -0,0 +1,139 @@
+'''
+Normalizing uploaded images before they are stored
+History:
+Oct 18 2026 - file creation
+Oct 18 2026 - normalize_image() records its stages (see timing.py)
+Oct 18 2026 - added prepare_image(), which gets the size of an image that doesn't need normalizing
+              from the same open file
+
+Camera photos are often sideways with an EXIF tag saying which way up they go (which the pdf
+export ignored, so portrait photos came out landscape), much bigger than anything the scrapbook
+shows, and full of metadata. When INGEST_NORMALIZE is True, a new image is turned the right way
+up, shrunk to fit in INGEST_MAX_DIMENSION, and saved again as a jpeg (or png if it is
+transparent) with only its colour profile kept. If INGEST_ARCHIVE_ORIGINALS is True the file
+that was uploaded is kept in INGEST_ARCHIVE_ROOT.
+'''
+
+import io
+import os
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+from scrapbooks.storage import ContentAddressedStorage
+from scrapbooks.thumbnails import image_dimensions
+from scrapbooks.timing import stage, DECODE, ROTATE, RESIZE, ENCODE
+
+EXIF_ORIENTATION = 0x0112
+
+
+def get_archive_storage():
+    '''
+    :return: storage for the original files of normalized images (Media.original)
+    '''
+    return ContentAddressedStorage(location=settings.INGEST_ARCHIVE_ROOT, base_url=None)
+
+def normalize_image(image_file, name):
+    '''
+    Turns an image the right way up, shrinks it and saves it again without most of its metadata
+    :param image_file: the image (file path or file object)
+    :param name: name the image was uploaded with
+    :return: (ContentFile of the new image, width, height), or None if the image is fine as it is
+    '''
+    with Image.open(image_file) as image_data:
+        return _normalize(image_data, name)
+
+def prepare_image(image_file, name):
+    '''
+    Normalizes an image like normalize_image(), or if it is fine as it is gets its size from the
+    header of the same open file (so the file is only opened once)
+    :param image_file: the image (file path or file object)
+    :param name: name the image was uploaded with
+    :return: (ContentFile of the new image or None if the image is fine as it is, width, height)
+    '''
+    with Image.open(image_file) as image_data:
+        normalized = _normalize(image_data, name)
+        if normalized is not None:
+            return normalized
+        width, height = image_data.size
+        if image_data.getexif().get(EXIF_ORIENTATION, 1) in (5, 6, 7, 8):
+            width, height = height, width
+        return None, width, height
+
+def _normalize(image_data, name):
+    '''
+    :param image_data: an open PIL image
+    :param name: name the image was uploaded with
+    :return: (ContentFile of the new image, width, height), or None if the image is fine as it is
+    '''
+    max_dimension = settings.INGEST_MAX_DIMENSION
+
+    orientation = image_data.getexif().get(EXIF_ORIENTATION, 1)
+    too_big = max(image_data.size) > max_dimension
+    if (not too_big and orientation == 1 and image_data.format in ('JPEG', 'PNG')
+            and 'exif' not in image_data.info):
+        return None
+
+    icc_profile = image_data.info.get('icc_profile')
+    transparent = image_data.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image_data.info
+
+    # jpegs can be decoded at 1/2, 1/4 or 1/8 size, which is a lot quicker for big photos
+    if too_big:
+        width, height = image_data.size
+        if orientation in (5, 6, 7, 8):
+            width, height = height, width
+        scale = max_dimension / max(width, height)
+        image_data.draft('RGB', (int(image_data.width * scale), int(image_data.height * scale)))
+
+    with stage(DECODE):
+        image_data.load()
+    with stage(ROTATE):
+        image_data = ImageOps.exif_transpose(image_data)
+    with stage(RESIZE):
+        image_data = image_data.convert('RGBA' if transparent else 'RGB')
+        image_data.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+
+    output = io.BytesIO()
+    stem = os.path.splitext(os.path.basename(name))[0]
+    with stage(ENCODE):
+        if transparent:
+            image_data.save(output, format='PNG', optimize=True, icc_profile=icc_profile)
+            new_name = f'{stem}.png'
+        else:
+            image_data.save(output, format='JPEG', quality=settings.INGEST_JPEG_QUALITY, optimize=True,
+                            icc_profile=icc_profile)
+            new_name = f'{stem}.jpg'
+    return ContentFile(output.getvalue(), name=new_name), image_data.width, image_data.height
+
+def ingest_media(media):
+    '''
+    Prepares the new image of a Media object before it is saved: normalizes it (if INGEST_NORMALIZE
+    is True), archives the original (if INGEST_ARCHIVE_ORIGINALS is True) and sets its width & height.
+    Called by the pre_save receiver in models.py, and directly where rows are made with bulk_create().
+    :param media: a Media object whose image hasn't been saved yet
+    '''
+    image = media.image
+    image.open('rb')
+
+    normalized = None
+    if settings.INGEST_NORMALIZE:
+        try:
+            normalized = normalize_image(image, image.name)
+        except (OSError, ValueError):
+            normalized = None # leave files PIL can't handle as they are
+        image.seek(0)
+
+    if normalized is None:
+        try:
+            media.image_width, media.image_height = image_dimensions(image)
+        except (OSError, ValueError):
+            media.image_width = media.image_height = None
+        image.seek(0) # the upload still has to be read again to save it
+    else:
+        if settings.INGEST_ARCHIVE_ORIGINALS:
+            media.original = media.original.field.storage.save(
+                media.original.field.generate_filename(media, image.name), image)
+        media.image, media.image_width, media.image_height = normalized
+
+    media._ingested = True # so the pre_save receiver doesn't do it again
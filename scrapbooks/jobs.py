@@ -0,0 +1,201 @@
+'''
+Background pdf rendering
+History:
+Oct 18 2026 - file creation
+Oct 18 2026 - jobs are rendered with the export profile they were queued with
+Oct 18 2026 - failed jobs log the exception and only tell the user that the pdf couldn't be made,
+              a WorkerPool can be started again after it was stopped
+
+Jobs are stored as PdfJob rows, so there is no separate message broker and jobs that were
+waiting when the server stopped are still there when it starts again. Workers are threads
+that take the oldest queued job from the database. They run in a separate process started with
+"python manage.py run_pdf_jobs", or in the web server process from the first time a job is queued
+if PDF_JOBS_IN_PROCESS is True (only for a single process development server, since every web
+server process would start its own workers).
+'''
+
+import logging
+import os
+import socket
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection
+from django.utils import timezone
+
+from scrapbooks import pdf_cache
+from scrapbooks.export_profiles import profiles
+from scrapbooks.models import PdfJob
+from scrapbooks.pdf_export import render_scrapbook_pdf
+
+WORKER_NAME = f'{socket.gethostname()}:{os.getpid()}' # which process a running job belongs to
+
+JOB_FAILED_MESSAGE = 'the pdf could not be made' # PdfJob.error, which is shown to the user (the details are logged)
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue(scrapbook, profile):
+    '''
+    Queues a pdf export of a scrapbook (or finds one that was already queued for the same revision)
+    :param scrapbook: the Scrapbook object to export
+    :param profile: the ExportProfile to render with
+    :return: PdfJob
+    '''
+    revision = pdf_cache.scrapbook_revision(scrapbook)
+
+    job = scrapbook.pdfjob_set.filter(revision=revision, profile=profile.name).exclude(
+        status=PdfJob.FAILED).order_by('-created').first()
+    if job is None or (job.status == PdfJob.DONE and not os.path.isfile(job.pdf_path)):
+        job = PdfJob.objects.create(scrapbook=scrapbook, revision=revision, profile=profile.name)
+
+    if settings.PDF_JOBS_IN_PROCESS:
+        get_pool().wake()
+    return job
+
+def claim_next_job():
+    '''
+    Marks the oldest queued job as running
+    :return: the PdfJob, or None if there are no queued jobs
+    '''
+    for job in PdfJob.objects.filter(status=PdfJob.QUEUED).order_by('created')[:10]:
+        # only one worker can change the status from queued, so only one of them gets the job
+        claimed = PdfJob.objects.filter(pk=job.pk, status=PdfJob.QUEUED).update(
+            status=PdfJob.RUNNING, worker=WORKER_NAME, updated=timezone.now())
+        if claimed:
+            job.refresh_from_db()
+            return job
+    return None
+
+def run_job(job):
+    '''
+    Renders the pdf for a job into the pdf cache and records the result
+    :param job: a PdfJob that has been claimed
+    '''
+    scrapbook = job.scrapbook
+    try:
+        profile = profiles[job.profile]
+        # the scrapbook might have been edited since the job was queued, so render what it is now
+        revision = pdf_cache.scrapbook_revision(scrapbook)
+        pdf_path = pdf_cache.cached_pdf_path(scrapbook, revision, profile)
+        if pdf_path is None:
+            pdf_path = pdf_cache.store_pdf(scrapbook, revision, profile,
+                                           lambda pdf_file: render_scrapbook_pdf(scrapbook, pdf_file, profile))
+    except Exception:
+        logger.exception('pdf job %s for scrapbook %s failed', job.job_id, scrapbook.pk)
+        job.status = PdfJob.FAILED
+        job.error = JOB_FAILED_MESSAGE
+    else:
+        job.status = PdfJob.DONE
+        job.revision = revision
+        job.pdf_path = pdf_path
+    job.save()
+
+def recover_jobs():
+    '''
+    Puts jobs back in the queue if the worker running them stopped (e.g. the server was restarted)
+    :return: number of jobs put back in the queue
+    '''
+    host = socket.gethostname()
+    stale = timezone.now() - timedelta(seconds=settings.PDF_JOB_STALE_SECONDS)
+    recovered = 0
+
+    for job in PdfJob.objects.filter(status=PdfJob.RUNNING):
+        worker_host, _, worker_pid = job.worker.rpartition(':')
+        if job.worker == WORKER_NAME:
+            continue
+        if worker_host == host and worker_pid.isdigit():
+            dead = not _process_exists(int(worker_pid))
+        else:
+            dead = job.updated < stale # can't check processes on other machines
+        if dead:
+            recovered += PdfJob.objects.filter(pk=job.pk, status=PdfJob.RUNNING, worker=job.worker).update(
+                status=PdfJob.QUEUED, worker='')
+    return recovered
+
+def _process_exists(pid):
+    '''
+    :param pid: a process id on this machine
+    :return: True if the process is still running
+    '''
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class WorkerPool():
+    '''
+    Threads that run queued PdfJobs
+    Attributes:
+        size (int): number of worker threads
+        poll_interval (float): seconds a worker waits before checking the database again when there are no jobs
+    '''
+
+    def __init__(self, size, poll_interval):
+        self.size = size
+        self.poll_interval = poll_interval
+        self._wake_event = threading.Event()
+        self._stop_event = threading.Event()
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def start(self):
+        '''
+        Starts the worker threads (does nothing if they are already running)
+        '''
+        with self._lock:
+            if self._threads:
+                return
+            self._stop_event.clear() # in case the pool was stopped before
+            recover_jobs()
+            for n in range(self.size):
+                thread = threading.Thread(target=self._work, name=f'pdf-job-worker-{n}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def wake(self):
+        '''
+        Starts the workers if needed and tells them there is a new job
+        '''
+        self.start()
+        self._wake_event.set()
+
+    def stop(self):
+        '''
+        Stops the workers after their current job
+        '''
+        self._stop_event.set()
+        self._wake_event.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def _work(self):
+        while not self._stop_event.is_set():
+            close_old_connections()
+            job = claim_next_job()
+            if job is None:
+                self._wake_event.wait(self.poll_interval)
+                self._wake_event.clear()
+                continue
+            run_job(job)
+        connection.close()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    '''
+    :return: the WorkerPool of this process (made the first time this is called)
+    '''
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = WorkerPool(settings.PDF_JOB_WORKERS, settings.PDF_JOB_POLL_INTERVAL)
+        return _pool
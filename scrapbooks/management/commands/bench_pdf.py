@@ -0,0 +1,286 @@
+'''
+Command to measure how long pdf exports take and how much memory they use
+History:
+Oct 18 2026 - file creation
+Oct 18 2026 - added --rotation to compare rotating tilted images' pixels with rotating them in the pdf
+Oct 18 2026 - says that it needs a migrated database
+Oct 18 2026 - the page cache (see page_cache.py) is off unless --page-cache is given
+
+Makes a scrapbook of generated images for each theme (in a transaction that is rolled back, with
+MEDIA_ROOT and SCRAPBOOK_CACHE_ROOT in a temporary folder, so nothing is left behind) and exports
+it --runs times. Derivatives are deleted before every run unless --warm is given, so each run
+makes them again, and every page is drawn unless --page-cache is given. Stage times come from
+timing.py and only include work done in this process, so images are prepared here unless
+--image-workers is more than 1. "--rotation both" exports each theme with PDF_VECTOR_ROTATION
+off and on, and reports them as <theme>/raster and <theme>/vector.
+The rows are still written to the database, so it has to be migrated first (python manage.py migrate).
+'''
+
+import json
+import os
+import platform
+import random
+import statistics
+import tempfile
+import time
+import tracemalloc
+from io import BytesIO
+
+import PIL
+import reportlab
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test.utils import override_settings
+from PIL import Image
+
+from scrapbooks import timing
+from scrapbooks.derivatives import delete_derivatives, shutdown_image_pool
+from scrapbooks.export_profiles import profiles
+from scrapbooks.models import Scrapbook, Media
+from scrapbooks.pdf_export import render_scrapbook_pdf
+from scrapbooks.scrapbook_template_info import get_themes
+
+try:
+    import resource
+except ImportError: # Windows
+    resource = None
+
+FORMATS = {'jpeg': ('JPEG', 'jpg'), 'png': ('PNG', 'png'), 'webp': ('WEBP', 'webp')} # name: (PIL format, extension)
+
+ROTATIONS = {'raster': False, 'vector': True} # --rotation: value of PDF_VECTOR_ROTATION
+
+# stages shorter than this are too noisy to fail a comparison on
+MIN_COMPARED_SECONDS = 0.05
+
+
+def synthetic_image(number, width, height, image_format):
+    '''
+    Makes an image that compresses roughly like a photo (a smooth random pattern), always the same for a number
+    :param number: which image this is
+    :param width: width in pixels
+    :param height: height in pixels
+    :param image_format: key of FORMATS
+    :return: ContentFile of the image
+    '''
+    rng = random.Random(number)
+    small = Image.frombytes('RGB', (32, 24), bytes(rng.randrange(256) for _ in range(32 * 24 * 3)))
+    image_data = small.resize((width, height), Image.BICUBIC)
+    pil_format, extension = FORMATS[image_format]
+    output = BytesIO()
+    image_data.save(output, format=pil_format, quality=90)
+    return ContentFile(output.getvalue(), name=f'bench{number}.{extension}')
+
+def reset_peak_rss():
+    '''
+    Resets the peak memory of this process so it can be measured for one run (Linux only, elsewhere
+    the peak is since the process started)
+    '''
+    try:
+        with open('/proc/self/clear_refs', 'w') as clear_refs:
+            clear_refs.write('5')
+    except OSError:
+        pass
+
+def peak_rss():
+    '''
+    :return: peak resident memory of this process in bytes, or None if it can't be found out
+    '''
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss if platform.system() == 'Darwin' else max_rss * 1024 # bytes on macOS, KiB elsewhere
+
+def compare(results, baseline, threshold):
+    '''
+    :param results: results of this run
+    :param baseline: results loaded from an earlier --output file
+    :param threshold: percentage a number can grow by before it counts as a regression
+    :return: list of descriptions of the regressions
+    '''
+    regressions = []
+    for theme_name, result in results['themes'].items():
+        old = baseline['themes'].get(theme_name)
+        if old is None:
+            continue
+        numbers = [('seconds', result['seconds'], old['seconds']),
+                   ('pdf_bytes', result['pdf_bytes'], old['pdf_bytes']),
+                   ('peak_traced_bytes', result['peak_traced_bytes'], old.get('peak_traced_bytes')),
+                   ('peak_rss_bytes', result['peak_rss_bytes'], old.get('peak_rss_bytes'))]
+        numbers += [(f'stages.{name}', seconds, old['stages'].get(name))
+                    for name, seconds in result['stages'].items() if seconds >= MIN_COMPARED_SECONDS]
+        for name, new_value, old_value in numbers:
+            if new_value is None or not old_value:
+                continue
+            change = (new_value - old_value) / old_value * 100
+            if change > threshold:
+                regressions.append(f'{theme_name} {name}: {old_value:.4g} -> {new_value:.4g} (+{change:.1f}%)')
+    return regressions
+
+
+class Command(BaseCommand):
+    help = ('Exports generated scrapbooks and reports the time taken by each stage, memory used and pdf size '
+            '(python manage.py bench_pdf --output new.json --compare old.json to fail on regressions, '
+            'the database has to be migrated first)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--images', type=int, default=24, help='number of images in each scrapbook')
+        parser.add_argument('--size', default='2400x1800', help='size of the images in pixels (WIDTHxHEIGHT)')
+        parser.add_argument('--formats', default='jpeg',
+                            help=f'comma separated image formats, used in turn ({", ".join(FORMATS)})')
+        parser.add_argument('--themes', default=','.join(get_themes()), help='comma separated themes to export')
+        parser.add_argument('--profile', default=settings.PDF_DEFAULT_PROFILE, choices=list(profiles),
+                            help='export profile')
+        parser.add_argument('--runs', type=int, default=3, help='number of times each scrapbook is exported')
+        parser.add_argument('--warm', action='store_true', help="keep derivatives between runs")
+        parser.add_argument('--page-cache', action='store_true',
+                            help='reuse pages drawn by earlier runs (only the first run draws them)')
+        parser.add_argument('--rotation', choices=list(ROTATIONS) + ['both'],
+                            default='vector' if settings.PDF_VECTOR_ROTATION else 'raster',
+                            help='rotate the images in tilted boxes in the pdf (vector) or rotate their pixels '
+                                 '(raster, only for the print profile, jpeg profiles always use vector), '
+                                 'both exports every theme each way')
+        parser.add_argument('--normalize', action='store_true',
+                            help='store the images like new uploads (see ingest.py) instead of as they were made')
+        parser.add_argument('--image-workers', type=int, default=1,
+                            help='processes used to prepare images (stage times only include this process)')
+        parser.add_argument('--no-tracemalloc', dest='tracemalloc', action='store_false',
+                            help="skip the extra run that measures memory allocated by Python")
+        parser.add_argument('--output', help='file to write the results to as json')
+        parser.add_argument('--compare', help='json results of an earlier run to compare with')
+        parser.add_argument('--threshold', type=float, default=10.0,
+                            help='percent slower, bigger or more memory than --compare that counts as a regression')
+
+    def handle(self, *args, **options):
+        try:
+            width, height = (int(n) for n in options['size'].lower().split('x'))
+        except ValueError:
+            raise CommandError('--size has to be WIDTHxHEIGHT, e.g. 2400x1800')
+        image_formats = options['formats'].split(',')
+        theme_names = options['themes'].split(',')
+        for name in image_formats:
+            if name not in FORMATS:
+                raise CommandError(f'unknown format {name} (use {", ".join(FORMATS)})')
+        for name in theme_names:
+            if name not in get_themes():
+                raise CommandError(f'unknown theme {name} (use {", ".join(get_themes())})')
+        baseline = None
+        if options['compare']:
+            with open(options['compare']) as baseline_file:
+                baseline = json.load(baseline_file)
+
+        results = {
+            'settings': {
+                'images': options['images'], 'size': [width, height], 'formats': image_formats,
+                'profile': options['profile'], 'runs': options['runs'], 'warm': options['warm'],
+                'page_cache': options['page_cache'], 'rotation': options['rotation'],
+                'normalize': options['normalize'], 'image_workers': options['image_workers'],
+                'python': platform.python_version(), 'pillow': PIL.__version__, 'reportlab': reportlab.Version,
+            },
+            'themes': {},
+        }
+
+        with tempfile.TemporaryDirectory() as folder, override_settings(
+                MEDIA_ROOT=os.path.join(folder, 'media'), SCRAPBOOK_CACHE_ROOT=os.path.join(folder, 'cache'),
+                INGEST_NORMALIZE=options['normalize'], INGEST_ARCHIVE_ORIGINALS=False,
+                PDF_IMAGE_WORKERS=options['image_workers'], PDF_PAGE_CACHE=options['page_cache']):
+            try:
+                rotations = list(ROTATIONS) if options['rotation'] == 'both' else [options['rotation']]
+                for theme_name in theme_names:
+                    for rotation in rotations:
+                        name = f'{theme_name}/{rotation}' if len(rotations) > 1 else theme_name
+                        with override_settings(PDF_VECTOR_ROTATION=ROTATIONS[rotation]):
+                            results['themes'][name] = self.bench_theme(
+                                theme_name, width, height, image_formats, profiles[options['profile']], folder,
+                                options)
+            finally:
+                shutdown_image_pool() # its processes use the temporary folder
+
+        self.stdout.write(f'{"theme":<18}{"seconds":>9}{"decode":>9}{"rotate":>9}{"resize":>9}{"encode":>9}'
+                          f'{"draw":>9}{"save":>9}{"rss MB":>9}{"traced MB":>11}{"pdf MB":>9}')
+        for theme_name, result in results['themes'].items():
+            stages = ''.join(f'{result["stages"].get(name, 0):>9.3f}' for name in
+                             (timing.DECODE, timing.ROTATE, timing.RESIZE, timing.ENCODE, timing.DRAW, timing.SAVE))
+            rss = result['peak_rss_bytes']
+            self.stdout.write(f'{theme_name:<18}{result["seconds"]:>9.3f}{stages}'
+                              f'{(rss or 0) / 2 ** 20:>9.1f}{(result["peak_traced_bytes"] or 0) / 2 ** 20:>11.1f}'
+                              f'{result["pdf_bytes"] / 2 ** 20:>9.2f}')
+
+        if options['output']:
+            with open(options['output'], 'w') as output_file:
+                json.dump(results, output_file, indent=2)
+            self.stdout.write(f'results written to {options["output"]}')
+
+        if baseline is not None:
+            regressions = compare(results, baseline, options['threshold'])
+            if regressions:
+                raise CommandError('regressions compared to {}:\n{}'.format(options['compare'], '\n'.join(regressions)))
+            self.stdout.write(f'no regressions compared to {options["compare"]} (threshold {options["threshold"]}%)')
+
+    def bench_theme(self, theme_name, width, height, image_formats, profile, folder, options):
+        '''
+        Makes a scrapbook with a theme and exports it --runs times, then once more with tracemalloc on
+        (it slows everything down, so that run isn't timed). Pillow's image data isn't allocated by Python,
+        so it only shows up in the peak RSS.
+        :return: dictionary of results (times are medians of the runs)
+        '''
+        pdf_path = os.path.join(folder, f'{theme_name}.pdf')
+        totals = []
+        stage_runs = []
+        peaks = []
+
+        with transaction.atomic():
+            scrapbook = Scrapbook.create_scrapbook(f'Benchmark {theme_name}', theme_name)
+            for number in range(options['images']):
+                image_format = image_formats[number % len(image_formats)]
+                Media(scrapbook=scrapbook, caption=f'Photo number {number} of the benchmark scrapbook',
+                      image=synthetic_image(number, width, height, image_format)).save()
+            media_ids = list(scrapbook.media_set.values_list('id', flat=True))
+
+            def export():
+                if not options['warm']:
+                    for media_id in media_ids:
+                        delete_derivatives(media_id)
+                with open(pdf_path, 'wb') as pdf_file:
+                    render_scrapbook_pdf(scrapbook, pdf_file, profile)
+
+            for run in range(options['runs']):
+                reset_peak_rss()
+                with timing.recording() as timings:
+                    start = time.perf_counter()
+                    export()
+                    totals.append(time.perf_counter() - start)
+                stage_runs.append(timings.seconds)
+                peaks.append(peak_rss())
+                self.stdout.write(f'{theme_name} run {run + 1}: {totals[-1]:.3f}s')
+
+            peak_traced = None
+            if options['tracemalloc']:
+                self.stdout.write(f'{theme_name} run with tracemalloc (much slower)')
+                tracemalloc.start()
+                try:
+                    export()
+                    peak_traced = tracemalloc.get_traced_memory()[1]
+                finally:
+                    tracemalloc.stop()
+
+            transaction.set_rollback(True) # leave the database as it was
+
+        stage_names = {name for seconds in stage_runs for name in seconds}
+        return {
+            'seconds': statistics.median(totals),
+            'runs': totals,
+            'stages': {name: statistics.median(seconds.get(name, 0.0) for seconds in stage_runs)
+                       for name in sorted(stage_names)},
+            'peak_rss_bytes': max(peaks) if None not in peaks else None,
+            'peak_traced_bytes': peak_traced,
+            'pdf_bytes': os.path.getsize(pdf_path),
+        }
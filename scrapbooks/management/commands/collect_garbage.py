@@ -0,0 +1,38 @@
+'''
+Command to delete the files of deleted scrapbooks and media
+History:
+Oct 18 2026 - file creation
+Oct 18 2026 - also deletes abandoned resumable uploads (see chunked_uploads.expire_uploads())
+Oct 18 2026 - --min-age also applies to deleting recorded files (see storage.delete_unused())
+'''
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from scrapbooks.chunked_uploads import expire_uploads
+from scrapbooks.garbage import collect, reconcile
+
+
+class Command(BaseCommand):
+    help = ('Deletes files recorded as orphaned when scrapbooks were deleted and abandoned uploads '
+            '(python manage.py collect_garbage --reconcile to also look for other leftover files)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.GARBAGE_BATCH_SIZE,
+                            help='number of files handled at a time')
+        parser.add_argument('--reconcile', action='store_true',
+                            help='first look through MEDIA_ROOT and the cache for files nothing in the database uses')
+        parser.add_argument('--min-age', type=int, default=settings.GARBAGE_MIN_AGE_SECONDS,
+                            help='seconds a file has to be unused before it is deleted or --reconcile counts it as left over')
+
+    def handle(self, *args, **options):
+        # uploads are otherwise only expired when another one is started
+        expired = expire_uploads()
+        self.stdout.write(f'deleted {expired} abandoned upload(s)')
+
+        if options['reconcile']:
+            found = reconcile(options['min_age'])
+            self.stdout.write(f'found {found} leftover file(s)')
+
+        deleted, kept = collect(options['batch_size'], options['min_age'])
+        self.stdout.write(f'deleted {deleted} file(s), kept {kept} that are used again')
@@ -0,0 +1,75 @@
+'''
+Command to move uploads from before content-addressed storage to their content hash names
+History:
+Oct 18 2026 - file creation
+'''
+
+import os
+import shutil
+
+from django.core.management.base import BaseCommand
+from django.core.files import File
+
+from scrapbooks.models import Media
+from scrapbooks.storage import HASHED_NAME, content_digest, content_name
+
+
+class Command(BaseCommand):
+    help = ('Renames uploaded images to the hash of their contents and deletes duplicate copies '
+            '(python manage.py dedupe_media --dry-run to only see what would change)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help="report what would change without changing anything")
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        image_field = Media._meta.get_field('image')
+        storage = image_field.storage
+        directory = image_field.upload_to.rstrip('/')
+
+        old_names = (Media.objects.exclude(image='').order_by('image').values_list('image', flat=True).distinct())
+
+        converted = duplicates = missing = reclaimed = 0
+        new_names = set() # hashed names made during a dry run (nothing is actually moved)
+        for old_name in old_names.iterator():
+            if HASHED_NAME.match(old_name):
+                continue
+            old_path = storage.path(old_name)
+            if not os.path.isfile(old_path):
+                self.stdout.write(f'missing: {old_name}')
+                missing += 1
+                continue
+
+            with open(old_path, 'rb') as image_file:
+                new_name = content_name(directory, content_digest(File(image_file)), old_name)
+            new_path = storage.path(new_name)
+            size = os.path.getsize(old_path)
+
+            if os.path.isfile(new_path) or new_name in new_names:
+                # another upload already has these contents
+                duplicates += 1
+                reclaimed += size
+                self.stdout.write(f'duplicate: {old_name} -> {new_name} ({size} bytes)')
+            else:
+                converted += 1
+                new_names.add(new_name)
+                self.stdout.write(f'renamed: {old_name} -> {new_name}')
+            if dry_run:
+                continue
+
+            # move the file before changing the rows, so a Media object never points to a missing file
+            if not os.path.isfile(new_path):
+                os.makedirs(os.path.dirname(new_path), exist_ok=True)
+                try:
+                    os.link(old_path, new_path)
+                except OSError:
+                    shutil.copy2(old_path, new_path) # the file system doesn't support hard links
+            Media.objects.filter(image=old_name).update(image=new_name)
+            os.remove(old_path)
+
+        summary = (f'{converted} file(s) renamed, {duplicates} duplicate(s) removed, {missing} missing, '
+                   f'{reclaimed / (1024 * 1024):.1f} MB reclaimed')
+        if dry_run:
+            summary = f'dry run: {summary} (nothing was changed)'
+        self.stdout.write(summary)
@@ -0,0 +1,110 @@
+'''
+Command to export the pdfs of many scrapbooks to a folder, e.g. for a nightly archive
+History:
+Oct 18 2026 - file creation
+
+Scrapbooks are picked by code or by when they were last updated (see Scrapbook.updated_at) and
+exported in a pool of processes by archive.py, which skips pdfs that are already up to date.
+'''
+
+import os
+import re
+import time
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from scrapbooks.archive import EXPORTED, FAILED, MISSING, UP_TO_DATE, export_scrapbooks, select_scrapbooks
+from scrapbooks.export_profiles import profiles
+from scrapbooks.models import Scrapbook
+
+# --since/--until relative to now, e.g. 24h or 7d
+RELATIVE_TIME = re.compile(r'^(\d+(?:\.\d+)?)([mhd])$')
+RELATIVE_UNITS = {'m': 'minutes', 'h': 'hours', 'd': 'days'}
+
+
+def parse_time(value):
+    '''
+    :param value: a date (2026-10-18, midnight in TIME_ZONE), a date & time (2026-10-18T06:00) or a time
+    before now (30m, 24h or 7d)
+    :return: aware datetime
+    '''
+    match = RELATIVE_TIME.match(value)
+    if match:
+        return timezone.now() - timedelta(**{RELATIVE_UNITS[match.group(2)]: float(match.group(1))})
+    try:
+        moment = parse_datetime(value)
+        if moment is None:
+            day = parse_date(value)
+            moment = datetime(day.year, day.month, day.day) if day is not None else None
+    except ValueError: # looks right but isn't a real date
+        moment = None
+    if moment is None:
+        raise CommandError(f'{value} isn\'t a date, a date & time or a time before now like 24h')
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+class Command(BaseCommand):
+    help = ('Exports the pdfs of scrapbooks to a folder in parallel, skipping ones that are up to date '
+            '(python manage.py export_scrapbooks --output /archive --since 24h, or give scrapbook codes)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('codes', nargs='*', help='codes of the scrapbooks to export')
+        parser.add_argument('--since', help='only scrapbooks updated at or after this (a date, a date & time or 24h)')
+        parser.add_argument('--until', help='only scrapbooks updated before this')
+        parser.add_argument('--all', action='store_true', help='export every scrapbook')
+        parser.add_argument('--output', required=True, help='folder the pdfs are written to')
+        parser.add_argument('--profile', default=settings.PDF_DEFAULT_PROFILE, choices=list(profiles),
+                            help='export profile')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='number of processes exporting pdfs (1 exports in this process)')
+        parser.add_argument('--force', action='store_true', help='export scrapbooks even if their pdf is up to date')
+
+    def handle(self, *args, **options):
+        codes = options['codes'] or None
+        since = parse_time(options['since']) if options['since'] else None
+        until = parse_time(options['until']) if options['until'] else None
+        if codes is None and since is None and until is None and not options['all']:
+            raise CommandError('give scrapbook codes, --since/--until or --all')
+        if codes is not None:
+            found = set(Scrapbook.objects.filter(scrapbook_code__in=codes).values_list('scrapbook_code', flat=True))
+            unknown = [code for code in codes if code not in found]
+            if unknown:
+                raise CommandError(f'there are no scrapbooks with the code(s) {", ".join(unknown)}')
+
+        counts = {EXPORTED: 0, UP_TO_DATE: 0, MISSING: 0, FAILED: 0}
+        total_size = 0
+        export_seconds = 0.0
+        failures = []
+        start = time.perf_counter()
+        scrapbook_ids = select_scrapbooks(codes, since, until).iterator()
+        for result in export_scrapbooks(scrapbook_ids, profiles[options['profile']], options['output'],
+                                        max(1, options['workers']), options['force']):
+            counts[result.status] += 1
+            if result.status == EXPORTED:
+                total_size += result.size
+                export_seconds += result.seconds
+            elif result.status == FAILED:
+                failures.append(result)
+                self.stderr.write(f'{result.code} failed: {result.error}')
+            if options['verbosity'] >= 2:
+                self.stdout.write(f'{result.code or result.scrapbook_id}: {result.status} ({result.seconds:.2f}s)')
+        elapsed = time.perf_counter() - start
+
+        handled = sum(counts.values())
+        self.stdout.write(f'{handled} scrapbook(s) in {elapsed:.1f}s: {counts[EXPORTED]} exported, '
+                          f'{counts[UP_TO_DATE]} up to date, {counts[FAILED]} failed'
+                          + (f', {counts[MISSING]} deleted while exporting' if counts[MISSING] else ''))
+        if elapsed > 0:
+            self.stdout.write(f'{handled / elapsed:.1f} scrapbooks/s, {counts[EXPORTED] / elapsed:.1f} pdfs/s, '
+                              f'{total_size / 2 ** 20 / elapsed:.1f} MB/s ({total_size / 2 ** 20:.1f} MB written)')
+        if counts[EXPORTED]:
+            self.stdout.write(f'{export_seconds / counts[EXPORTED]:.2f}s per pdf in each of '
+                              f'{max(1, options["workers"])} process(es)')
+        if failures:
+            raise CommandError(f'{len(failures)} scrapbook(s) failed to export')
@@ -0,0 +1,314 @@
+'''
+Command to measure how the site copes with many people using it at once
+History:
+Oct 18 2026 - file creation
+Oct 18 2026 - the report says no requests finished instead of failing when there are no results
+Oct 18 2026 - says that it needs a migrated database
+
+Worker threads send a weighted mix of requests (see ROUTES) to the made up scrapbooks from
+seed_synthetic, either through Django's test Client in this process or over HTTP to a running
+server (--url), and the throughput and p50/p95/p99 latency of each route are reported. Only
+made up scrapbooks are used, because edit_save changes captions. Without --url the requests go
+to this process's database, which has to be migrated and seeded first.
+'''
+
+import http.client
+import json
+import math
+import random
+import threading
+import time
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode, urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Max, Min
+from django.test import Client
+
+from scrapbooks.management.commands.seed_synthetic import SYNTHETIC_PREFIX
+from scrapbooks.models import Scrapbook, Media
+
+# route name: function (target, random number generator, pdf profile) -> (method, path, form data)
+# where a target is a (scrapbook code, media id) of a made up scrapbook
+ROUTES = {
+    'home': lambda target, rng, profile: ('POST', '/', {'scrapcode': target[0]}), # code lookup
+    'home_missing': lambda target, rng, profile: ('POST', '/', {'scrapcode': f'{rng.randrange(16 ** 6):06X}'}),
+    'project': lambda target, rng, profile: ('GET', f'/Scrapbook_project/{target[0]}/', None),
+    'edit': lambda target, rng, profile: ('GET', f'/Scrapbook_project/{target[0]}/{target[1]}/', None),
+    'edit_save': lambda target, rng, profile: ('POST', f'/Scrapbook_project/{target[0]}/{target[1]}/',
+                                              {'caption': f'edited by the load test {rng.randrange(1000)}'}),
+    'confirm_delete': lambda target, rng, profile: (
+        'GET', f'/Scrapbook_project/{target[0]}/{target[1]}/confirm_delete/', None),
+    'save': lambda target, rng, profile: ('GET', f'/Scrapbook_project/{target[0]}/save/?profile={profile}', None),
+}
+
+DEFAULT_MIX = 'home=20,home_missing=5,project=40,edit=10,edit_save=5,confirm_delete=10,save=10'
+
+
+def percentile(sorted_values, percent):
+    '''
+    :param sorted_values: sorted list of numbers
+    :param percent: e.g. 95
+    :return: the nearest-rank percentile, or None if there are no values
+    '''
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(percent / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+def parse_mix(mix):
+    '''
+    :param mix: "route=weight,route=weight,..."
+    :return: (list of routes, list of weights)
+    '''
+    routes, weights = [], []
+    for part in mix.split(','):
+        route, _, weight = part.partition('=')
+        if route not in ROUTES:
+            raise CommandError(f'unknown route {route} (use {", ".join(ROUTES)})')
+        try:
+            weight = float(weight)
+        except ValueError:
+            raise CommandError(f'the weight of {route} has to be a number')
+        if weight > 0:
+            routes.append(route)
+            weights.append(weight)
+    if not routes:
+        raise CommandError('--mix needs at least one route with a weight above 0')
+    return routes, weights
+
+def sample_targets(count, rng):
+    '''
+    Picks random made up scrapbooks that have media
+    :param count: how many to try to find
+    :param rng: random number generator
+    :return: list of (scrapbook code, media id)
+    '''
+    synthetic = Scrapbook.objects.filter(scrapbook_name__startswith=SYNTHETIC_PREFIX)
+    bounds = synthetic.aggregate(first=Min('id'), last=Max('id'))
+    if bounds['first'] is None:
+        return []
+
+    # try twice as many ids as needed, since some might not be made up scrapbooks or have no media
+    id_range = range(bounds['first'], bounds['last'] + 1)
+    ids = rng.sample(id_range, min(2 * count, len(id_range)))
+    targets = []
+    for start in range(0, len(ids), 500):
+        first_media = (Media.objects.filter(scrapbook_id__in=ids[start:start + 500],
+                                            scrapbook__scrapbook_name__startswith=SYNTHETIC_PREFIX)
+                       .values('scrapbook__scrapbook_code').annotate(media_id=Min('id')).order_by())
+        targets += [(row['scrapbook__scrapbook_code'], row['media_id']) for row in first_media]
+    return targets[:count]
+
+
+class ClientSender():
+    '''
+    Sends requests with Django's test Client (one per worker thread)
+    Attributes:
+        client (Client): the test client
+    '''
+    def __init__(self):
+        self.client = Client(HTTP_HOST='localhost') # "testserver" isn't in ALLOWED_HOSTS
+
+    def send(self, method, path, data):
+        '''
+        :return: the status code
+        '''
+        if method == 'POST':
+            response = self.client.post(path, data)
+        else:
+            response = self.client.get(path)
+        if response.streaming:
+            for _ in response.streaming_content: # read pdfs like a browser would
+                pass
+        response.close()
+        return response.status_code
+
+    def close(self):
+        connections.close_all()
+
+
+class HttpSender():
+    '''
+    Sends requests to a running server over one kept-alive connection (one per worker thread)
+    Attributes:
+        url: the server's address split into parts
+        connection (HTTPConnection): the connection, or None until the first request
+        cookies (SimpleCookie): cookies the server set (the CSRF token)
+    '''
+    def __init__(self, url):
+        self.url = urlsplit(url)
+        self.connection = None
+        self.cookies = SimpleCookie()
+
+    def send(self, method, path, data):
+        '''
+        :return: the status code
+        '''
+        if method == 'POST' and 'csrftoken' not in self.cookies:
+            self.request('GET', '/', None) # the homepage sets the CSRF cookie
+        return self.request(method, path, data)
+
+    def request(self, method, path, data):
+        headers = {}
+        body = None
+        if self.cookies:
+            headers['Cookie'] = '; '.join(f'{name}={morsel.value}' for name, morsel in self.cookies.items())
+        if method == 'POST':
+            body = urlencode(data)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+            headers['X-CSRFToken'] = self.cookies['csrftoken'].value
+            headers['Referer'] = f'{self.url.scheme}://{self.url.netloc}/'
+
+        for attempt in range(2):
+            if self.connection is None:
+                connection_class = http.client.HTTPSConnection if self.url.scheme == 'https' else http.client.HTTPConnection
+                self.connection = connection_class(self.url.netloc, timeout=60)
+            try:
+                self.connection.request(method, path, body=body, headers=headers)
+                response = self.connection.getresponse()
+                response.read()
+                break
+            except (http.client.HTTPException, ConnectionError):
+                # the server closed the kept-alive connection, so connect again once
+                self.connection.close()
+                self.connection = None
+                if attempt:
+                    raise
+
+        for header in response.headers.get_all('Set-Cookie') or []:
+            self.cookies.load(header)
+        if response.will_close:
+            self.connection.close()
+            self.connection = None
+        return response.status
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+
+
+class Command(BaseCommand):
+    help = ('Sends a mix of requests to the scrapbooks made by seed_synthetic from many threads and reports the '
+            'throughput and latency of each route (python manage.py load_test --workers 16 --duration 60, '
+            'add --url http://127.0.0.1:8000 to test a running server, otherwise the database has to be migrated and '
+            'seeded first)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', help='address of a running server (otherwise the test Client is used)')
+        parser.add_argument('--workers', type=int, default=8, help='number of threads sending requests')
+        parser.add_argument('--requests', type=int, default=1000,
+                            help='total number of requests to send (ignored if --duration is given)')
+        parser.add_argument('--duration', type=float, help='seconds to send requests for')
+        parser.add_argument('--mix', default=DEFAULT_MIX,
+                            help=f'weights of the routes ({", ".join(ROUTES)}), default {DEFAULT_MIX}')
+        parser.add_argument('--profile', default='draft', help='export profile of the save route')
+        parser.add_argument('--targets', type=int, default=1000, help='number of made up scrapbooks to use')
+        parser.add_argument('--seed', type=int, default=0, help='seed for picking routes & scrapbooks')
+        parser.add_argument('--output', help='file to write the results to as json')
+
+    def handle(self, *args, **options):
+        routes, weights = parse_mix(options['mix'])
+        rng = random.Random(options['seed'])
+        targets = sample_targets(options['targets'], rng)
+        if not targets:
+            raise CommandError('there are no made up scrapbooks with media, run "python manage.py seed_synthetic" first')
+
+        lock = threading.Lock()
+        sent = 0 # requests started so far
+        results = [] # (route, seconds, status or error)
+        deadline = None
+
+        def take_request():
+            nonlocal sent
+            with lock:
+                if deadline is not None:
+                    return time.perf_counter() < deadline
+                if sent >= options['requests']:
+                    return False
+                sent += 1
+                return True
+
+        def work(worker_number):
+            worker_rng = random.Random(f'{options["seed"]}-{worker_number}')
+            sender = HttpSender(options['url']) if options['url'] else ClientSender()
+            worker_results = []
+            try:
+                while take_request():
+                    route = worker_rng.choices(routes, weights)[0]
+                    method, path, data = ROUTES[route](worker_rng.choice(targets), worker_rng, options['profile'])
+                    request_start = time.perf_counter()
+                    try:
+                        status = sender.send(method, path, data)
+                    except Exception as e:
+                        status = repr(e)
+                    worker_results.append((route, time.perf_counter() - request_start, status))
+            finally:
+                sender.close()
+                with lock:
+                    results.extend(worker_results)
+
+        threads = [threading.Thread(target=work, args=(n,)) for n in range(options['workers'])]
+        start = time.perf_counter()
+        if options['duration']:
+            deadline = start + options['duration']
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        report = self.report(results, elapsed, options)
+        if options['output']:
+            with open(options['output'], 'w') as output_file:
+                json.dump(report, output_file, indent=2)
+            self.stdout.write(f'results written to {options["output"]}')
+
+    def report(self, results, elapsed, options):
+        '''
+        Prints a table of the results
+        :param results: list of (route, seconds, status code or error)
+        :param elapsed: seconds the whole test took
+        :return: the results as a dictionary (for --output)
+        '''
+        report = {
+            'settings': {name: options[name] for name in ('url', 'workers', 'requests', 'duration', 'mix', 'profile')},
+            'seconds': elapsed,
+            'routes': {},
+        }
+        if not results:
+            # e.g. --requests 0, or a --duration shorter than the first request
+            self.stdout.write('no requests finished')
+            return report
+
+        by_route = {}
+        for route, seconds, status in results:
+            by_route.setdefault(route, []).append((seconds, status))
+        by_route['all'] = [(seconds, status) for route, seconds, status in results]
+
+        self.stdout.write(f'{"route":<16}{"requests":>9}{"errors":>8}{"req/s":>9}{"p50 ms":>9}{"p95 ms":>9}'
+                          f'{"p99 ms":>9}{"max ms":>9}')
+        errors_seen = {}
+        for route, route_results in by_route.items():
+            latencies = sorted(seconds for seconds, status in route_results)
+            errors = [status for seconds, status in route_results if not isinstance(status, int) or status >= 400]
+            if route != 'all':
+                for error in errors:
+                    errors_seen[f'{route}: {error}'] = errors_seen.get(f'{route}: {error}', 0) + 1
+            stats = {
+                'requests': len(route_results),
+                'errors': len(errors),
+                'per_second': len(route_results) / elapsed,
+                'p50_ms': percentile(latencies, 50) * 1000,
+                'p95_ms': percentile(latencies, 95) * 1000,
+                'p99_ms': percentile(latencies, 99) * 1000,
+                'max_ms': latencies[-1] * 1000,
+            }
+            report['routes'][route] = stats
+            self.stdout.write(f'{route:<16}{stats["requests"]:>9}{stats["errors"]:>8}{stats["per_second"]:>9.1f}'
+                              f'{stats["p50_ms"]:>9.1f}{stats["p95_ms"]:>9.1f}{stats["p99_ms"]:>9.1f}'
+                              f'{stats["max_ms"]:>9.1f}')
+        for error, count in sorted(errors_seen.items()):
+            self.stdout.write(f'  {count} x {error}')
+        return report
@@ -0,0 +1,88 @@
+'''
+Command to normalize images that were uploaded before ingest.py existed
+History:
+Oct 18 2026 - file creation
+Oct 18 2026 - changes the updated_at of the scrapbooks whose images are normalized (for export_scrapbooks)
+Oct 18 2026 - old images are recorded in OrphanedFile for collect_garbage instead of being deleted here
+'''
+
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from scrapbooks import pdf_cache
+from scrapbooks.derivatives import delete_derivatives
+from scrapbooks.ingest import normalize_image
+from scrapbooks.models import Media, OrphanedFile, Scrapbook
+from scrapbooks.thumbnails import delete_thumbnails
+
+
+class Command(BaseCommand):
+    help = ('Turns existing images the right way up, shrinks them and removes their metadata like new uploads. '
+            'The old files are deleted unless INGEST_ARCHIVE_ORIGINALS is True '
+            '(python manage.py normalize_media --dry-run to only see what would change)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help="report what would change without changing anything")
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        image_field = Media._meta.get_field('image')
+        original_field = Media._meta.get_field('original')
+        image_storage = image_field.storage
+        archive_storage = original_field.storage
+
+        changed = skipped = saved_bytes = 0
+        normalized_names = {} # old image name: new image name (images can be shared by several Media objects)
+        for media in Media.objects.select_related('scrapbook').exclude(image='').order_by('id').iterator():
+            old_name = media.image.name
+            if old_name not in normalized_names:
+                path = image_storage.path(old_name)
+                try:
+                    normalized = normalize_image(path, old_name)
+                except (OSError, ValueError):
+                    self.stdout.write(f'skipped (missing or not an image): {old_name}')
+                    skipped += 1
+                    continue
+                if normalized is None:
+                    continue
+
+                content, width, height = normalized
+                saved_bytes += os.path.getsize(path) - content.size
+                self.stdout.write(f'{old_name}: {os.path.getsize(path)} -> {content.size} bytes')
+                if dry_run:
+                    normalized_names[old_name] = (old_name, width, height, '')
+                    continue
+
+                original = ''
+                if settings.INGEST_ARCHIVE_ORIGINALS:
+                    with open(path, 'rb') as original_file:
+                        original_name = original_field.generate_filename(None, os.path.basename(old_name))
+                        original = archive_storage.save(original_name, original_file)
+                new_name = image_storage.save(image_field.generate_filename(None, content.name), content)
+                normalized_names[old_name] = (new_name, width, height, original)
+            elif dry_run:
+                continue
+
+            new_name, width, height, original = normalized_names[old_name]
+            Media.objects.filter(pk=media.pk).update(image=new_name, image_width=width, image_height=height,
+                                                     original=original or media.original.name)
+            delete_thumbnails(media.pk)
+            delete_derivatives(media.pk)
+            pdf_cache.invalidate(media.scrapbook)
+            Scrapbook.mark_updated(media.scrapbook_id) # .update() doesn't send post_save
+            changed += 1
+
+        # the old files aren't needed once nothing uses them ("python manage.py collect_garbage" deletes them)
+        if not dry_run:
+            OrphanedFile.objects.bulk_create([OrphanedFile(image=old_name) for old_name, (new_name, *_) in
+                                              normalized_names.items() if new_name != old_name])
+
+        summary = f'{len(normalized_names)} image(s) normalized, {skipped} skipped, {saved_bytes / (1024 * 1024):.1f} MB saved'
+        if dry_run:
+            summary = f'dry run: {summary} (nothing was changed)'
+        else:
+            summary = f'{summary}, {changed} media updated'
+        self.stdout.write(summary)
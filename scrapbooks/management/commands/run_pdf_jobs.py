@@ -0,0 +1,48 @@
+'''
+Command to run background pdf export jobs in their own process
+History:
+Oct 18 2026 - file creation
+'''
+
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from scrapbooks.jobs import WorkerPool, claim_next_job, recover_jobs, run_job
+
+
+class Command(BaseCommand):
+    help = 'Runs queued pdf export jobs (python manage.py run_pdf_jobs --workers 4)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=settings.PDF_JOB_WORKERS,
+                            help='number of jobs rendered at the same time')
+        parser.add_argument('--once', action='store_true',
+                            help='run the jobs that are queued now one at a time and then exit')
+
+    def handle(self, *args, **options):
+        recovered = recover_jobs()
+        if recovered:
+            self.stdout.write(f'put {recovered} interrupted job(s) back in the queue')
+
+        if options['once']:
+            count = 0
+            job = claim_next_job()
+            while job is not None:
+                run_job(job)
+                self.stdout.write(f'job {job.job_id}: {job.status}')
+                count += 1
+                job = claim_next_job()
+            self.stdout.write(f'ran {count} job(s)')
+            return
+
+        pool = WorkerPool(options['workers'], settings.PDF_JOB_POLL_INTERVAL)
+        pool.start()
+        self.stdout.write(f'running pdf jobs with {options["workers"]} worker(s), press CONTROL-C to stop')
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            self.stdout.write('stopping after the current jobs')
+            pool.stop()
@@ -0,0 +1,136 @@
+'''
+Command to fill the database with made up scrapbooks for load testing
+History:
+Oct 18 2026 - file creation
+Oct 18 2026 - says that it needs a migrated database
+Oct 18 2026 - --delete also deletes the cached pdf pages of the scrapbooks (see page_cache.py)
+
+Scrapbooks are inserted with bulk_create() a batch at a time, and their media share a small set
+of generated image files (the storage keeps one copy of identical files, see storage.py), so
+millions of rows only need a few MB of images. Every made up scrapbook's name starts with
+SYNTHETIC_PREFIX, which is how load_test finds them and "seed_synthetic --delete" removes them.
+The database has to be migrated first (python manage.py migrate).
+'''
+
+import random
+import time
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from PIL import Image
+
+from scrapbooks import garbage, page_cache, pdf_cache
+from scrapbooks.codes import generate_code
+from scrapbooks.models import Scrapbook, Media
+from scrapbooks.scrapbook_template_info import get_themes
+
+SYNTHETIC_PREFIX = 'Synthetic scrapbook'
+
+CAPTION_WORDS = ('beach', 'birthday', 'grandma', 'the', 'dog', 'at', 'our', 'first', 'trip', 'to', 'summer',
+                 'camp', 'with', 'friends', 'party', 'cake', 'wedding', 'snow', 'day', 'picnic', 'park', 'me')
+
+
+def synthetic_photo(number, width, height):
+    '''
+    :param number: which image this is (the same number always gives the same image)
+    :param width: width in pixels
+    :param height: height in pixels
+    :return: ContentFile of a jpeg
+    '''
+    rng = random.Random(number)
+    small = Image.frombytes('RGB', (16, 12), bytes(rng.randrange(256) for _ in range(16 * 12 * 3)))
+    output = BytesIO()
+    small.resize((width, height), Image.BICUBIC).save(output, format='JPEG', quality=80)
+    return ContentFile(output.getvalue(), name=f'synthetic{number}.jpg')
+
+
+class Command(BaseCommand):
+    help = ('Adds made up scrapbooks with media for load testing (python manage.py seed_synthetic --scrapbooks 100000 '
+            '--media 20), or removes them again with --delete (the database has to be migrated first)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scrapbooks', type=int, default=1000, help='number of scrapbooks to add')
+        parser.add_argument('--media', type=int, default=20,
+                            help='average number of media in a scrapbook (each gets between 0 and twice this)')
+        parser.add_argument('--files', type=int, default=50, help='number of different image files the media use')
+        parser.add_argument('--size', default='800x600', help='size of the image files in pixels (WIDTHxHEIGHT)')
+        parser.add_argument('--batch-size', type=int, default=500, help='scrapbooks inserted at a time')
+        parser.add_argument('--seed', type=int, default=0, help='seed for the random themes, captions & media counts')
+        parser.add_argument('--delete', action='store_true',
+                            help='delete the made up scrapbooks instead (then run collect_garbage for their files)')
+
+    def handle(self, *args, **options):
+        if options['delete']:
+            self.delete_synthetic()
+            return
+
+        try:
+            width, height = (int(n) for n in options['size'].lower().split('x'))
+        except ValueError:
+            raise CommandError('--size has to be WIDTHxHEIGHT, e.g. 800x600')
+        rng = random.Random(options['seed'])
+        theme_names = list(get_themes())
+        batch_size = options['batch_size']
+
+        # the image files (saved once, every media row just points at one of them)
+        image_field = Media._meta.get_field('image')
+        files = []
+        for number in range(max(1, options['files'])):
+            content = synthetic_photo(number, width, height)
+            files.append(image_field.storage.save(image_field.generate_filename(None, content.name), content))
+
+        taken_codes = set(Scrapbook.objects.values_list('scrapbook_code', flat=True))
+        first_number = Scrapbook.objects.filter(scrapbook_name__startswith=SYNTHETIC_PREFIX).count()
+        added_scrapbooks = added_media = 0
+        start = time.perf_counter()
+
+        while added_scrapbooks < options['scrapbooks']:
+            count = min(batch_size, options['scrapbooks'] - added_scrapbooks)
+            codes = []
+            while len(codes) < count:
+                code = generate_code()
+                if code not in taken_codes:
+                    taken_codes.add(code)
+                    codes.append(code)
+
+            with transaction.atomic():
+                Scrapbook.objects.bulk_create(
+                    Scrapbook(scrapbook_code=code, scrapbook_theme=rng.choice(theme_names),
+                              scrapbook_name=f'{SYNTHETIC_PREFIX} {first_number + added_scrapbooks + i}')
+                    for i, code in enumerate(codes))
+                # bulk_create() doesn't give back ids on every database, so look them up by code
+                scrapbook_ids = Scrapbook.objects.filter(scrapbook_code__in=codes).order_by('id').values_list('id', flat=True)
+
+                media = []
+                for scrapbook_id in scrapbook_ids:
+                    for _ in range(rng.randint(0, 2 * options['media'])):
+                        caption = ' '.join(rng.choice(CAPTION_WORDS) for _ in range(rng.randint(2, 8)))
+                        media.append(Media(scrapbook_id=scrapbook_id, image=rng.choice(files), caption=caption,
+                                           image_width=width, image_height=height))
+                Media.objects.bulk_create(media, batch_size=batch_size * 4)
+
+            added_scrapbooks += count
+            added_media += len(media)
+            elapsed = time.perf_counter() - start
+            self.stdout.write(f'{added_scrapbooks} scrapbooks, {added_media} media '
+                              f'({(added_scrapbooks + added_media) / elapsed:.0f} rows/s)')
+
+        self.stdout.write(f'added {added_scrapbooks} scrapbooks and {added_media} media using {len(files)} image '
+                          f'file(s) in {time.perf_counter() - start:.1f}s')
+
+    def delete_synthetic(self):
+        '''
+        Deletes every made up scrapbook (their files are left for collect_garbage like other deleted scrapbooks)
+        '''
+        deleted_scrapbooks = deleted_media = 0
+        ids = list(Scrapbook.objects.filter(scrapbook_name__startswith=SYNTHETIC_PREFIX).values_list('id', flat=True))
+        for start in range(0, len(ids), 500):
+            for scrapbook in Scrapbook.objects.filter(id__in=ids[start:start + 500]):
+                pdf_cache.invalidate(scrapbook, deleted=True)
+                page_cache.delete_pages(scrapbook)
+                deleted_media += garbage.delete_scrapbook(scrapbook)
+                deleted_scrapbooks += 1
+        self.stdout.write(f'deleted {deleted_scrapbooks} scrapbooks and {deleted_media} media '
+                          f'(run "python manage.py collect_garbage" to delete their files)')
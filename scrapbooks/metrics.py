@@ -0,0 +1,221 @@
+'''
+Timing requests and showing the totals to Prometheus
+History:
+Oct 18 2026 - file creation
+Oct 18 2026 - the middleware is marked as a coroutine function with asgiref's markcoroutinefunction()
+
+When METRICS_ENABLED is True, MetricsMiddleware records every request with timing.py: how long
+it took, its database queries (timed by database.py), the stages of uploads & pdf exports, and
+the size of the response. The times are sent back in a Server-Timing header (shown in the
+browser's developer tools) and added to totals for each url name, which /metrics shows in the
+Prometheus text format. The totals are kept in memory, so each server process has its own.
+When METRICS_ENABLED is False the middleware removes itself and /metrics is a 404.
+'''
+
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from scrapbooks import timing
+
+# upper bounds of the request duration histogram buckets, in seconds
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def escape_label(value):
+    '''
+    :param value: a Prometheus label value
+    :return: the value with backslashes, quotes & new lines escaped
+    '''
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def labels(**values):
+    '''
+    :return: Prometheus labels, e.g. {view="home",method="GET"}
+    '''
+    return '{' + ','.join(f'{name}="{escape_label(value)}"' for name, value in values.items()) + '}'
+
+
+class Histogram():
+    '''
+    Counts of values up to each of DURATION_BUCKETS
+    Attributes:
+        bucket_counts (list): number of values in each bucket (not cumulative, the last one is +Inf)
+        count (int): number of values
+        total (float): sum of the values
+    '''
+    def __init__(self):
+        self.bucket_counts = [0] * (len(DURATION_BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value):
+        '''
+        :param value: the value to add
+        '''
+        for i, bound in enumerate(DURATION_BUCKETS):
+            if value <= bound:
+                break
+        else:
+            i = len(DURATION_BUCKETS)
+        self.bucket_counts[i] += 1
+        self.count += 1
+        self.total += value
+
+
+class MetricsRegistry():
+    '''
+    Totals of all the requests recorded by MetricsMiddleware in this process
+    Attributes:
+        durations (dict): url name: Histogram of request durations
+        requests (dict): (url name, method, status code): number of requests
+        queries (dict): url name: number of database queries
+        query_seconds (dict): url name: time spent on database queries
+        response_bytes (dict): url name: bytes sent (not counting streamed responses without a Content-Length)
+        stage_seconds (dict): (url name, stage): time spent in the stage (see timing.py)
+    '''
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.durations = {}
+        self.requests = {}
+        self.queries = {}
+        self.query_seconds = {}
+        self.response_bytes = {}
+        self.stage_seconds = {}
+
+    def record(self, view, method, status, seconds, timings, size):
+        '''
+        Adds a request to the totals
+        :param view: url name of the request
+        :param method: HTTP method
+        :param status: status code of the response
+        :param seconds: time taken to make the response
+        :param timings: the StageTimings of the request
+        :param size: size of the response in bytes (None if it isn't known)
+        '''
+        with self.lock:
+            self.durations.setdefault(view, Histogram()).observe(seconds)
+            key = (view, method, status)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            self.queries[view] = self.queries.get(view, 0) + timings.counts.get(timing.SQL, 0)
+            self.query_seconds[view] = self.query_seconds.get(view, 0.0) + timings.seconds.get(timing.SQL, 0.0)
+            self.response_bytes[view] = self.response_bytes.get(view, 0) + (size or 0)
+            for stage, stage_seconds in timings.seconds.items():
+                if stage != timing.SQL:
+                    self.stage_seconds[(view, stage)] = self.stage_seconds.get((view, stage), 0.0) + stage_seconds
+
+    def render(self):
+        '''
+        :return: the totals in the Prometheus text format
+        '''
+        lines = []
+
+        def metric(name, metric_type, description):
+            lines.append(f'# HELP {name} {description}')
+            lines.append(f'# TYPE {name} {metric_type}')
+
+        with self.lock:
+            metric('scrapbook_request_duration_seconds', 'histogram', 'Time taken to make responses')
+            for view, histogram in sorted(self.durations.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(DURATION_BUCKETS + ('+Inf',), histogram.bucket_counts):
+                    cumulative += bucket_count
+                    lines.append(f'scrapbook_request_duration_seconds_bucket{labels(view=view, le=bound)} {cumulative}')
+                lines.append(f'scrapbook_request_duration_seconds_sum{labels(view=view)} {histogram.total}')
+                lines.append(f'scrapbook_request_duration_seconds_count{labels(view=view)} {histogram.count}')
+
+            metric('scrapbook_requests_total', 'counter', 'Requests by url name, method and status code')
+            for (view, method, status), count in sorted(self.requests.items()):
+                lines.append(f'scrapbook_requests_total{labels(view=view, method=method, status=status)} {count}')
+
+            metric('scrapbook_db_queries_total', 'counter', 'Database queries made while responding')
+            for view, count in sorted(self.queries.items()):
+                lines.append(f'scrapbook_db_queries_total{labels(view=view)} {count}')
+
+            metric('scrapbook_db_query_seconds_total', 'counter', 'Time spent on database queries')
+            for view, seconds in sorted(self.query_seconds.items()):
+                lines.append(f'scrapbook_db_query_seconds_total{labels(view=view)} {seconds}')
+
+            metric('scrapbook_response_bytes_total', 'counter', 'Bytes sent in responses')
+            for view, size in sorted(self.response_bytes.items()):
+                lines.append(f'scrapbook_response_bytes_total{labels(view=view)} {size}')
+
+            metric('scrapbook_stage_seconds_total', 'counter',
+                   'Time spent decoding, rotating, resizing & encoding images, drawing & saving pdfs and storing uploads')
+            for (view, stage), seconds in sorted(self.stage_seconds.items()):
+                lines.append(f'scrapbook_stage_seconds_total{labels(view=view, stage=stage)} {seconds}')
+
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+
+def server_timing(timings, seconds):
+    '''
+    :param timings: the StageTimings of a request
+    :param seconds: time taken to make the response
+    :return: value of the Server-Timing header
+    '''
+    entries = []
+    for stage, stage_seconds in timings.seconds.items():
+        entry = f'{stage};dur={stage_seconds * 1000:.1f}'
+        if stage == timing.SQL:
+            entry += f';desc="{timings.counts[stage]} queries"'
+        entries.append(entry)
+    entries.append(f'total;dur={seconds * 1000:.1f}')
+    return ', '.join(entries)
+
+def response_size(response):
+    '''
+    :param response: an HttpResponse
+    :return: size of the response body in bytes, or None for a streamed response without a Content-Length
+    '''
+    if not response.streaming:
+        return len(response.content)
+    if response.has_header('Content-Length'):
+        return int(response['Content-Length'])
+    return None
+
+
+class MetricsMiddleware():
+    '''
+    Records how long each request takes (see the top of this file). Works with sync and async views.
+    '''
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self) # so Django awaits __call__
+
+    def __call__(self, request):
+        if iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        with timing.recording() as timings:
+            start = time.perf_counter()
+            response = self.get_response(request)
+            self.finish(request, response, timings, time.perf_counter() - start)
+        return response
+
+    async def __acall__(self, request):
+        with timing.recording() as timings:
+            start = time.perf_counter()
+            response = await self.get_response(request)
+            self.finish(request, response, timings, time.perf_counter() - start)
+        return response
+
+    def finish(self, request, response, timings, seconds):
+        '''
+        Adds the Server-Timing header and records the request
+        '''
+        response['Server-Timing'] = server_timing(timings, seconds)
+        match = request.resolver_match
+        view = match.view_name if match is not None else 'unmatched'
+        registry.record(view, request.method, response.status_code, seconds, timings, response_size(response))
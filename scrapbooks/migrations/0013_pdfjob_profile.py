@@ -0,0 +1,18 @@
+# Generated by Django 3.2.23 on 2026-10-18 08:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scrapbooks', '0012_pdfjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pdfjob',
+            name='profile',
+            field=models.CharField(default='print', max_length=20),
+        ),
+    ]
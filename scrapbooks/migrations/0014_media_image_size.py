@@ -0,0 +1,40 @@
+# Generated by Django 3.2.23 on 2026-10-18 09:04
+
+from django.db import migrations, models
+
+
+def set_image_sizes(apps, schema_editor):
+    '''
+    Saves the size of images that were uploaded before Media.image_width & Media.image_height existed
+    '''
+    from scrapbooks.thumbnails import image_dimensions
+
+    Media = apps.get_model('scrapbooks', 'Media')
+    for media in Media.objects.filter(image_width__isnull=True).exclude(image=''):
+        try:
+            with media.image.open('rb'):
+                media.image_width, media.image_height = image_dimensions(media.image)
+        except (OSError, ValueError):
+            continue # the file is missing or isn't an image
+        media.save(update_fields=['image_width', 'image_height'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scrapbooks', '0013_pdfjob_profile'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='media',
+            name='image_height',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='media',
+            name='image_width',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(set_image_sizes, migrations.RunPython.noop),
+    ]
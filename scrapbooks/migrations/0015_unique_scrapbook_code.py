@@ -0,0 +1,38 @@
+# Generated by Django 3.2.23 on 2026-10-18 09:05
+
+import uuid
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def recode_duplicates(apps, schema_editor):
+    '''
+    Gives new codes to scrapbooks that share a code with an older scrapbook, so the unique index can be made
+    (those codes couldn't be opened anyway, since Scrapbook.objects.get() found more than one scrapbook)
+    '''
+    Scrapbook = apps.get_model('scrapbooks', 'Scrapbook')
+    duplicates = Scrapbook.objects.values('scrapbook_code').annotate(n=Count('id')).filter(n__gt=1)
+    for duplicate in duplicates:
+        for scrapbook in Scrapbook.objects.filter(scrapbook_code=duplicate['scrapbook_code']).order_by('id')[1:]:
+            code = uuid.uuid4().hex[:6].upper()
+            while Scrapbook.objects.filter(scrapbook_code=code).exists():
+                code = uuid.uuid4().hex[:6].upper()
+            scrapbook.scrapbook_code = code
+            scrapbook.save(update_fields=['scrapbook_code'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scrapbooks', '0014_media_image_size'),
+    ]
+
+    operations = [
+        migrations.RunPython(recode_duplicates, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='scrapbook',
+            name='scrapbook_code',
+            field=models.CharField(max_length=6, unique=True),
+        ),
+    ]
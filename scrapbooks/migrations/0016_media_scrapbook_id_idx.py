@@ -0,0 +1,17 @@
+# Generated by Django 3.2.23 on 2026-10-18 09:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scrapbooks', '0015_unique_scrapbook_code'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='media',
+            index=models.Index(fields=['scrapbook', 'id'], name='media_scrapbook_id_idx'),
+        ),
+    ]
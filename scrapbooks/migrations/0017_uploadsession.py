@@ -0,0 +1,29 @@
+# Generated by Django 3.2.23 on 2026-10-18 09:09
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scrapbooks', '0016_media_scrapbook_id_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadSession',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('upload_id', models.UUIDField(default=uuid.uuid4, editable=False, unique=True)),
+                ('file_name', models.CharField(max_length=255)),
+                ('caption', models.CharField(blank=True, max_length=400)),
+                ('size', models.PositiveBigIntegerField()),
+                ('received', models.PositiveBigIntegerField(default=0)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('updated', models.DateTimeField(auto_now=True, db_index=True)),
+                ('scrapbook', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='scrapbooks.scrapbook')),
+            ],
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 3.2.23 on 2026-10-18 09:10
+
+from django.db import migrations, models
+import scrapbooks.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scrapbooks', '0017_uploadsession'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='media',
+            name='image',
+            field=models.ImageField(db_index=True, storage=scrapbooks.storage.ContentAddressedStorage(), upload_to='images/'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 3.2.23 on 2026-10-18 09:13
+
+from django.db import migrations, models
+import scrapbooks.ingest
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scrapbooks', '0019_orphanedfile'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='media',
+            name='original',
+            field=models.FileField(blank=True, db_index=True, editable=False, storage=scrapbooks.ingest.get_archive_storage, upload_to='originals/'),
+        ),
+        migrations.AddField(
+            model_name='orphanedfile',
+            name='original',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+    ]
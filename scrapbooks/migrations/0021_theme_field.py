@@ -0,0 +1,19 @@
+# Generated by Django 3.2.23 on 2026-10-18 10:13
+
+from django.db import migrations
+import scrapbooks.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scrapbooks', '0020_media_original'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='scrapbook',
+            name='scrapbook_theme',
+            field=scrapbooks.models.ThemeField(default='template1', max_length=100),
+        ),
+    ]
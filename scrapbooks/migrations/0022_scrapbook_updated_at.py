@@ -0,0 +1,20 @@
+# Generated by Django 3.2.23 on 2026-10-18 11:02
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scrapbooks', '0021_theme_field'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scrapbook',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+    ]
@@ -10,13 +10,49 @@ Apr 14 2024 - updated scrapbook theme names
 Apr 16 2024 - changed character limit for Scrapbook.scrapbook_name and Media.caption
 Apr 17 2024 - removed default image for Media
 May 20 2024 - added auto-delete for Media image files
+Oct 18 2026 - cached pdf derivatives are deleted with their Media object or when the scrapbook theme changes
+Oct 18 2026 - added PdfJob for rendering pdfs in the background
+Oct 18 2026 - added PdfJob.profile
+Oct 18 2026 - added Media.image_width & Media.image_height and thumbnails for Media images
+Oct 18 2026 - Scrapbook.scrapbook_code is unique, added Scrapbook.create_scrapbook() which retries when a code is taken
+Oct 18 2026 - added an index on Media (scrapbook, id) for paging through a scrapbook's media
+Oct 18 2026 - added UploadSession for resumable uploads
+Oct 18 2026 - Media images are stored by content hash (see storage.py), image files are only deleted with their last Media object
+Oct 18 2026 - added OrphanedFile for deleting files after their scrapbook is deleted (see garbage.py)
+Oct 18 2026 - new images are normalized before they are saved (see ingest.py), added Media.original & OrphanedFile.original
+Oct 18 2026 - THEME_CHOICES comes from the theme files (see scrapbook_template_info.py), added ThemeField
+Oct 18 2026 - added Scrapbook.updated_at, which also changes when the scrapbook's media do (see mark_updated())
+Oct 18 2026 - image files of deleted Media objects are recorded in OrphanedFile instead of being deleted straight away
+Oct 18 2026 - thumbnail urls include the image name's hash, so they change when the image is replaced
 '''
-import os
 
-from django.db import models
+from django.db import models, transaction, IntegrityError
 import uuid
 
 from django.dispatch import receiver
+from django.utils import timezone
+
+from .codes import generate_code, forget_missing_code
+from .derivatives import delete_derivatives, image_key
+from .storage import content_addressed_storage
+from .thumbnails import THUMBNAIL_WIDTHS, delete_thumbnails, image_dimensions
+from .ingest import get_archive_storage, ingest_media
+from .scrapbook_template_info import theme_choices
+
+
+class ThemeField(models.CharField):
+    '''
+    A CharField whose choices are the themes. The choices are left out of migrations, since a theme
+    is added by adding a theme file (see scrapbook_template_info.py), not by changing the database.
+    '''
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('choices', theme_choices())
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        kwargs.pop('choices', None)
+        return name, path, args, kwargs
 
 
 class Scrapbook(models.Model):
@@ -26,16 +62,15 @@ class Scrapbook(models.Model):
         :param scrapbook_code: a unique code to identify each scrapbook
         :param scrapbook_name: the title of the scrapbook
         :param scrapbook_theme: the theme layout
+        :param updated_at: when the scrapbook or its media last changed (for exporting changed scrapbooks)
     '''
-    scrapbook_code = models.CharField(max_length=6) # the code entered to access the scrapbook
+    scrapbook_code = models.CharField(max_length=6, unique=True) # the code entered to access the scrapbook
     scrapbook_name = models.CharField(max_length=100)
 
-    THEME_CHOICES = (
-        ('template1', 'Blue Flowers'),
-        ('template2', 'Pink Stars')
-    )
+    THEME_CHOICES = theme_choices() # ((theme name, label), ...)
 
-    scrapbook_theme = models.CharField(max_length=100, default='template1', choices=THEME_CHOICES)
+    scrapbook_theme = ThemeField(max_length=100, default='template1', choices=THEME_CHOICES)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     def __str__(self):
         return self.scrapbook_code
@@ -43,12 +78,43 @@ class Scrapbook(models.Model):
     @classmethod
     def new_scrapbook(cls, name='Untitled Scrapbook', theme='template1'):
         '''
-        Creates a new scrapbook project and generates a unique scrapbook code
+        Creates a new scrapbook project and generates a random scrapbook code (not saved, and the code
+        might be taken; create_scrapbook() saves it with a code that isn't)
+        :param name: the name of the scrapbook
+        :param theme: the theme of the scrapbook
+        :return: Scrapbook
+        '''
+        return cls(scrapbook_code=generate_code(), scrapbook_name=name, scrapbook_theme=theme)
+
+    @classmethod
+    def mark_updated(cls, scrapbook_id):
+        '''
+        Sets updated_at of a scrapbook to now without saving anything else (used when its media change)
+        :param scrapbook_id: primary key of the scrapbook
+        '''
+        cls.objects.filter(pk=scrapbook_id).update(updated_at=timezone.now())
+
+    MAX_CODE_ATTEMPTS = 10 # codes tried before giving up (only matters once most codes are taken)
+
+    @classmethod
+    def create_scrapbook(cls, name='Untitled Scrapbook', theme='template1'):
+        '''
+        Creates and saves a new scrapbook project, trying new codes until one isn't taken
+        (the unique index decides, so two scrapbooks created at the same time can't get the same code)
         :param name: the name of the scrapbook
         :param theme: the theme of the scrapbook
         :return: Scrapbook
         '''
-        return cls(scrapbook_code=uuid.uuid4().hex[:6].upper(), scrapbook_name=name, scrapbook_theme=theme)
+        for attempt in range(cls.MAX_CODE_ATTEMPTS):
+            scrapbook = cls.new_scrapbook(name, theme)
+            try:
+                with transaction.atomic():
+                    scrapbook.save(force_insert=True)
+            except IntegrityError:
+                if attempt == cls.MAX_CODE_ATTEMPTS - 1:
+                    raise
+            else:
+                return scrapbook
 
 class Media(models.Model):
     '''
@@ -56,19 +122,207 @@ class Media(models.Model):
     :param scrapbook: the key of the Scrapbook object the Media object belongs to
     :param caption: the caption of the photo
     :param image: the photo
+    :param image_width: width of the photo as it is displayed (set when it is saved)
+    :param image_height: height of the photo as it is displayed (set when it is saved)
+    :param original: the file that was uploaded, if it was changed by ingest.py and INGEST_ARCHIVE_ORIGINALS is True
     '''
     scrapbook = models.ForeignKey(Scrapbook, on_delete=models.CASCADE) # each Media object is related to a single Scrapbook
     caption = models.CharField(max_length=400)
-    image = models.ImageField(upload_to='images/')
+    image = models.ImageField(upload_to='images/', storage=content_addressed_storage, db_index=True) # files can be shared by several Media objects
+    image_width = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    image_height = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    original = models.FileField(upload_to='originals/', storage=get_archive_storage, blank=True, db_index=True, editable=False)
+
+    class Meta:
+        indexes = [
+            # pages of a scrapbook's media are found by id (see views.media_page())
+            models.Index(fields=['scrapbook', 'id'], name='media_scrapbook_id_idx')
+        ]
+
+    def thumbnail_url(self, width=THUMBNAIL_WIDTHS[0]):
+        '''
+        :param width: one of thumbnails.THUMBNAIL_WIDTHS
+        :return: url of the thumbnail of the photo (jpeg or webp, depending on the browser)
+        '''
+        return f'/Scrapbook_project/{self.scrapbook.scrapbook_code}/{self.id}/thumbnail/{width}/?v={self.thumbnail_version}'
+
+    @property
+    def thumbnail_version(self):
+        '''
+        :return: part of the hash of the image's name, which changes when the image is replaced (e.g. by normalize_media)
+        '''
+        return image_key(self.image.name)[:12]
+
+    @property
+    def thumbnail_srcset(self):
+        '''
+        :return: srcset attribute for an <img>, so the browser can pick the thumbnail size it needs
+        '''
+        return ', '.join(f'{self.thumbnail_url(width)} {width}w' for width in THUMBNAIL_WIDTHS)
+
+    def thumbnail_height(self, width=THUMBNAIL_WIDTHS[0]):
+        '''
+        :param width: width the photo is displayed at
+        :return: height the photo is displayed at, or None if the size of the photo isn't known
+        '''
+        if not self.image_width or not self.image_height:
+            return None
+        return max(1, round(self.image_height * width / self.image_width))
+
+class PdfJob(models.Model):
+    '''
+    A class to represent a pdf export that is rendered in the background (see jobs.py)
+    :param job_id: the id given to the user to check on the job
+    :param scrapbook: the Scrapbook object being exported
+    :param status: queued, running, done or failed
+    :param revision: revision of the scrapbook that was rendered (see pdf_cache.py)
+    :param profile: name of the ExportProfile used (see export_profiles.py)
+    :param pdf_path: file path of the finished pdf
+    :param error: what went wrong if the job failed
+    :param worker: host and process id of the worker running the job
+    '''
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+
+    STATUS_CHOICES = (
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed')
+    )
+
+    job_id = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    scrapbook = models.ForeignKey(Scrapbook, on_delete=models.CASCADE)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED, db_index=True)
+    revision = models.CharField(max_length=64, blank=True)
+    profile = models.CharField(max_length=20, default='print')
+    pdf_path = models.CharField(max_length=500, blank=True)
+    error = models.TextField(blank=True)
+    worker = models.CharField(max_length=100, blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'{self.job_id} ({self.status})'
+
+class UploadSession(models.Model):
+    '''
+    A class to represent an image being uploaded in chunks (see chunked_uploads.py)
+    :param upload_id: the id given to the user to send the chunks with
+    :param scrapbook: the Scrapbook object the image is for
+    :param file_name: name of the file being uploaded
+    :param caption: caption for the Media object made when the upload is finished
+    :param size: total size of the file in bytes
+    :param received: number of bytes received so far (where the next chunk starts)
+    '''
+    upload_id = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    scrapbook = models.ForeignKey(Scrapbook, on_delete=models.CASCADE)
+    file_name = models.CharField(max_length=255)
+    caption = models.CharField(max_length=400, blank=True)
+    size = models.PositiveBigIntegerField()
+    received = models.PositiveBigIntegerField(default=0)
+    created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True, db_index=True)
+
+    def __str__(self):
+        return f'{self.upload_id} ({self.received}/{self.size})'
+
+class OrphanedFile(models.Model):
+    '''
+    A class to represent files that might not be needed any more, which are deleted later by
+    "python manage.py collect_garbage" (see garbage.py)
+    :param image: name of an image in the Media storage (blank if there is only cached files to delete)
+    :param media_id: id of the deleted Media object whose thumbnails & pdf derivatives should be deleted (or None)
+    :param original: name of an archived original image (see ingest.py)
+    '''
+    image = models.CharField(max_length=100, blank=True)
+    original = models.CharField(max_length=100, blank=True)
+    media_id = models.BigIntegerField(null=True, blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.image or f'files of media {self.media_id}'
 
 # from https://stackoverflow.com/questions/16041232/django-delete-filefield
 @receiver(models.signals.post_delete, sender=Media)
 def auto_delete_file_on_delete(sender, instance, **kwargs):
     """
-    Deletes file from filesystem when corresponding Media object is deleted.
+    Records the files of a Media object that was deleted in OrphanedFile (unless another Media object
+    has the same image), so "python manage.py collect_garbage" deletes them once no new upload is
+    using them either (see storage.py).
+    """
+
+    image = instance.image.name if instance.image and not Media.objects.filter(image=instance.image.name).exists() else ''
+    original = ''
+    if instance.original and not Media.objects.filter(original=instance.original.name).exists():
+        original = instance.original.name
+    if image or original:
+        OrphanedFile.objects.create(image=image, original=original)
+
+    delete_derivatives(instance.id)
+    delete_thumbnails(instance.id)
+
+@receiver(models.signals.post_save, sender=Media)
+@receiver(models.signals.post_delete, sender=Media)
+def mark_scrapbook_updated(sender, instance, **kwargs):
+    """
+    Changes the updated_at of a Media object's scrapbook when the Media object is added, changed or deleted.
+    """
+
+    Scrapbook.mark_updated(instance.scrapbook_id)
+
+@receiver(models.signals.pre_save, sender=Media)
+def ingest_new_image(sender, instance, **kwargs):
+    """
+    Normalizes a new image and saves its size (see ingest.py), or saves the size of an
+    existing image that doesn't have one yet.
+    """
+
+    if not instance.image or getattr(instance, '_ingested', False):
+        return
+
+    if not instance.image._committed:
+        ingest_media(instance)
+    elif not instance.image_width:
+        try:
+            instance.image.open('rb')
+            instance.image_width, instance.image_height = image_dimensions(instance.image)
+        except (OSError, ValueError):
+            instance.image_width = instance.image_height = None
+        finally:
+            instance.image.close()
+
+@receiver(models.signals.post_save, sender=Scrapbook)
+def forget_missing_code_on_create(sender, instance, created, **kwargs):
+    """
+    Makes sure a new scrapbook's code isn't still remembered as not existing by code_exists().
+    """
+
+    if created:
+        forget_missing_code(instance.scrapbook_code)
+
+@receiver(models.signals.pre_save, sender=Scrapbook)
+def delete_derivatives_on_theme_change(sender, instance, **kwargs):
+    """
+    Deletes the cached pdf derivatives of a scrapbook's media when its theme is changed,
+    since they were rotated and resized for the boxes of the old theme.
+    """
+
+    if instance.pk is None:
+        return
+
+    old_theme = Scrapbook.objects.filter(pk=instance.pk).values_list('scrapbook_theme', flat=True).first()
+    if old_theme is not None and old_theme != instance.scrapbook_theme:
+        for media_id in instance.media_set.values_list('id', flat=True):
+            delete_derivatives(media_id)
+
+@receiver(models.signals.post_delete, sender=UploadSession)
+def delete_partial_upload(sender, instance, **kwargs):
+    """
+    Deletes the partly uploaded file of an UploadSession that is finished, expired or whose scrapbook was deleted.
     """
 
-    if instance.image:
-        if os.path.isfile(instance.image.path):
-            print(f'deleting {instance.image.path}')
-            os.remove(instance.image.path)
+    from .chunked_uploads import discard_partial_file
+    discard_partial_file(instance)
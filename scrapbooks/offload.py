@@ -0,0 +1,69 @@
+'''
+Running blocking work from async views
+History:
+Oct 18 2026 - file creation
+
+Async views can't use the ORM, and drawing a pdf or resizing images would stop the event loop
+from doing anything else, so views hand that work to a thread pool with run(). There are two
+pools: PAGES (ASYNC_PAGE_THREADS threads) for loading pages and EXPORTS (ASYNC_EXPORT_THREADS
+threads) for drawing pdfs, so however many exports are running there are still threads free to
+serve pages. Each thread keeps its own database connection, which is closed after CONN_MAX_AGE
+like the connections of request threads.
+'''
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+PAGES = 'pages'
+EXPORTS = 'exports'
+
+_executors = {} # pool name: ThreadPoolExecutor
+_executors_lock = threading.Lock()
+
+
+def get_executor(pool):
+    '''
+    :param pool: PAGES or EXPORTS
+    :return: the ThreadPoolExecutor for the pool (made the first time it is needed)
+    '''
+    with _executors_lock:
+        if pool not in _executors:
+            threads = settings.ASYNC_PAGE_THREADS if pool == PAGES else settings.ASYNC_EXPORT_THREADS
+            _executors[pool] = ThreadPoolExecutor(max_workers=threads, thread_name_prefix=f'scrapbook-{pool}')
+        return _executors[pool]
+
+def shutdown():
+    '''
+    Stops the pools after the work they were given is finished (they start again when they are next needed),
+    which also closes their threads' database connections
+    '''
+    with _executors_lock:
+        executors = list(_executors.values())
+        _executors.clear()
+    for executor in executors:
+        executor.shutdown(wait=True)
+
+def call_with_connection(func, *args, **kwargs):
+    '''
+    Calls a function in a pool thread, closing the thread's database connection before and after if it
+    is broken or older than CONN_MAX_AGE (what Django does at the start and end of a request)
+    '''
+    close_old_connections()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        close_old_connections()
+
+async def run(pool, func, *args, **kwargs):
+    '''
+    Runs a blocking function in one of the pools without holding up the event loop
+    :param pool: PAGES or EXPORTS
+    :param func: the function (it can use the ORM)
+    :return: what the function returned (exceptions it raises, like Http404, are raised here)
+    '''
+    return await sync_to_async(call_with_connection, thread_sensitive=False,
+                               executor=get_executor(pool))(func, *args, **kwargs)
@@ -0,0 +1,180 @@
+'''
+Cache of drawn pdf pages, so an export only draws the pages that changed
+History:
+Oct 18 2026 - file creation
+Oct 18 2026 - pages are saved as the single page pdfs render_scrapbook_pdf() joins (see pdf_join.py)
+              instead of pickled reportlab objects
+
+Each page of a scrapbook pdf is drawn as a pdf of its own (see draw_part() in pdf_export.py), which
+only depends on the page's media (ids, images & captions), the theme, the export profile and which
+page it is. After a page is drawn it is saved in SCRAPBOOK_CACHE_ROOT/pages/<scrapbook id>/<page_key()>.pdf
+and the next export of the scrapbook joins the saved page instead of drawing it again, e.g. adding a
+photo only draws the last page. The background & title are saved the same way (see chrome_key()).
+reportlab draws the pages without dates or random ids, so a saved page is exactly the pdf drawing it
+again would give, and the joined pdf is the same either way.
+The cache is kept under PDF_PAGE_CACHE_MAX_BYTES by deleting the least recently used pages.
+'''
+
+import hashlib
+import os
+import tempfile
+from pathlib import Path
+
+import reportlab
+from django.conf import settings
+
+from scrapbooks.pdf_cache import PDF_CACHE_VERSION
+
+PAGE_CACHE_VERSION = 2 # change this when the saved pages change so old ones aren't reused
+
+
+def page_cache_root():
+    '''
+    :return: the folder where all cached pages are stored
+    '''
+    return Path(settings.SCRAPBOOK_CACHE_ROOT) / 'pages'
+
+def scrapbook_pages_dir(scrapbook):
+    '''
+    :param scrapbook: a Scrapbook object
+    :return: the folder where the cached pages of that scrapbook are stored
+    '''
+    return page_cache_root() / str(scrapbook.pk)
+
+def _digest(theme, profile, *values):
+    '''
+    :param theme: the Theme object
+    :param profile: the ExportProfile
+    :param values: anything else the page depends on
+    :return: hex digest of the code versions, theme, profile & values
+    '''
+    digest = hashlib.sha256()
+    digest.update(f'{PAGE_CACHE_VERSION}\0{PDF_CACHE_VERSION}\0{reportlab.Version}\0{settings.PDF_VECTOR_ROTATION}\0'
+                  f'{theme.name}\0{theme.digest}\0{profile.name}\0{profile.dpi}\0{profile.encoding}\0'
+                  f'{profile.jpeg_quality}\0'.encode())
+    for value in values:
+        digest.update(f'{value}\0'.encode())
+    return digest.hexdigest()
+
+def page_key(theme, profile, page_number, page_slots):
+    '''
+    :param theme: the Theme object
+    :param profile: the ExportProfile
+    :param page_number: index of the page in the pdf
+    :param page_slots: list of (index of the Slot in the theme's slots, Media object) on the page (see Theme.paginate())
+    :return: hex digest of everything that is drawn on the page
+    '''
+    # images are stored under the hash of their contents (see storage.py), so the name changes with the picture
+    return _digest(theme, profile, 'page', page_number,
+                   *(value for slot, m in page_slots for value in (slot, m.id, m.image.name, m.caption)))
+
+def chrome_key(theme, profile, scrapbook_name):
+    '''
+    :param theme: the Theme object
+    :param profile: the ExportProfile
+    :param scrapbook_name: title of the scrapbook
+    :return: hex digest of everything in the background & title
+    '''
+    return _digest(theme, profile, 'chrome', scrapbook_name)
+
+def page_path(scrapbook, key):
+    '''
+    :param scrapbook: a Scrapbook object
+    :param key: the page_key() or chrome_key()
+    :return: file path of the cached page
+    '''
+    return scrapbook_pages_dir(scrapbook) / f'{key}.pdf'
+
+def is_cached(scrapbook, key):
+    '''
+    :param scrapbook: a Scrapbook object
+    :param key: the page_key() or chrome_key()
+    :return: whether the page is cached (it can still be evicted before load_page() reads it)
+    '''
+    return page_path(scrapbook, key).is_file()
+
+def load_page(scrapbook, key):
+    '''
+    Gets a cached page and marks it as recently used
+    :param scrapbook: a Scrapbook object
+    :param key: the page_key() or chrome_key()
+    :return: bytes of the page's pdf, or None if it isn't cached
+    '''
+    path = page_path(scrapbook, key)
+    try:
+        page = path.read_bytes()
+        os.utime(path) # modification time is used as the "last used" time for eviction
+    except FileNotFoundError:
+        return None
+    return page
+
+def store_page(scrapbook, key, page):
+    '''
+    Saves a drawn page
+    :param scrapbook: a Scrapbook object
+    :param key: the page_key() or chrome_key()
+    :param page: bytes of the page's pdf
+    '''
+    folder = scrapbook_pages_dir(scrapbook)
+    folder.mkdir(parents=True, exist_ok=True)
+
+    # write to a temporary file first so a half-written page is never joined (next to the scrapbook
+    # folders, so delete_pages() doesn't see it)
+    fd, tmp_path = tempfile.mkstemp(dir=page_cache_root(), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as tmp_file:
+            tmp_file.write(page)
+        try:
+            os.replace(tmp_path, page_path(scrapbook, key))
+        except FileNotFoundError: # the scrapbook's folder was removed while the page was drawn
+            folder.mkdir(parents=True, exist_ok=True)
+            os.replace(tmp_path, page_path(scrapbook, key))
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+def evict(keep=()):
+    '''
+    Deletes the least recently used pages until the cache is smaller than PDF_PAGE_CACHE_MAX_BYTES
+    :param keep: paths of pages that should not be deleted (the ones the last export used)
+    '''
+    max_bytes = settings.PDF_PAGE_CACHE_MAX_BYTES
+
+    entries = []
+    total = 0
+    for path in page_cache_root().glob('*/*.pdf'):
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+        total += stat.st_size
+
+    # oldest first
+    for mtime, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        if path in keep:
+            continue
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            pass
+        total -= size
+
+def delete_pages(scrapbook):
+    '''
+    Deletes every cached page of a scrapbook (used when it is deleted, edits only change some pages).
+    Only pages are deleted, one at a time, so pages being stored at the same time aren't lost.
+    :param scrapbook: a Scrapbook object
+    '''
+    folder = scrapbook_pages_dir(scrapbook)
+    for path in folder.glob('*.pdf'):
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            pass
+    try:
+        folder.rmdir()
+    except OSError: # it doesn't exist, or a page was stored in it just now (which eviction deletes later)
+        pass
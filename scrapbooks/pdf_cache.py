@@ -0,0 +1,159 @@
+'''
+Cache of exported scrapbook pdfs
+History:
+Oct 18 2026 - file creation
+Oct 18 2026 - pdfs are cached separately for each export profile
+Oct 18 2026 - version 2, image & page data isn't ascii85 encoded any more
+Oct 18 2026 - version 3, tilted images can be rotated in the pdf, the revision includes PDF_VECTOR_ROTATION
+Oct 18 2026 - the revision includes the digest of the theme file, so editing a theme makes new pdfs
+Oct 18 2026 - the revision includes the image names, so replacing an image (normalize_media) makes new pdfs
+Oct 18 2026 - version 4, pdfs are saved by canvas.save() and rotated images for jpeg profiles are pngs
+Oct 18 2026 - invalidate() only deletes pdfs of other revisions, one file at a time, and store_pdf()
+              writes its temporary file outside the scrapbook's folder and makes the folder again if
+              it was removed while the pdf was rendered
+Oct 18 2026 - version 5, images for jpeg profiles are always rotated in the pdf
+Oct 18 2026 - version 6, pages are drawn as pdfs of their own and joined (see pdf_join.py)
+
+A rendered pdf is saved under the scrapbook's revision, which is a hash of everything that
+shows up in the pdf (name, theme & its file, media ids, images and captions), and the name of the export profile.
+If the revision hasn't changed, the saved pdf is sent again instead of drawing a new one. The cache is kept under
+PDF_CACHE_MAX_BYTES by deleting the least recently used pdfs. When a scrapbook is edited, invalidate() deletes
+its pdfs of older revisions (a pdf of an older revision that is stored afterwards is never sent, because the
+revision has changed, and is left for eviction).
+'''
+
+import hashlib
+import os
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+
+from scrapbooks.scrapbook_template_info import get_themes
+
+PDF_CACHE_VERSION = 6 # change this when the pdf layout code changes so old pdfs aren't reused
+
+
+def pdf_cache_root():
+    '''
+    :return: the folder where all cached pdfs are stored
+    '''
+    return Path(settings.SCRAPBOOK_CACHE_ROOT) / 'pdf'
+
+def scrapbook_cache_dir(scrapbook):
+    '''
+    :param scrapbook: a Scrapbook object
+    :return: the folder where the cached pdfs of that scrapbook are stored
+    '''
+    return pdf_cache_root() / str(scrapbook.pk)
+
+def scrapbook_revision(scrapbook):
+    '''
+    Calculates the content revision of a scrapbook
+    :param scrapbook: a Scrapbook object
+    :return: hex digest that changes whenever the exported pdf would change
+    '''
+    theme = get_themes().get(scrapbook.scrapbook_theme)
+    digest = hashlib.sha256()
+    digest.update(f'{PDF_CACHE_VERSION}\0{settings.PDF_VECTOR_ROTATION}\0{scrapbook.scrapbook_name}\0'
+                  f'{scrapbook.scrapbook_theme}\0{theme.digest if theme else ""}\0'.encode())
+    # images are stored under the hash of their contents (see storage.py), so the name changes with the picture
+    for media_id, image, caption in scrapbook.media_set.order_by('id').values_list('id', 'image', 'caption'):
+        digest.update(f'{media_id}\0{image}\0{caption}\0'.encode())
+    return digest.hexdigest()
+
+def cached_pdf_path(scrapbook, revision, profile):
+    '''
+    Finds the cached pdf of a scrapbook revision and marks it as recently used
+    :param scrapbook: a Scrapbook object
+    :param revision: the revision from scrapbook_revision()
+    :param profile: the ExportProfile the pdf was made with
+    :return: file path of the pdf, or None if it isn't cached
+    '''
+    path = scrapbook_cache_dir(scrapbook) / f'{revision}-{profile.name}.pdf'
+    try:
+        os.utime(path) # modification time is used as the "last used" time for eviction
+    except FileNotFoundError:
+        return None
+    return str(path)
+
+def store_pdf(scrapbook, revision, profile, render):
+    '''
+    Renders a pdf into the cache
+    :param scrapbook: a Scrapbook object
+    :param revision: the revision from scrapbook_revision()
+    :param profile: the ExportProfile the pdf is made with
+    :param render: function that writes the pdf to the file object it is given
+    :return: file path of the cached pdf
+    '''
+    folder = scrapbook_cache_dir(scrapbook)
+    folder.mkdir(parents=True, exist_ok=True)
+    path = folder / f'{revision}-{profile.name}.pdf'
+
+    # write to a temporary file first so a half-written pdf is never sent (next to the scrapbook folders,
+    # so invalidate() doesn't see it)
+    fd, tmp_path = tempfile.mkstemp(dir=pdf_cache_root(), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as tmp_file:
+            render(tmp_file)
+        try:
+            os.replace(tmp_path, path)
+        except FileNotFoundError: # the scrapbook's folder was removed while the pdf was rendered
+            folder.mkdir(parents=True, exist_ok=True)
+            os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+    evict(keep=path)
+    return str(path)
+
+def evict(keep=None):
+    '''
+    Deletes the least recently used pdfs until the cache is smaller than PDF_CACHE_MAX_BYTES
+    :param keep: path of a pdf that should not be deleted (the one that was just made)
+    '''
+    max_bytes = settings.PDF_CACHE_MAX_BYTES
+
+    entries = []
+    total = 0
+    for path in pdf_cache_root().glob('*/*.pdf'):
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+        total += stat.st_size
+
+    # oldest first
+    for mtime, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        if path == keep:
+            continue
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            pass
+        total -= size
+
+def invalidate(scrapbook, deleted=False):
+    '''
+    Deletes the cached pdfs of a scrapbook that are out of date (used when it is edited), or all of them
+    if it is being deleted. Only pdfs are deleted, one at a time, so pdfs being stored at the same time aren't lost.
+    :param scrapbook: a Scrapbook object
+    :param deleted: True if the scrapbook is being deleted (its folder is removed too, if nothing is using it)
+    '''
+    folder = scrapbook_cache_dir(scrapbook)
+    current = None if deleted else f'{scrapbook_revision(scrapbook)}-'
+    for path in folder.glob('*.pdf'):
+        if current is None or not path.name.startswith(current):
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+    if deleted:
+        try:
+            folder.rmdir()
+        except OSError: # it doesn't exist, or a pdf was stored in it just now (which eviction deletes later)
+            pass
@@ -0,0 +1,260 @@
+'''
+Scrapbook pdf generation
+History:
+Oct 18 2026 - file creation, moved the drawing code from create_pdf() in views.py to render_scrapbook_pdf();
+              media is fetched in one query and written to a file so the view can stream it
+Oct 18 2026 - images are prepared in a process pool (see derivatives.iter_derivatives())
+Oct 18 2026 - image & background resolution and encoding come from an ExportProfile, added draw_masked_jpeg()
+Oct 18 2026 - fonts, styles & backgrounds come from theme_assets.py, the background & title are drawn once
+              as a form that every page uses
+Oct 18 2026 - render_scrapbook_pdf() records its draw & save stages (see timing.py)
+Oct 18 2026 - moved drawing an image & caption to draw_media(), pages drawn by an earlier export are
+              reused from page_cache.py
+Oct 18 2026 - image data is moved to an ImageSpool after each page and the pdf is written an object at a
+              time by write_pdf(), so an export's memory stays under PDF_MEMORY_LIMIT_BYTES (removed again below)
+Oct 18 2026 - draw_media() rotates upright images in tilted Boxes when PDF_VECTOR_ROTATION is True
+Oct 18 2026 - theme boxes are already in points, pages are split up by Theme.paginate() (themes can have
+              a different layout on each page)
+Oct 18 2026 - removed the page cache (it saved pickled reportlab objects), every page is drawn again
+Oct 18 2026 - removed ImageSpool & write_pdf(), images & the background are drawn with drawImage() (rotated
+              images for jpeg profiles are pngs with transparent corners instead of jpegs with a mask) and
+              the pdf is saved with canvas.save(); ascii85 is only turned off while exporting (see no_ascii85())
+Oct 18 2026 - render_scrapbook_pdf() takes the number of image workers to use
+Oct 18 2026 - draw_media() also rotates images for jpeg profiles when PDF_VECTOR_ROTATION is False
+Oct 18 2026 - each page is drawn into a pdf of its own by draw_part() and they are joined by
+              pdf_join.join_parts(), pages past half of PDF_MEMORY_LIMIT_BYTES are kept in temporary files
+              (see PageParts), so an export's memory stays under PDF_MEMORY_LIMIT_BYTES again
+Oct 18 2026 - removed no_ascii85(), join_parts() takes the ascii85 encoding off the streams instead
+Oct 18 2026 - pages drawn by an earlier export are reused from page_cache.py again (now saved as the pdfs
+              draw_part() makes), only the pages that aren't cached get their images prepared & are drawn
+'''
+
+# miscellaneous pdf generation stuff
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import cm
+from reportlab.pdfgen import canvas
+from reportlab.platypus import Paragraph, Frame, KeepInFrame
+from scrapbooks import page_cache
+from scrapbooks.derivatives import get_derivative, iter_derivatives, rotates_pixels
+from scrapbooks.export_profiles import profiles
+from scrapbooks.pdf_join import join_parts
+from scrapbooks.theme_assets import get_theme_assets
+from scrapbooks.timing import stage, DRAW, SAVE
+from PIL import Image
+from django.conf import settings
+from itertools import islice
+import io
+import os
+import tempfile
+
+import reportlab.rl_config
+
+reportlab.rl_config.warnOnMissingFontGlyphs = 0 # to avoid making reportlab angry
+
+MEDIA_CHUNK_SIZE = 100 # number of Media rows fetched from the database at a time
+
+PAGE_CHROME_FORM = 'page_chrome' # name of the form with the background & title
+
+
+class PageParts():
+    '''
+    The pages of an export, each one a pdf of its own (see draw_part()), in memory until they add up to
+    half of the memory limit and in temporary files after that
+    Attributes:
+        memory_limit (int): bytes of parts kept in memory
+        parts (list): bytes or file path of each part, in order
+        in_memory (int): bytes of parts in memory so far
+        folder (TemporaryDirectory): folder of the part files (None until the first one)
+    '''
+
+    def __init__(self, memory_limit):
+        self.memory_limit = memory_limit
+        self.parts = []
+        self.in_memory = 0
+        self.folder = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.parts = []
+        if self.folder is not None:
+            self.folder.cleanup()
+
+    def add(self, part):
+        '''
+        :param part: bytes of a part
+        '''
+        if self.in_memory + len(part) <= self.memory_limit:
+            self.in_memory += len(part)
+            self.parts.append(part)
+            return
+        if self.folder is None:
+            self.folder = tempfile.TemporaryDirectory(prefix='scrapbook-pages-')
+        path = os.path.join(self.folder.name, '%d.pdf' % len(self.parts))
+        with open(path, 'wb') as part_file:
+            part_file.write(part)
+        self.parts.append(path)
+
+
+def pdf_file_name(scrapbook):
+    '''
+    :param scrapbook: a Scrapbook object
+    :return: name of the pdf (based on the scrapbook title)
+    '''
+    return scrapbook.scrapbook_name.replace(' ', '_') + '.pdf'
+
+def iter_media(scrapbook):
+    '''
+    Gets all the media of a scrapbook with a single ordered query
+    :param scrapbook: a Scrapbook object
+    :return: generator of Media objects in upload order
+    '''
+    return scrapbook.media_set.order_by('id').iterator(chunk_size=MEDIA_CHUNK_SIZE)
+
+def draw_page_chrome(pdf_canvas, scrapbook, assets, profile):
+    '''
+    Draws the background & title once as a form, which every page then shows with doForm()
+    :param pdf_canvas: the reportlab Canvas
+    :param scrapbook: the Scrapbook object
+    :param assets: the ThemeAssets of the scrapbook's theme
+    :param profile: the ExportProfile
+    '''
+    theme = assets.theme
+    pdf_canvas.beginForm(PAGE_CHROME_FORM)
+
+    # background
+    pdf_canvas.drawImage(assets.background(profile), 0, 0, 21 * cm, 29.7 * cm)
+
+    # title
+    title_pos = theme.title_pos
+    title_frame = Frame(title_pos.x, title_pos.y, title_pos.width, title_pos.height, id='normal')
+    title = [Paragraph(scrapbook.scrapbook_name, assets.title_style)]
+    title_inframe = KeepInFrame(title_pos.width, title_pos.height, title)
+    title_frame.addFromList([title_inframe], pdf_canvas)
+
+    pdf_canvas.endForm()
+
+def draw_media(pdf_canvas, assets, profile, slot, m, image_path):
+    '''
+    Draws an image & its caption in a slot of the current page
+    :param pdf_canvas: the reportlab Canvas
+    :param assets: the ThemeAssets of the scrapbook's theme
+    :param profile: the ExportProfile
+    :param slot: index of the Slot in the theme's slots
+    :param m: the Media object
+    :param image_path: file path of the derivative (see derivatives.py)
+    '''
+    theme = assets.theme
+    resolution_factor = profile.resolution_factor # pixels per point
+
+    # get dimensions for this image
+    dimensions = theme.slots[slot].image
+
+    # the image is already resized (and maybe rotated) for this box (cached between exports, see derivatives.py)
+    with Image.open(image_path) as image_data:
+        image_size = image_data.size # only reads the header
+
+    # draw image and caption on canvas
+    x = dimensions.x + (dimensions.width - image_size[0] / resolution_factor) / 2
+    y = dimensions.y + (dimensions.height - image_size[1] / resolution_factor) / 2
+    width = image_size[0] / resolution_factor
+    height = image_size[1] / resolution_factor
+    if dimensions.rotation and not rotates_pixels(dimensions, profile):
+        # the image is upright, so it is drawn with the page turned around the middle of the box
+        # (the same way PIL turns the pixels), which keeps it an opaque jpeg without a mask
+        pdf_canvas.saveState()
+        pdf_canvas.translate(x + width / 2, y + height / 2)
+        pdf_canvas.rotate(dimensions.rotation)
+        pdf_canvas.drawImage(image_path, -width / 2, -height / 2, width, height, mask='auto')
+        pdf_canvas.restoreState()
+    else:
+        # jpegs are put in the pdf as they are, pngs are compressed without losing anything (and get
+        # a soft mask if they have transparent corners)
+        pdf_canvas.drawImage(image_path, x, y, width, height, mask='auto')
+
+    # draw caption
+    caption_pos = theme.slots[slot].caption
+    caption_frame = Frame(caption_pos.x, caption_pos.y, caption_pos.width, caption_pos.height, id='normal')
+    caption_text = [Paragraph(m.caption, assets.caption_style)]
+    caption_inframe = KeepInFrame(caption_pos.width, caption_pos.height, caption_text, mode='overflow')
+    caption_frame.addFromList([caption_inframe], pdf_canvas)
+    # frame.drawBoundary(pdf_canvas) # for debugging
+
+def draw_part(draw):
+    '''
+    Draws a single page pdf (joined with the others by pdf_join.join_parts())
+    :param draw: function that draws the page on the reportlab Canvas it is given
+    :return: bytes of the pdf
+    '''
+    buffer = io.BytesIO()
+    # invariant leaves out the creation date & a random id, so a page drawn again is the same bytes
+    pdf_canvas = canvas.Canvas(buffer, pagesize=A4, pageCompression=1, invariant=1)
+    draw(pdf_canvas)
+    pdf_canvas.showPage()
+    pdf_canvas.save()
+    return buffer.getvalue()
+
+def render_scrapbook_pdf(scrapbook, output, profile=None, image_workers=None):
+    '''
+    Draws a scrapbook's media as a pdf
+    :param scrapbook: the Scrapbook object
+    :param output: file (or file-like object) the pdf is written to
+    :param profile: the ExportProfile that decides image resolution & encoding (PDF_DEFAULT_PROFILE if None)
+    :param image_workers: 1 to prepare the images in this process, otherwise the image pool is used
+    (PDF_IMAGE_WORKERS if None, see derivatives.iter_derivatives())
+    '''
+    if profile is None:
+        profile = profiles[settings.PDF_DEFAULT_PROFILE]
+    assets = get_theme_assets(scrapbook.scrapbook_theme) # loaded once per process
+    theme = assets.theme
+
+    # split the media into pages
+    pages = list(theme.paginate(list(iter_media(scrapbook))))
+    use_cache = settings.PDF_PAGE_CACHE
+    keys = [page_cache.page_key(theme, profile, page_number, page_slots) for page_number, page_slots in enumerate(pages)]
+    cached = [use_cache and page_cache.is_cached(scrapbook, key) for key in keys]
+    # only the pages that have to be drawn need their images
+    media_images = iter_derivatives([slot_media for page_slots, is_cached in zip(pages, cached) if not is_cached
+                                     for slot_media in page_slots], theme, profile, image_workers)
+
+    def draw_chrome(pdf_canvas):
+        draw_page_chrome(pdf_canvas, scrapbook, assets, profile)
+        pdf_canvas.doForm(PAGE_CHROME_FORM)
+
+    def draw_page(page_slots, images):
+        def draw(pdf_canvas):
+            for (slot, _), (m, image_path) in zip(page_slots, images):
+                draw_media(pdf_canvas, assets, profile, slot, m, image_path)
+        return draw
+
+    stored = [] # keys of the pages added to the cache
+    def cached_part(key, draw):
+        part = page_cache.load_page(scrapbook, key) if use_cache else None
+        if part is None:
+            with stage(DRAW):
+                part = draw_part(draw)
+            if use_cache:
+                page_cache.store_page(scrapbook, key, part)
+                stored.append(key)
+        return part
+
+    with PageParts(settings.PDF_MEMORY_LIMIT_BYTES // 2) as page_parts:
+        # background & title (a page of its own, every page shows its form first)
+        chrome = page_cache.chrome_key(theme, profile, scrapbook.scrapbook_name)
+        chrome_part = cached_part(chrome, draw_chrome)
+
+        for page_slots, key, is_cached in zip(pages, keys, cached):
+            if is_cached:
+                # its images are only needed if the page was evicted since
+                images = ((m, get_derivative(m, theme, slot, profile)) for slot, m in page_slots)
+            else:
+                # the derivatives are made a batch at a time, only the ones of this page are held in memory
+                images = list(islice(media_images, len(page_slots)))
+            page_parts.add(cached_part(key, draw_page(page_slots, images)))
+
+        with stage(SAVE):
+            join_parts(output, page_parts.parts, chrome_part, PAGE_CHROME_FORM, scrapbook.scrapbook_name)
+
+    if stored:
+        page_cache.evict(keep={page_cache.page_path(scrapbook, key) for key in keys + [chrome]})
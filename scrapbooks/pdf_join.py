@@ -0,0 +1,446 @@
+'''
+Joining the one-page pdfs that scrapbook pages are drawn into
+History:
+Oct 18 2026 - file creation
+Oct 18 2026 - streams are copied without their ascii85 encoding (see without_ascii85())
+
+render_scrapbook_pdf() draws each page of a scrapbook with its own reportlab Canvas into a small
+pdf of its own (a "part"), and the background & title into another part, so reportlab only ever
+holds the images of one page. join_parts() writes the parts out as one pdf an object at a time:
+every page is copied with the objects it uses (renumbered), gets the new page tree as its parent
+and shows the background & title form of the chrome part before its own drawing. The chrome is
+copied once, however many pages use it. reportlab ascii85 encodes every stream (rl_config.useA85,
+which is process-wide), that is undone while copying, so the pdf is a fifth smaller.
+
+Parts are always written by reportlab (a classic xref table, no object streams or encryption),
+which is all PdfPart understands. Part files are read with mmap, so only the objects being copied
+are read into memory.
+'''
+
+import mmap
+import re
+from collections import namedtuple
+from contextlib import contextmanager
+
+from reportlab.lib.rl_accel import asciiBase85Decode
+
+WHITESPACE = rb'\x00\t\n\x0c\r '
+DELIMITERS = rb'()<>\[\]{}/%'
+
+_skip = re.compile(rb'(?:[' + WHITESPACE + rb']+|%[^\r\n]*)*')
+_name = re.compile(rb'/[^' + WHITESPACE + DELIMITERS + rb']*')
+_hex_string = re.compile(rb'<[0-9A-Fa-f' + WHITESPACE + rb']*>')
+_regular = re.compile(rb'[^' + WHITESPACE + DELIMITERS + rb']+')
+_integer = re.compile(rb'[+-]?\d+\Z')
+_stream_start = re.compile(rb'stream\r?\n')
+
+PRODUCER = b'(ReportLab PDF Library - www.reportlab.com)'
+
+
+class PdfError(Exception):
+    '''
+    Raised when a part isn't a pdf PdfPart can read
+    '''
+
+
+Ref = namedtuple('Ref', 'number generation') # an indirect reference ("12 0 R")
+
+class WrittenRef(Ref):
+    '''
+    A Ref to an object that already has its number in the new pdf (not renumbered by PartCopier)
+    '''
+
+class Name(bytes):
+    '''
+    A pdf name, with its slash (b'/Type')
+    '''
+
+class Token(bytes):
+    '''
+    Any other pdf value as it is in the file (numbers, strings, true/false/null)
+    '''
+
+
+def serialize(value, renumber):
+    '''
+    :param value: a value from PdfPart.read_object()
+    :param renumber: function that gives the Ref an object has in the new pdf
+    :return: the value as pdf bytes
+    '''
+    if isinstance(value, Ref):
+        return b'%d %d R' % renumber(value)
+    if isinstance(value, dict):
+        return b'<< ' + b''.join(key + b' ' + serialize(item, renumber) + b' ' for key, item in value.items()) + b'>>'
+    if isinstance(value, list):
+        return b'[ ' + b''.join(serialize(item, renumber) + b' ' for item in value) + b']'
+    return bytes(value)
+
+def without_ascii85(value, stream):
+    '''
+    :param value: a stream's dictionary
+    :param stream: the stream's data
+    :return: (dictionary, data) without the ascii85 encoding if it is the first filter
+    '''
+    filters = value.get(b'/Filter')
+    if not isinstance(filters, list):
+        filters = [filters]
+    if filters[0] != b'/ASCII85Decode':
+        return value, stream
+    value = dict(value)
+    if filters[1:]:
+        value[Name(b'/Filter')] = filters[1:]
+    else:
+        del value[b'/Filter']
+    return value, asciiBase85Decode(bytes(stream))
+
+def text_string(text):
+    '''
+    :param text: any text
+    :return: the text as a pdf string (UTF-16 with a byte order mark, so it can have any character)
+    '''
+    return b'<FEFF' + text.encode('utf-16-be').hex().upper().encode() + b'>'
+
+
+class PdfPart():
+    '''
+    Reads the objects of a pdf written by reportlab
+    Attributes:
+        data (bytes or mmap): the whole pdf
+        offsets (dict): object number: where the object starts in data
+        trailer (dict): the trailer dictionary
+    '''
+
+    def __init__(self, data):
+        self.data = data
+        start = data.rfind(b'startxref')
+        if start == -1:
+            raise PdfError('no startxref')
+        position = self._expect(start + len(b'startxref'), None)
+        token, position = self._token(position)
+        self.offsets = {}
+        self.trailer = self._read_xref(int(token))
+
+    def _read_xref(self, position):
+        '''
+        :param position: where the xref table starts
+        :return: the trailer dictionary
+        '''
+        position = self._expect(position, b'xref')
+        while True:
+            token, position = self._token(position)
+            if token == b'trailer':
+                trailer, position = self._value(position)
+                return trailer
+            first = int(token)
+            count, position = self._token(position)
+            for number in range(first, first + int(count)):
+                offset, position = self._token(position)
+                generation, position = self._token(position)
+                in_use, position = self._token(position)
+                if in_use == b'n':
+                    self.offsets[number] = int(offset)
+
+    def _token(self, position):
+        '''
+        :param position: where to start looking
+        :return: (the next token, where it ends)
+        '''
+        data = self.data
+        position = _skip.match(data, position).end()
+        two = data[position:position + 2]
+        if two in (b'<<', b'>>'):
+            return two, position + 2
+        one = two[:1]
+        if one in (b'[', b']', b'{', b'}'):
+            return one, position + 1
+        if one == b'/':
+            match = _name.match(data, position)
+        elif one == b'<':
+            match = _hex_string.match(data, position)
+        elif one == b'(':
+            return self._literal_string(position)
+        else:
+            match = _regular.match(data, position)
+        if match is None:
+            raise PdfError(f'unexpected {bytes(two)!r} at {position}')
+        return match.group(), match.end()
+
+    def _literal_string(self, position):
+        '''
+        :param position: where the string's opening bracket is
+        :return: (the string with its brackets, where it ends)
+        '''
+        data = self.data
+        depth = 0
+        end = position
+        while True:
+            character = data[end:end + 1]
+            if not character:
+                raise PdfError(f'unfinished string at {position}')
+            if character == b'\\':
+                end += 2
+                continue
+            if character == b'(':
+                depth += 1
+            elif character == b')':
+                depth -= 1
+                if depth == 0:
+                    return data[position:end + 1], end + 1
+            end += 1
+
+    def _expect(self, position, keyword):
+        '''
+        :param position: where to start looking
+        :param keyword: the token that has to come next (None to only skip whitespace)
+        :return: where the keyword ends
+        '''
+        if keyword is None:
+            return _skip.match(self.data, position).end()
+        token, end = self._token(position)
+        if token != keyword:
+            raise PdfError(f'expected {keyword!r} at {position}, found {token!r}')
+        return end
+
+    def _value(self, position):
+        '''
+        :param position: where the value starts
+        :return: (dict, list, Ref, Name or Token, where it ends)
+        '''
+        token, position = self._token(position)
+        if token == b'<<':
+            value = {}
+            while True:
+                key, position = self._token(position)
+                if key == b'>>':
+                    return value, position
+                value[Name(key)], position = self._value(position)
+        if token == b'[':
+            value = []
+            while True:
+                end = self._expect(position, None)
+                if self.data[end:end + 1] == b']':
+                    return value, end + 1
+                item, position = self._value(position)
+                value.append(item)
+        if token.startswith(b'/'):
+            return Name(token), position
+        if _integer.match(token):
+            # "12 0 R" is a reference, otherwise it is just a number
+            generation, after_generation = self._token(position)
+            if _integer.match(generation):
+                keyword, after_keyword = self._token(after_generation)
+                if keyword == b'R':
+                    return Ref(int(token), int(generation)), after_keyword
+        return Token(token), position
+
+    def read_object(self, number):
+        '''
+        :param number: object number
+        :return: (the object's value, (start, end) of its stream data or None if it isn't a stream)
+        '''
+        try:
+            position = self.offsets[number]
+        except KeyError:
+            raise PdfError(f'there is no object {number}')
+        position = self._expect(position, str(number).encode())
+        position = self._token(position)[1] # generation
+        position = self._expect(position, b'obj')
+        value, position = self._value(position)
+        stream = _stream_start.match(self.data, self._expect(position, None))
+        if stream is None:
+            return value, None
+        length = self.resolve(value[b'/Length'])
+        return value, (stream.end(), stream.end() + int(length))
+
+    def resolve(self, value):
+        '''
+        :param value: any value
+        :return: the object it refers to if it is a Ref, otherwise the value
+        '''
+        if isinstance(value, Ref):
+            return self.read_object(value.number)[0]
+        return value
+
+    def pages(self):
+        '''
+        :return: list of the page dictionaries in order
+        '''
+        catalog = self.resolve(self.trailer[b'/Root'])
+        pages = []
+        kids = [catalog[b'/Pages']]
+        while kids:
+            node = self.resolve(kids.pop(0))
+            if node.get(b'/Type') == b'/Pages':
+                kids[:0] = self.resolve(node[b'/Kids'])
+            else:
+                pages.append(node)
+        return pages
+
+
+@contextmanager
+def open_part(part):
+    '''
+    :param part: a part as bytes, or the path of a part file
+    :return: the PdfPart (a context manager, so a part file is closed afterwards)
+    '''
+    if isinstance(part, (bytes, bytearray)):
+        yield PdfPart(part)
+        return
+    with open(part, 'rb') as part_file, mmap.mmap(part_file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        yield PdfPart(data)
+
+
+class PdfWriter():
+    '''
+    Writes the objects of a pdf to a file one at a time and then its xref table
+    Attributes:
+        output: file (or file-like object) the pdf is written to
+        position (int): number of bytes written so far
+        offsets (dict): object number: where it was written
+        next_number (int): number the next new object gets
+    '''
+
+    def __init__(self, output):
+        self.output = output
+        self.position = 0
+        self.offsets = {}
+        self.next_number = 1
+        self.write(b'%PDF-1.4\n%\x93\x8c\x8b\x9e ReportLab Generated PDF document http://www.reportlab.com\n')
+
+    def write(self, data):
+        self.output.write(data)
+        self.position += len(data)
+
+    def new_number(self):
+        '''
+        :return: the number of a new object (written later with write_object())
+        '''
+        number = self.next_number
+        self.next_number += 1
+        return number
+
+    def write_object(self, number, value, stream=None):
+        '''
+        :param number: object number from new_number()
+        :param value: the object as pdf bytes (for a stream, its dictionary without /Length)
+        :param stream: the stream data, or None if it isn't a stream
+        '''
+        self.offsets[number] = self.position
+        self.write(b'%d 0 obj\n' % number)
+        if stream is None:
+            self.write(value + b'\nendobj\n')
+        else:
+            self.write(value[:-2] + b'/Length %d >>\nstream\n' % len(stream))
+            self.write(stream)
+            self.write(b'\nendstream\nendobj\n')
+
+    def finish(self, root, info):
+        '''
+        Writes the xref table & trailer
+        :param root: number of the catalog object
+        :param info: number of the document information object
+        '''
+        size = self.next_number
+        if len(self.offsets) != size - 1:
+            raise PdfError('some objects were never written')
+        xref_position = self.position
+        self.write(b'xref\n0 %d\n0000000000 65535 f \n' % size)
+        self.write(b''.join(b'%010d 00000 n \n' % self.offsets[number] for number in range(1, size)))
+        self.write(b'trailer\n<< /Info %d 0 R /Root %d 0 R /Size %d >>\nstartxref\n%d\n%%%%EOF\n'
+                   % (info, root, size, xref_position))
+
+
+class PartCopier():
+    '''
+    Copies objects of a part into a PdfWriter, giving each one a new number the first time it is used
+    Attributes:
+        part (PdfPart): the part
+        writer (PdfWriter): the pdf being written
+        numbers (dict): object number in the part: object number in the new pdf
+        waiting (list): numbers of objects in the part that have a new number but haven't been written yet
+    '''
+
+    def __init__(self, part, writer):
+        self.part = part
+        self.writer = writer
+        self.numbers = {}
+        self.waiting = []
+
+    def renumber(self, ref):
+        '''
+        :param ref: a Ref in the part
+        :return: the Ref in the new pdf (the object is written by copy_waiting())
+        '''
+        if isinstance(ref, WrittenRef):
+            return ref
+        if ref.number not in self.numbers:
+            self.numbers[ref.number] = self.writer.new_number()
+            self.waiting.append(ref.number)
+        return Ref(self.numbers[ref.number], 0)
+
+    def copy_waiting(self):
+        '''
+        Writes the objects that have been given new numbers, and the ones they use
+        '''
+        while self.waiting:
+            number = self.waiting.pop()
+            value, stream = self.part.read_object(number)
+            new_number = self.numbers[number]
+            if stream is None:
+                self.writer.write_object(new_number, serialize(value, self.renumber))
+            else:
+                value = {key: item for key, item in value.items() if key != b'/Length'}
+                start, end = stream
+                value, data = without_ascii85(value, self.part.data[start:end])
+                self.writer.write_object(new_number, serialize(value, self.renumber), data)
+
+
+def join_parts(output, page_parts, chrome_part=None, chrome_form=None, title=''):
+    '''
+    Writes the pages of the parts as one pdf
+    :param output: file (or file-like object) the pdf is written to
+    :param page_parts: iterable of parts (bytes or file paths) whose pages make up the pdf, in order
+    :param chrome_part: part with a page that uses the form every page shows first (or None)
+    :param chrome_form: name of that form (as given to canvas.beginForm())
+    :param title: title of the pdf
+    '''
+    writer = PdfWriter(output)
+    catalog, info, page_tree = writer.new_number(), writer.new_number(), writer.new_number()
+    writer.write_object(catalog, b'<< /PageMode /UseNone /Pages %d 0 R /Type /Catalog >>' % page_tree)
+    writer.write_object(info, b'<< /Producer %s /Title %s >>' % (PRODUCER, text_string(title)))
+
+    chrome = None
+    if chrome_part is not None:
+        form_name = Name(b'/FormXob.' + chrome_form.encode())
+        with open_part(chrome_part) as part:
+            copier = PartCopier(part, writer)
+            resources = part.resolve(part.pages()[0][b'/Resources'])
+            form = copier.renumber(part.resolve(resources[b'/XObject'])[form_name])
+            copier.copy_waiting()
+        chrome = writer.new_number()
+        writer.write_object(chrome, b'<< >>', b'q\n%s Do\nQ' % form_name)
+
+    kids = []
+    for page_part in page_parts:
+        with open_part(page_part) as part:
+            copier = PartCopier(part, writer)
+            for page in part.pages():
+                page = dict(page)
+                page[Name(b'/Parent')] = WrittenRef(page_tree, 0)
+                if chrome is not None:
+                    resources = dict(part.resolve(page.get(b'/Resources', {})))
+                    xobjects = dict(part.resolve(resources.get(b'/XObject', {})))
+                    xobjects[form_name] = WrittenRef(form.number, 0)
+                    resources[Name(b'/XObject')] = xobjects
+                    page[Name(b'/Resources')] = resources
+                    contents = page.get(b'/Contents', [])
+                    page[Name(b'/Contents')] = [WrittenRef(chrome, 0)] + (contents if isinstance(contents, list)
+                                                                          else [contents])
+                number = writer.new_number()
+                kids.append(number)
+                writer.write_object(number, serialize(page, copier.renumber))
+                copier.copy_waiting()
+
+    writer.write_object(page_tree, b'<< /Count %d /Kids [ %s ] /Type /Pages >>'
+                        % (len(kids), b' '.join(b'%d 0 R' % number for number in kids)))
+    writer.finish(catalog, info)
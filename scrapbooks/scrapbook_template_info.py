@@ -3,11 +3,61 @@ Everything about scrapbook themes
 History
 Apr 16 2024 - file creation
 Apr 17 2024 - added blue_flowers theme, added rotation attribute to Box
+Oct 18 2026 - themes are loaded from json files in SCRAPBOOK_THEME_DIRS (see scrapbooks/themes/) and compiled
+              into Theme & Box tables that are already in points, added theme_choices() for Scrapbook
+Oct 18 2026 - the themes come from get_themes() (cached with lru_cache) instead of a module attribute
+
+Each <name>.json file in SCRAPBOOK_THEME_DIRS is a theme (the file name is the theme's name, which
+is what Scrapbook.scrapbook_theme stores), so adding a theme doesn't need any code changes:
+    {
+        "label": "Blue Flowers",                      name shown in the theme dropdown
+        "sample": "Blue_Flowers_sample.jpg",          picture of the theme in the static files (optional)
+        "background": "static/template1BG.png",       A4 background image (relative to BASE_DIR)
+        "title": {"box": [x, y, width, height], "font": "Daughter_of_Fortune", "size": 25, "align": "center"},
+        "caption": {"font": "Times-Roman", "size": 12, "align": "left"},
+        "pages": [                                    layouts of the pages, used in turn
+            {"slots": [{"image": [x, y, width, height, rotation], "caption": [x, y, width, height]}, ...]},
+            ...
+        ],
+        "repeat_from": 0                              layout to go back to after the last one (optional)
+    }
+Boxes are in cm from the bottom left corner of the page, rotations in degrees counterclockwise. Fonts
+must be reportlab defaults or the name of a .ttf file that reportlab can find, and align is one of
+ALIGNMENTS. Every file is checked when the server starts (ImproperlyConfigured says what is wrong)
+and compiled into immutable tuples in points, so drawing a pdf never converts anything.
+
+get_themes() only loads the themes the first time it is called (when the models are imported), so the
+image pool's processes, which don't set up Django, can still unpickle the Boxes they are given.
 '''
 
-class Box():
+import functools
+import hashlib
+import json
+import re
+from pathlib import Path
+from types import MappingProxyType
+from typing import NamedTuple
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from reportlab.lib.enums import TA_CENTER, TA_JUSTIFY, TA_LEFT, TA_RIGHT
+from reportlab.lib.units import cm
+from reportlab.pdfbase.ttfonts import TTFError, TTFOpenFile
+
+# fonts that reportlab already knows about
+default_fonts = ['Courier', 'Courier-Bold', 'Courier-Oblique', 'Courier-BoldOblique',
+                 'Helvetica', 'Helvetica-Bold', 'Helvetica-Oblique', 'Helvetica-BoldOblique',
+                 'Times-Roman', 'Times-Bold', 'Times-Italic', 'Times-BoldItalic', 'Symbol', 'ZapfDingbats']
+
+# "align" in a theme file: reportlab's ParagraphStyle.alignment
+ALIGNMENTS = {'left': TA_LEFT, 'center': TA_CENTER, 'right': TA_RIGHT, 'justify': TA_JUSTIFY}
+
+THEME_NAME_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,100}$') # fits in Scrapbook.scrapbook_theme
+
+
+class Box(NamedTuple):
     '''
-    A class to represent dimensions of an image or textbox (in cm)
+    A class to represent dimensions of an image or textbox (in points)
     Attributes:
         x (float): x-coordinate of the bottom left corner on cartesian plane
         y (float): y-coordinate of the bottom left corner on cartesian plane
@@ -15,83 +65,216 @@ class Box():
         height (float): height of the box
         rotation (float = 0): rotation of the box (degrees counterclockwise)
     '''
+    x: float
+    y: float
+    width: float
+    height: float
+    rotation: float = 0.0
+
+
+class Slot(NamedTuple):
+    '''
+    A place for a media object on a page
+    Attributes:
+        image (Box): position of the image
+        caption (Box): position of its caption
+    '''
+    image: Box
+    caption: Box
 
-    def __init__(self, x, y, width, height, rotation=0.0):
-        self.x = x
-        self.y = y
-        self.width = width
-        self.height = height
-        self.rotation = rotation
 
-class Theme():
+class Theme(NamedTuple):
     '''
     Stores information about themes
     Attributes:
-        image_pos_list (list of Box): positions of images on each page of a scrapbook
-        captions_pos_list (list of Box): positions of captions for each image
-        bg (string): file path of the background image of the template (should be A4 size and stored in scrapbooks/static)
+        name (str): name of the theme file (what Scrapbook.scrapbook_theme stores)
+        label (str): name shown to people
+        sample (str): static file with a picture of the theme, or None
+        digest (str): hex digest of the theme file (changes whenever the theme does, for the caches)
+        bg (str): file path of the background image of the template (should be A4 size)
         title_pos (Box): position of scrapbook title on page
-        title_font (str = 'Helvetica'): font of title (must be a reportlab default or name of .ttf file stored in reportlab/fonts)
-        title_size (float = 40): font size of title
-        title_align (int = 0): alignment of title as int for reportlab's StyleSheet.alignment
-        caption_font (str = 'Helvetica'): font of title (must be a reportlab default or name of .ttf file stored in reportlab/fonts)
-        caption_size (float = 12): font size of title
-        caption_align (int = 0): alignment of caption as int for reportlab's StyleSheet.alignment
-        media_num (int = 4): the number of media objects per page
-    '''
-    def __init__(self, image_pos_list, captions_pos_list, bg, title_pos,
-                 title_font='Helvetica', title_size='40', title_align=0,
-                 caption_font='Helvetica', caption_size=12, caption_align=0,
-                 media_num=4):
-
-        self.media_num = media_num
-        self.image_pos_list = image_pos_list
-        self.captions_pos_list = captions_pos_list
-        self.bg = bg
-        self.title_pos = title_pos
-        self.title_font = title_font
-        self.title_size = title_size
-        self.title_align = title_align
-        self.caption_font = caption_font
-        self.caption_size = caption_size
-        self.caption_align = caption_align
-
-# theme 1
-blue_flowers = Theme(image_pos_list=[Box(1.56, 17.53, 8.48, 8.47, 6.9),
-                                     Box(12.09, 16.19, 8.65, 8.63, -8.3),
-                                     Box(1.22, 5.85, 8.62, 8.61, -8.1),
-                                     Box(11.57, 0.71, 8.9, 8.87, -10.6)],
-                   captions_pos_list=[Box(1.56, 14.33, 8.48, 3),
-                                     Box(12.09, 24.82, 8.65, 2.5),
-                                     Box(1.22, 2.65, 8.62, 3),
-                                     Box(11.57, 9.58, 8.9, 2.5)],
-                   bg='static/template1BG.png',
-                   title_pos=Box(0.66, 14.77, 19.69, 1.1),
-                   title_font='Daughter_of_Fortune',
-                   title_size=25,
-                   title_align=1,
-                   caption_font='Times-Roman',
-                   caption_size=12)
-
-# theme 2
-pink_stars = Theme(image_pos_list=[Box(1.7, 15.95, 8.28, 8.28),
-                                   Box(11.64, 18.19, 8.28, 8.28),
-                                   Box(1.8, 3.3, 8.28, 8.28),
-                                   Box(11.42, 6.12, 8.28, 8.28)],
-                   captions_pos_list=[Box(1.7, 12.95, 8.28, 3),
-                                      Box(11.64, 15.19, 8.28, 3),
-                                      Box(1.8, 0.3, 8.28, 3),
-                                      Box(11.42, 3.12, 8.28, 3)],
-                   bg='static/template2BG.png',
-                   title_pos=Box(3.32, 26.82, 16.6, 1.88),
-                   title_font='Daughter_of_Fortune',
-                   title_size=45,
-                   caption_font='Helvetica',
-                   caption_size=10,
-                   caption_align=1)
-
-# dictionary of themes for each template
-themes = {
-    'template1': blue_flowers,
-    'template2': pink_stars
-}
\ No newline at end of file
+        title_font (str): font of title (a reportlab default or name of a .ttf file reportlab can find)
+        title_size (float): font size of title
+        title_align (int): alignment of title as int for reportlab's StyleSheet.alignment
+        caption_font (str): font of captions
+        caption_size (float): font size of captions
+        caption_align (int): alignment of captions as int for reportlab's StyleSheet.alignment
+        slots (tuple of Slot): every slot of every page layout
+        layouts (tuple of tuple of int): indexes in slots of the slots on each page layout
+        repeat_from (int): layout used after the last one
+    '''
+    name: str
+    label: str
+    sample: str
+    digest: str
+    bg: str
+    title_pos: Box
+    title_font: str
+    title_size: float
+    title_align: int
+    caption_font: str
+    caption_size: float
+    caption_align: int
+    slots: tuple
+    layouts: tuple
+    repeat_from: int
+
+    def layout(self, page_number):
+        '''
+        :param page_number: index of the page in the pdf
+        :return: indexes in self.slots of the slots on that page
+        '''
+        if page_number >= len(self.layouts):
+            page_number = self.repeat_from + (page_number - self.repeat_from) % (len(self.layouts) - self.repeat_from)
+        return self.layouts[page_number]
+
+    def paginate(self, items):
+        '''
+        Splits a scrapbook's media into pages (there is always at least one page, for the title)
+        :param items: list of media in the order they go in the pdf
+        :return: list of pages, each a list of (slot index, item)
+        '''
+        pages = []
+        start = 0
+        while start < len(items) or not pages:
+            slots = self.layout(len(pages))
+            pages.append(list(zip(slots, items[start:start + len(slots)])))
+            start += len(slots)
+        return pages
+
+
+def _check(condition, path, message):
+    '''
+    :param condition: what has to be true about the theme file
+    :param path: the theme file
+    :param message: what is wrong if it isn't
+    '''
+    if not condition:
+        raise ImproperlyConfigured(f'theme {path}: {message}')
+
+def _check_keys(value, required, optional, path, where):
+    '''
+    Makes sure a part of a theme file is a dictionary with only the keys it should have (so typos are noticed)
+    '''
+    _check(isinstance(value, dict), path, f'{where} has to be an object')
+    missing = [key for key in required if key not in value]
+    unknown = [key for key in value if key not in required and key not in optional]
+    _check(not missing, path, f'{where} is missing {", ".join(missing)}')
+    _check(not unknown, path, f'{where} has unknown key(s) {", ".join(unknown)}')
+
+def _compile_box(value, path, where, rotated=False):
+    '''
+    :param value: [x, y, width, height] in cm (and a rotation in degrees if rotated is True)
+    :return: the Box in points
+    '''
+    lengths = (4, 5) if rotated else (4,)
+    _check(isinstance(value, list) and len(value) in lengths, path,
+           f'{where} has to be [x, y, width, height{", rotation" if rotated else ""}]')
+    _check(all(isinstance(n, (int, float)) and not isinstance(n, bool) for n in value), path,
+           f'{where} can only have numbers')
+    _check(value[2] > 0 and value[3] > 0, path, f'{where} has to have a width & height above 0')
+    x, y, width, height = (n * cm for n in value[:4])
+    return Box(x, y, width, height, float(value[4]) if len(value) == 5 else 0.0)
+
+def _compile_font(value, path, where):
+    '''
+    :param value: {"font": ..., "size": ..., "align": ...}
+    :return: (font, size, alignment)
+    '''
+    font = value['font']
+    _check(isinstance(font, str) and font, path, f'{where} font has to be a name')
+    if font not in default_fonts:
+        try:
+            TTFOpenFile(f'{font}.ttf')[1].close()
+        except TTFError:
+            raise ImproperlyConfigured(f'theme {path}: {where} font {font} is not a reportlab font and '
+                                       f'{font}.ttf is not in reportlab\'s font folders')
+    size = value['size']
+    _check(isinstance(size, (int, float)) and not isinstance(size, bool) and size > 0, path,
+           f'{where} size has to be a number above 0')
+    align = value.get('align', 'left')
+    _check(align in ALIGNMENTS, path, f'{where} align has to be one of {", ".join(ALIGNMENTS)}')
+    return font, size, ALIGNMENTS[align]
+
+def compile_theme(path):
+    '''
+    Checks a theme file and compiles it
+    :param path: Path of the json file
+    :return: the Theme
+    '''
+    name = path.stem
+    _check(THEME_NAME_PATTERN.match(name), path, 'the file name can only have letters, numbers, _ and - '
+                                                 '(and be up to 100 characters)')
+    data = path.read_bytes()
+    try:
+        info = json.loads(data)
+    except ValueError as e:
+        raise ImproperlyConfigured(f'theme {path}: not valid json ({e})')
+
+    _check_keys(info, ('label', 'background', 'title', 'caption', 'pages'), ('sample', 'repeat_from'), path, 'the theme')
+    _check(isinstance(info['label'], str) and info['label'], path, 'label has to be text')
+    sample = info.get('sample')
+    _check(sample is None or isinstance(sample, str), path, 'sample has to be a static file name')
+
+    background = Path(info['background'])
+    if not background.is_absolute():
+        background = Path(settings.BASE_DIR) / background
+    _check(background.is_file(), path, f'background {background} doesn\'t exist')
+
+    _check_keys(info['title'], ('box', 'font', 'size'), ('align',), path, 'title')
+    title_pos = _compile_box(info['title']['box'], path, 'title box')
+    title_font, title_size, title_align = _compile_font(info['title'], path, 'title')
+    _check_keys(info['caption'], ('font', 'size'), ('align',), path, 'caption')
+    caption_font, caption_size, caption_align = _compile_font(info['caption'], path, 'caption')
+
+    pages = info['pages']
+    _check(isinstance(pages, list) and pages, path, 'pages has to be a list of at least one layout')
+    slots = []
+    layouts = []
+    for page_number, page in enumerate(pages):
+        where = f'pages[{page_number}]'
+        _check_keys(page, ('slots',), (), path, where)
+        _check(isinstance(page['slots'], list) and page['slots'], path, f'{where} needs at least one slot')
+        layout = []
+        for slot_number, slot in enumerate(page['slots']):
+            slot_where = f'{where}.slots[{slot_number}]'
+            _check_keys(slot, ('image', 'caption'), (), path, slot_where)
+            layout.append(len(slots))
+            slots.append(Slot(_compile_box(slot['image'], path, f'{slot_where}.image', rotated=True),
+                              _compile_box(slot['caption'], path, f'{slot_where}.caption')))
+        layouts.append(tuple(layout))
+
+    repeat_from = info.get('repeat_from', 0)
+    _check(isinstance(repeat_from, int) and not isinstance(repeat_from, bool) and 0 <= repeat_from < len(layouts),
+           path, 'repeat_from has to be the index of one of the pages')
+
+    return Theme(name=name, label=info['label'], sample=sample, digest=hashlib.sha256(data).hexdigest(),
+                 bg=str(background), title_pos=title_pos, title_font=title_font, title_size=title_size,
+                 title_align=title_align, caption_font=caption_font, caption_size=caption_size,
+                 caption_align=caption_align, slots=tuple(slots), layouts=tuple(layouts), repeat_from=repeat_from)
+
+def load_themes():
+    '''
+    Compiles every theme file in SCRAPBOOK_THEME_DIRS (a theme in a later folder replaces one with the same name)
+    :return: read-only dictionary of theme name: Theme, sorted by name
+    '''
+    found = {}
+    for folder in settings.SCRAPBOOK_THEME_DIRS:
+        for path in sorted(Path(folder).glob('*.json')):
+            found[path.stem] = path
+    if not found:
+        raise ImproperlyConfigured(f'there are no theme files in {", ".join(map(str, settings.SCRAPBOOK_THEME_DIRS))}')
+    return MappingProxyType({name: compile_theme(found[name]) for name in sorted(found)})
+
+@functools.lru_cache(maxsize=None)
+def get_themes():
+    '''
+    :return: the dictionary of themes for each template (loaded the first time this is called)
+    '''
+    return load_themes()
+
+def theme_choices():
+    '''
+    :return: choices for Scrapbook.scrapbook_theme, ((theme name, label), ...)
+    '''
+    return tuple((name, theme.label) for name, theme in get_themes().items())
@@ -0,0 +1,134 @@
+'''
+Storage for uploaded images that keeps one copy of each file
+History:
+Oct 18 2026 - file creation
+Oct 18 2026 - writing files is recorded as the STORE stage (see timing.py)
+Oct 18 2026 - files are only deleted by garbage.collect() with delete_unused(), which can't race with a new upload
+
+Files are saved under the sha256 of their contents (images/<first 2 characters>/<sha256>.<extension>),
+so the same photo uploaded to several scrapbooks, or twice to the same one, is only stored once and
+every Media object for it has the same image name. Existing uploads are converted with
+"python manage.py dedupe_media".
+
+Since an upload can reuse a file that is already stored, deleting the last Media object using a file
+doesn't delete it straight away (an upload of the same photo could be about to use it). The file is
+recorded in OrphanedFile (see auto_delete_file_on_delete() in models.py) and deleted later by
+"python manage.py collect_garbage" with delete_unused(). _save() changes the modification time of
+a file it reuses, and delete_unused() moves a file out of the way before checking its modification
+time and whether it is used, so an upload either sees the file is gone and saves it again, or has
+touched it recently enough that it is put back.
+'''
+
+import hashlib
+import os
+import posixpath
+import re
+import tempfile
+import time
+import uuid
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+from scrapbooks.timing import stage, STORE
+
+# the process's umask (read once here, since changing it to read it isn't safe once there are other threads)
+UMASK = os.umask(0)
+os.umask(UMASK)
+
+HASHED_NAME = re.compile(r'^(?:.*/)?[0-9a-f]{2}/[0-9a-f]{64}(?:\.[a-z0-9]+)?$') # a name made by content_name()
+
+
+def content_name(directory, digest, original_name):
+    '''
+    :param directory: folder in the storage (e.g. 'images')
+    :param digest: sha256 hex digest of the file
+    :param original_name: name the file was uploaded with (only the extension is kept)
+    :return: the name a file with that content is stored under
+    '''
+    extension = os.path.splitext(original_name)[1].lower()
+    return posixpath.join(directory, digest[:2], f'{digest}{extension}')
+
+def content_digest(content):
+    '''
+    :param content: a File object
+    :return: sha256 hex digest of the file
+    '''
+    digest = hashlib.sha256()
+    for chunk in content.chunks():
+        digest.update(chunk)
+    content.seek(0)
+    return digest.hexdigest()
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    '''
+    FileSystemStorage that names files by the hash of their contents and doesn't save a file again
+    if the same contents are already stored
+    '''
+
+    def get_available_name(self, name, max_length=None):
+        # the name is replaced with the content hash in _save(), and a file that already has that
+        # name has the same contents, so there is no need to look for an unused name
+        return name
+
+    def _save(self, name, content):
+        name = content_name(posixpath.dirname(name), content_digest(content), name)
+        full_path = self.path(name)
+        try:
+            # the file is reused, and touching it stops delete_unused() deleting it before the new Media object is saved
+            os.utime(full_path)
+            return name
+        except FileNotFoundError:
+            pass # not stored yet (or just deleted)
+
+        directory = os.path.dirname(full_path)
+        os.makedirs(directory, exist_ok=True)
+
+        # write to a temporary file first so a half-written file is never used. If the same file is
+        # being saved at the same time, whichever finishes last replaces an identical copy.
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as tmp_file, stage(STORE):
+                for chunk in content.chunks():
+                    tmp_file.write(chunk)
+            if self.file_permissions_mode is not None:
+                os.chmod(tmp_path, self.file_permissions_mode)
+            else:
+                os.chmod(tmp_path, 0o666 & ~UMASK) # mkstemp makes files only the owner can read
+            os.replace(tmp_path, full_path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        return name
+
+    def delete_unused(self, name, min_age, is_used):
+        '''
+        Deletes a file nothing uses any more, unless it was saved or reused in the last min_age seconds
+        :param name: name of the file in the storage
+        :param min_age: seconds since the file was last saved or reused (see _save()) before it can be deleted
+        :param is_used: function that says whether anything uses the file (called after it is moved out of the way)
+        :return: True if the file was deleted
+        '''
+        path = self.path(name)
+        moved_path = f'{path}.{uuid.uuid4().hex}.deleting'
+        try:
+            # from here on an upload of the same contents saves the file again instead of reusing this one
+            os.rename(path, moved_path)
+        except FileNotFoundError:
+            return False
+        try:
+            recent = os.path.getmtime(moved_path) > time.time() - min_age
+            if recent or is_used():
+                # put it back (if an upload saved the file again meanwhile, this replaces it with the same contents)
+                os.replace(moved_path, path)
+                return False
+        except BaseException:
+            os.replace(moved_path, path)
+            raise
+        os.remove(moved_path)
+        return True
+
+
+content_addressed_storage = ContentAddressedStorage()
@@ -1,3 +1,1256 @@
-from django.test import TestCase
+import asyncio
+import hashlib
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from pathlib import Path
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection, connections
+from django.http import HttpResponse
+from django.test import Client, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from PIL import Image, ImageCms
+from reportlab.lib.units import cm
+
+from scrapbooks import (archive, chunked_uploads, database, derivatives, garbage, jobs, metrics, offload, page_cache,
+                        pdf_cache, pdf_export, pdf_join)
+from scrapbooks.export_profiles import profiles
+from scrapbooks.models import Scrapbook, Media, OrphanedFile, PdfJob, UploadSession
+from scrapbooks.pdf_export import iter_media, render_scrapbook_pdf
+from scrapbooks.scrapbook_template_info import compile_theme, get_themes, load_themes
+from scrapbooks.theme_assets import get_theme_assets
+
+
+def small_jpeg(n):
+    '''
+    :param n: number to make each image different
+    :return: a small uploaded jpeg
+    '''
+    image_file = io.BytesIO()
+    Image.new('RGB', (32, 32), (n % 256, n // 256 % 256, 90)).save(image_file, 'JPEG')
+    return SimpleUploadedFile(f'photo{n}.jpg', image_file.getvalue(), content_type='image/jpeg')
+
+
+class ScrapbookFoldersMixin():
+    '''
+    Gives each test a new scrapbook (self.scrapbook) and its own MEDIA_ROOT & SCRAPBOOK_CACHE_ROOT
+    in a temporary folder (self.folder), which is deleted afterwards
+    Attributes:
+        SETTINGS (dict): other settings the tests of a class use
+        SCRAPBOOK_NAME (str): name of self.scrapbook
+        SCRAPBOOK_THEME (str): theme of self.scrapbook
+    '''
+
+    SETTINGS = {}
+    SCRAPBOOK_NAME = 'Holiday'
+    SCRAPBOOK_THEME = 'template1'
+
+    def setUp(self):
+        super().setUp()
+        self.folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.folder, ignore_errors=True)
+        self.media_root = self.folder + '/media'
+        settings_override = override_settings(MEDIA_ROOT=self.media_root, SCRAPBOOK_CACHE_ROOT=self.folder + '/cache',
+                                              **self.SETTINGS)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable) # after tearDown(), which can still need the settings
+        self.scrapbook = Scrapbook.create_scrapbook(self.SCRAPBOOK_NAME, self.SCRAPBOOK_THEME)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'checks SQLite connection settings')
+class ConcurrentUploadTests(ScrapbookFoldersMixin, TransactionTestCase):
+    '''
+    Many people uploading to the same scrapbook at once (e.g. at a family event) shouldn't get
+    "database is locked" errors
+    '''
+
+    SCRAPBOOK_NAME = 'Family reunion'
+    THREADS = 8
+    UPLOADS_PER_THREAD = 10
+
+    # the settings SQLite connections had before SQLITE_PRAGMAS (its defaults)
+    OLD_PRAGMAS = {'journal_mode': 'delete', 'synchronous': 'full'}
+
+    def tearDown(self):
+        offload.shutdown()
+
+    def upload_from_threads(self):
+        '''
+        Uploads images to the scrapbook from THREADS threads at once
+        :return: (uploads per second, list of errors)
+        '''
+        errors = []
+        url = f'/Scrapbook_project/{self.scrapbook.scrapbook_code}/'
+
+        def upload(thread_number):
+            client = Client()
+            for n in range(self.UPLOADS_PER_THREAD):
+                image = small_jpeg(thread_number * self.UPLOADS_PER_THREAD + n)
+                try:
+                    response = client.post(url, {'caption': f'photo {n}', 'image': image})
+                    if response.status_code != 200:
+                        errors.append(response.status_code)
+                except Exception as e:
+                    errors.append(repr(e))
+            connections.close_all()
+
+        # so the next connections get the current pragmas (the views' threads have their own connections)
+        connections.close_all()
+        offload.shutdown()
+        threads = [threading.Thread(target=upload, args=(n,)) for n in range(self.THREADS)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        return self.THREADS * self.UPLOADS_PER_THREAD / elapsed, errors
+
+    def test_concurrent_uploads(self):
+        with override_settings(SQLITE_PRAGMAS=self.OLD_PRAGMAS):
+            before, before_errors = self.upload_from_threads()
+        saved_before = Media.objects.count()
+        after, after_errors = self.upload_from_threads()
+
+        self.assertEqual(after_errors, [])
+        self.assertLessEqual(len(after_errors), len(before_errors))
+        # usually about 1.5 times as many uploads a second, but timing threads on a busy machine is noisy
+        self.assertGreater(after, before * 0.75)
+        self.assertEqual(Media.objects.count(), saved_before + self.THREADS * self.UPLOADS_PER_THREAD)
+
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            self.assertEqual(cursor.fetchone()[0], settings.SQLITE_PRAGMAS['journal_mode'])
+
+
+@skipUnless(connection.vendor == 'sqlite', 'checks SQLite connection settings')
+class SqlitePragmaTests(TestCase):
+    '''
+    New connections to the configured database should get SQLITE_PRAGMAS unless it is in SQLITE_KEEP_JOURNAL
+    '''
+
+    def pragmas(self):
+        '''
+        :return: (journal_mode, synchronous, busy_timeout) of a new connection to the test database
+        '''
+        new = connections.create_connection('default')
+        self.addCleanup(new.close)
+        with new.cursor() as cursor:
+            values = []
+            for pragma in ('journal_mode', 'synchronous', 'busy_timeout'):
+                cursor.execute(f'PRAGMA {pragma}')
+                values.append(cursor.fetchone()[0])
+        return tuple(values)
+
+    def test_configured_database(self):
+        self.assertEqual(settings.SQLITE_KEEP_JOURNAL, [])
+        self.assertEqual(self.pragmas(), ('wal', 1, 20000)) # synchronous 1 is NORMAL
+
+    def test_keep_journal(self):
+        with override_settings(SQLITE_KEEP_JOURNAL=[connection.settings_dict['NAME']]):
+            journal_mode, synchronous, busy_timeout = self.pragmas()
+        self.assertEqual(synchronous, 2) # SQLite's default, FULL
+        self.assertEqual(busy_timeout, 20000)
+
+
+class VectorRotationTests(ScrapbookFoldersMixin, TestCase):
+    '''
+    Images in tilted boxes should stay opaque when the pdf rotates them (PDF_VECTOR_ROTATION), and always
+    for jpeg profiles
+    '''
+
+    SETTINGS = {'PDF_IMAGE_WORKERS': 1}
+    SCRAPBOOK_NAME = 'Tilted photos' # every box in template1 is rotated
+
+    def setUp(self):
+        super().setUp()
+        for n in range(4):
+            Media(scrapbook=self.scrapbook, caption=f'photo {n}', image=small_jpeg(n)).save()
+
+    def render(self, vector_rotation, profile_name):
+        '''
+        :param vector_rotation: value of PDF_VECTOR_ROTATION
+        :param profile_name: name of the export profile
+        :return: the pdf
+        '''
+        output = io.BytesIO()
+        with override_settings(PDF_VECTOR_ROTATION=vector_rotation):
+            render_scrapbook_pdf(self.scrapbook, output, profiles[profile_name])
+        return output.getvalue()
+
+    def test_rotated_images_have_no_mask(self):
+        raster = self.render(False, 'print')
+        self.assertIn(b'/SMask', raster)
+        pdf = self.render(True, 'print')
+        self.assertNotIn(b'/SMask', pdf)
+        self.assertLess(len(pdf), len(raster))
+
+    def test_jpeg_profiles_always_rotate_in_the_pdf(self):
+        pdf = self.render(False, 'screen')
+        self.assertNotIn(b'/SMask', pdf)
+        self.assertEqual(pdf.count(b'/DCTDecode'), 5) # the photos (and the background) are still jpegs
+        self.assertEqual({path.suffix for path in derivatives.derivatives_root().glob('*/*')}, {'.jpg'})
+
+
+class ExportQueryTests(ScrapbookFoldersMixin, TestCase):
+    '''
+    Exports should get a scrapbook's media with one query however many photos it has
+    '''
+
+    SETTINGS = {'INGEST_NORMALIZE': False, 'PDF_IMAGE_WORKERS': 1}
+    SCRAPBOOK_NAME = 'Birthday'
+    SCRAPBOOK_THEME = 'template2'
+
+    def test_one_query(self):
+        for count in (1, 7):
+            for n in range(self.scrapbook.media_set.count(), count):
+                Media.objects.create(scrapbook=self.scrapbook, caption=f'cake {n}', image=small_jpeg(n))
+            output = io.BytesIO()
+            with self.assertNumQueries(1):
+                render_scrapbook_pdf(self.scrapbook, output, profiles['draft'])
+            self.assertEqual(output.getvalue()[:4], b'%PDF')
+        self.assertEqual([m.caption for m in iter_media(self.scrapbook)], [f'cake {n}' for n in range(7)])
+
+
+class PdfJoinTests(ScrapbookFoldersMixin, TestCase):
+    '''
+    Pages drawn as pdfs of their own should be joined into one pdf that has the background & title once
+    '''
+
+    SETTINGS = {'INGEST_NORMALIZE': False, 'PDF_IMAGE_WORKERS': 1}
+    SCRAPBOOK_THEME = 'template2'
+
+    def setUp(self):
+        super().setUp()
+        for n in range(7):
+            Media(scrapbook=self.scrapbook, caption=f'photo {n}', image=small_jpeg(n)).save()
+
+    def render(self):
+        '''
+        :return: the scrapbook as a draft pdf
+        '''
+        output = io.BytesIO()
+        render_scrapbook_pdf(self.scrapbook, output, profiles['draft'])
+        return output.getvalue()
+
+    def test_pages_share_the_chrome(self):
+        pdf = self.render()
+        part = pdf_join.PdfPart(pdf)
+        pages = part.pages()
+        self.assertEqual(len(pages), len(get_theme_assets('template2').theme.paginate(list(range(7)))))
+        # every page shows the same background & title form before its own drawing
+        self.assertEqual(len({page[b'/Contents'][0] for page in pages}), 1)
+        self.assertEqual(len({part.resolve(page[b'/Resources'])[b'/XObject'][b'/FormXob.page_chrome']
+                              for page in pages}), 1)
+        self.assertEqual(pdf.count(b'/DCTDecode'), 8) # the photos and the background once
+        self.assertNotIn(b'/ASCII85Decode', pdf) # taken off while joining
+        self.assertIn(pdf_join.text_string('Holiday'), pdf)
+
+    def test_pages_in_files(self):
+        pdf = self.render()
+        with override_settings(PDF_MEMORY_LIMIT_BYTES=1):
+            with mock.patch('tempfile.TemporaryDirectory', wraps=tempfile.TemporaryDirectory) as temporary_directory:
+                self.assertEqual(self.render(), pdf)
+        temporary_directory.assert_called_once()
+
+
+class PageCacheTests(ScrapbookFoldersMixin, TestCase):
+    '''
+    Exports should only draw the pages that changed since an earlier export, and give exactly the same pdf
+    as drawing every page
+    '''
+
+    SETTINGS = {'INGEST_NORMALIZE': False, 'PDF_IMAGE_WORKERS': 1}
+    SCRAPBOOK_NAME = 'Summer in Ålesund'
+
+    def setUp(self):
+        super().setUp()
+        for n in range(10): # 3 pages of template1
+            Media(scrapbook=self.scrapbook, caption=f'photo {n}', image=small_jpeg(n)).save()
+
+    def render(self, use_cache=True):
+        '''
+        :param use_cache: value of PDF_PAGE_CACHE
+        :return: (the pdf, number of pages drawn including the background & title)
+        '''
+        output = io.BytesIO()
+        with override_settings(PDF_PAGE_CACHE=use_cache), \
+                mock.patch('scrapbooks.pdf_export.draw_part', wraps=pdf_export.draw_part) as draw_part:
+            render_scrapbook_pdf(self.scrapbook, output, profiles['draft'])
+        return output.getvalue(), draw_part.call_count
+
+    def test_only_changed_pages_are_drawn(self):
+        pdf, drawn = self.render()
+        self.assertEqual(drawn, 4)
+        self.assertEqual(pdf, self.render(use_cache=False)[0])
+        self.assertEqual(self.render(), (pdf, 0))
+
+        # editing a caption only changes its page
+        media = self.scrapbook.media_set.order_by('id')[5]
+        media.caption = 'a new caption'
+        media.save()
+        with mock.patch('scrapbooks.pdf_export.iter_derivatives', wraps=pdf_export.iter_derivatives) as derivatives:
+            pdf, drawn = self.render()
+        self.assertEqual(drawn, 1)
+        self.assertEqual(len(derivatives.call_args.args[0]), 4) # only the images of that page are prepared
+        self.assertEqual(pdf, self.render(use_cache=False)[0])
+
+        # adding a photo only changes the last page
+        Media(scrapbook=self.scrapbook, caption='one more', image=small_jpeg(10)).save()
+        pdf, drawn = self.render()
+        self.assertEqual(drawn, 1)
+        self.assertEqual(pdf, self.render(use_cache=False)[0])
+
+    def test_evicted_page(self):
+        pdf, _ = self.render()
+        # a page deleted after the export saw it in the cache is drawn again
+        with mock.patch.object(page_cache, 'is_cached', return_value=True):
+            page_cache.page_path(self.scrapbook, page_cache.chrome_key(
+                get_theme_assets('template1').theme, profiles['draft'], self.SCRAPBOOK_NAME)).unlink()
+            next(page_cache.scrapbook_pages_dir(self.scrapbook).glob('*.pdf')).unlink()
+            self.assertEqual(self.render(), (pdf, 2))
+
+    def test_delete_pages(self):
+        self.render()
+        page_cache.delete_pages(self.scrapbook)
+        self.assertFalse(page_cache.scrapbook_pages_dir(self.scrapbook).exists())
+
+
+def noisy_jpeg(n, size=(600, 450)):
+    '''
+    :param n: number to make each image different
+    :param size: (width, height) of the image
+    :return: an uploaded jpeg that doesn't compress well (so the pdf is big)
+    '''
+    image_file = io.BytesIO()
+    Image.merge('RGB', [Image.effect_noise(size, 40 + n + channel) for channel in range(3)]).save(image_file, 'JPEG')
+    return SimpleUploadedFile(f'noise{n}.jpg', image_file.getvalue(), content_type='image/jpeg')
+
+
+class ImagePoolTests(ScrapbookFoldersMixin, TestCase):
+    '''
+    Derivatives made in the image pool should come back in order and be the same as ones made in-process
+    '''
+
+    SETTINGS = {'INGEST_NORMALIZE': False}
+    SCRAPBOOK_NAME = 'Beach'
+    SCRAPBOOK_THEME = 'template2'
+
+    def setUp(self):
+        super().setUp()
+        for n in range(6):
+            Media.objects.create(scrapbook=self.scrapbook, caption=f'wave {n}', image=noisy_jpeg(n, (200, 150)))
+
+    def tearDown(self):
+        derivatives.shutdown_image_pool()
+
+    def make_derivatives(self, workers):
+        '''
+        Makes the scrapbook's derivatives (deleting the cached ones first)
+        :param workers: value of PDF_IMAGE_WORKERS
+        :return: list of (media id, contents of the derivative file) in pdf order
+        '''
+        shutil.rmtree(derivatives.derivatives_root(), ignore_errors=True)
+        theme = get_themes()['template2']
+        media_slots = [slot_media for page in theme.paginate(list(iter_media(self.scrapbook))) for slot_media in page]
+        with override_settings(PDF_IMAGE_WORKERS=workers, PDF_POOL_MIN_IMAGES=2):
+            return [(m.pk, Path(image_file).read_bytes())
+                    for m, image_file in derivatives.iter_derivatives(media_slots, theme, profiles['screen'])]
+
+    def test_pool_matches_in_process(self):
+        in_process = self.make_derivatives(1)
+        with mock.patch.object(derivatives, 'get_image_pool', wraps=derivatives.get_image_pool) as get_image_pool:
+            pooled = self.make_derivatives(2)
+        self.assertTrue(get_image_pool.called)
+        self.assertEqual([media_id for media_id, _ in pooled], [m.pk for m in self.scrapbook.media_set.order_by('id')])
+        self.assertEqual(pooled, in_process)
+
+
+# exports a scrapbook in a new process and prints how much more its peak RSS was than its RSS before
+# the export (in KiB), so the memory used by C code (PIL's decoded images, zlib) is counted too
+EXPORT_RSS_SCRIPT = '''
+import sys
+import django
+django.setup()
+from django.test.utils import override_settings
+from scrapbooks.export_profiles import profiles
+from scrapbooks.models import Scrapbook
+from scrapbooks.pdf_export import render_scrapbook_pdf
+
+def memory(name):
+    with open('/proc/self/status') as status:
+        return next(int(line.split()[1]) for line in status if line.startswith(name + ':'))
+
+media_root, cache_root, scrapbook_id, pdf_path, profile, memory_limit = sys.argv[1:]
+with override_settings(MEDIA_ROOT=media_root, SCRAPBOOK_CACHE_ROOT=cache_root, PDF_IMAGE_WORKERS=1,
+                       PDF_MEMORY_LIMIT_BYTES=int(memory_limit)):
+    scrapbook = Scrapbook.objects.get(pk=scrapbook_id)
+    with open('/proc/self/clear_refs', 'w') as clear_refs:
+        clear_refs.write('5') # starts the peak RSS (VmHWM) again from the current RSS
+    before = memory('VmRSS')
+    with open(pdf_path, 'wb') as pdf_file:
+        render_scrapbook_pdf(scrapbook, pdf_file, profiles[profile])
+    print(memory('VmHWM') - before)
+'''
+
+
+@skipUnless(sys.platform.startswith('linux') and connection.vendor == 'sqlite', 'reads /proc & shares a database file')
+class ExportMemoryTests(ScrapbookFoldersMixin, TransactionTestCase):
+    '''
+    An export should only decode as much of each photo as the pdf needs, one at a time, and keep less
+    than PDF_MEMORY_LIMIT_BYTES of the pdf in memory
+    '''
+
+    SETTINGS = {'INGEST_NORMALIZE': False}
+    SCRAPBOOK_NAME = 'Lots of photos'
+    SCRAPBOOK_THEME = 'template2'
+
+    def add_photos(self, count, size=(600, 450)):
+        '''
+        :param count: number of photos to add to the scrapbook
+        :param size: (width, height) of each photo
+        '''
+        start = self.scrapbook.media_set.count()
+        for n in range(start, start + count):
+            Media(scrapbook=self.scrapbook, caption=f'photo {n}', image=noisy_jpeg(n, size)).save()
+
+    def export(self, profile, memory_limit):
+        '''
+        Exports the scrapbook in a new process
+        :param profile: name of the ExportProfile
+        :param memory_limit: PDF_MEMORY_LIMIT_BYTES of the export
+        :return: (how much the process's peak memory grew while exporting in bytes, size of the pdf)
+        '''
+        get_theme_assets(self.SCRAPBOOK_THEME).background(profiles[profile]) # made once, not by every export
+        pdf_path = self.folder + '/export.pdf'
+        environment = dict(os.environ, DJANGO_SETTINGS_MODULE='DigitalScrapbook.settings',
+                           DB_NAME=str(connection.settings_dict['NAME']))
+        result = subprocess.run([sys.executable, '-c', EXPORT_RSS_SCRIPT, settings.MEDIA_ROOT,
+                                 settings.SCRAPBOOK_CACHE_ROOT, str(self.scrapbook.pk), pdf_path, profile,
+                                 str(memory_limit)],
+                                cwd=settings.BASE_DIR, env=environment, capture_output=True, text=True, timeout=300)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        pdf = Path(pdf_path).read_bytes()
+        self.assertTrue(pdf.startswith(b'%PDF'))
+        return int(result.stdout.split()[-1]) * 1024, len(pdf)
+
+    def test_export_memory(self):
+        photo_size = (3000, 2000)
+        self.add_photos(8, photo_size)
+        growth, _ = self.export('screen', settings.PDF_MEMORY_LIMIT_BYTES)
+        # less than decoding a single photo at full size (as RGB, before it is even converted to RGBA)
+        self.assertLess(growth, photo_size[0] * photo_size[1] * 3)
+
+    def test_memory_limit(self):
+        memory_limit = 4 * 1024 * 1024
+        # a new process's first export also loads fonts & image codecs, a one page export shows how much
+        self.add_photos(4)
+        first_page_growth, _ = self.export('screen', memory_limit)
+
+        self.add_photos(86)
+        growth, pdf_size = self.export('screen', memory_limit)
+        # the pdf couldn't have been held in memory while it was written
+        self.assertGreater(pdf_size, 2 * memory_limit)
+        self.assertLess(growth - first_page_growth, memory_limit)
+
+
+class ThemeFileTests(TestCase):
+    '''
+    Theme files should be checked and compiled into layouts in points
+    '''
+
+    def setUp(self):
+        self.folder = Path(tempfile.mkdtemp())
+        self.info = {
+            'label': 'Two Layouts',
+            'background': str(Path(get_themes()['template1'].bg)),
+            'title': {'box': [1, 27, 19, 2], 'font': 'Helvetica', 'size': 30, 'align': 'center'},
+            'caption': {'font': 'Times-Roman', 'size': 10},
+            'pages': [
+                {'slots': [{'image': [1, 10, 19, 15], 'caption': [1, 7, 19, 2]}]}, # a big photo on the first page
+                {'slots': [{'image': [1, 15, 9, 9, 5], 'caption': [1, 12, 9, 2]},
+                           {'image': [11, 15, 9, 9, -5], 'caption': [11, 12, 9, 2]}]},
+            ],
+            'repeat_from': 1,
+        }
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def write(self, name='two_layouts'):
+        path = self.folder / f'{name}.json'
+        path.write_text(json.dumps(self.info))
+        return path
+
+    def test_compiled_layouts(self):
+        theme = compile_theme(self.write())
+        self.assertEqual(theme.name, 'two_layouts')
+        self.assertEqual(theme.title_align, 1)
+        self.assertEqual(theme.caption_align, 0)
+        self.assertAlmostEqual(theme.slots[1].image.x, 1 * cm)
+        self.assertAlmostEqual(theme.slots[2].image.width, 9 * cm)
+        self.assertEqual(theme.slots[2].image.rotation, -5)
+
+        # one photo on the first page, then two on every page
+        pages = theme.paginate(list('abcdef'))
+        self.assertEqual(pages, [[(0, 'a')], [(1, 'b'), (2, 'c')], [(1, 'd'), (2, 'e')], [(1, 'f')]])
+        self.assertEqual(theme.paginate([]), [[]]) # still a page for the title
+
+    def test_themes_from_every_folder(self):
+        self.write()
+        with override_settings(SCRAPBOOK_THEME_DIRS=[Path(settings.BASE_DIR) / 'scrapbooks' / 'themes', self.folder]):
+            loaded = load_themes()
+        self.assertEqual(list(loaded), ['template1', 'template2', 'two_layouts'])
+        with self.assertRaises(TypeError):
+            loaded['template3'] = loaded['template1'] # read only
+
+        # the themes the app uses are only loaded once
+        self.assertIs(get_themes(), get_themes())
+        self.assertEqual(list(get_themes()), ['template1', 'template2'])
+
+    def test_mistakes_are_reported(self):
+        mistakes = [
+            ('pages', []),
+            ('repeat_from', 2),
+            ('title', {'box': [1, 27, 19], 'font': 'Helvetica', 'size': 30}),
+            ('title', {'box': [1, 27, 19, 2], 'font': 'Not_A_Font', 'size': 30}),
+            ('caption', {'font': 'Helvetica', 'size': 10, 'align': 'middle'}),
+            ('caption', {'font': 'Helvetica', 'size': 10, 'colour': 'red'}),
+            ('background', 'static/no_such_background.png'),
+        ]
+        for key, value in mistakes:
+            with self.subTest(key=key, value=value):
+                good_value = self.info[key]
+                self.info[key] = value
+                with self.assertRaises(ImproperlyConfigured):
+                    compile_theme(self.write())
+                self.info[key] = good_value
+
+
+class ExportScrapbooksTests(ScrapbookFoldersMixin, TestCase):
+    '''
+    export_scrapbooks should export the scrapbooks it is asked for and skip pdfs that are up to date
+    '''
+
+    SETTINGS = {'PDF_IMAGE_WORKERS': 1}
+
+    def setUp(self):
+        super().setUp()
+        self.output = Path(self.folder) / 'archive'
+        Media(scrapbook=self.scrapbook, caption='beach', image=small_jpeg(1)).save()
+        self.other = Scrapbook.create_scrapbook('Birthday', 'template2')
+        Media(scrapbook=self.other, caption='cake', image=small_jpeg(2)).save()
+
+    def export(self, *args):
+        '''
+        :return: the command's output
+        '''
+        out = io.StringIO()
+        call_command('export_scrapbooks', *args, '--output', str(self.output), '--workers', '1',
+                     '--profile', 'draft', stdout=out)
+        return out.getvalue()
+
+    def test_only_changed_scrapbooks_are_exported_again(self):
+        code = self.scrapbook.scrapbook_code
+        self.assertIn('1 exported, 0 up to date', self.export(code))
+        pdf_path = self.output / f'{code}-draft.pdf'
+        self.assertTrue(pdf_path.read_bytes().startswith(b'%PDF'))
+        self.assertTrue((self.output / f'{code}-draft.revision').is_file())
+        self.assertEqual([path.name for path in self.output.glob('*.tmp')], [])
+
+        modified = pdf_path.stat().st_mtime_ns
+        self.assertIn('0 exported, 1 up to date', self.export(code))
+        self.assertEqual(pdf_path.stat().st_mtime_ns, modified)
+
+        # a new caption or image (e.g. from normalize_media) changes the revision, but only updated_at changing doesn't
+        Media.objects.filter(scrapbook=self.scrapbook).update(caption='sea')
+        self.assertIn('1 exported, 0 up to date', self.export(code))
+        Media.objects.filter(scrapbook=self.scrapbook).update(image=Media.objects.get(scrapbook=self.other).image.name)
+        self.assertIn('1 exported, 0 up to date', self.export(code))
+        Scrapbook.mark_updated(self.scrapbook.pk)
+        self.assertIn('0 exported, 1 up to date', self.export(code))
+        self.assertIn('1 exported, 0 up to date', self.export(code, '--force'))
+
+    def test_pool_processes_prepare_their_own_images(self):
+        for n in range(3, 3 + settings.PDF_POOL_MIN_IMAGES):
+            Media(scrapbook=self.scrapbook, caption=f'wave {n}', image=small_jpeg(n)).save()
+        self.output.mkdir()
+        with override_settings(PDF_IMAGE_WORKERS=4), mock.patch('scrapbooks.derivatives.get_image_pool') as pool, \
+                mock.patch('scrapbooks.archive.close_old_connections'): # it would close the test's connection
+            result = archive._export_in_worker(self.scrapbook.pk, 'draft', str(self.output), False)
+        self.assertEqual(result.status, archive.EXPORTED, result.error)
+        pool.assert_not_called() # image_workers=1, whatever PDF_IMAGE_WORKERS is
+
+    def test_media_changes_update_the_scrapbook(self):
+        before = Scrapbook.objects.get(pk=self.scrapbook.pk).updated_at
+        media = Media(scrapbook=self.scrapbook, caption='sunset', image=small_jpeg(3))
+        media.save()
+        added = Scrapbook.objects.get(pk=self.scrapbook.pk).updated_at
+        self.assertGreater(added, before)
+        media.delete()
+        self.assertGreater(Scrapbook.objects.get(pk=self.scrapbook.pk).updated_at, added)
+
+    def test_since(self):
+        Scrapbook.objects.filter(pk=self.other.pk).update(updated_at=timezone.now() - timedelta(days=3))
+        self.assertIn('1 scrapbook(s)', self.export('--since', '1d'))
+        self.assertTrue((self.output / f'{self.scrapbook.scrapbook_code}-draft.pdf').is_file())
+        self.assertFalse((self.output / f'{self.other.scrapbook_code}-draft.pdf').exists())
+        self.assertIn('1 scrapbook(s)', self.export('--until', '1d'))
+        self.assertTrue((self.output / f'{self.other.scrapbook_code}-draft.pdf').is_file())
+
+
+class PdfDownloadTests(ScrapbookFoldersMixin, TransactionTestCase):
+    '''
+    Browsers should only download a scrapbook's pdf again when the scrapbook has changed
+    (a TransactionTestCase because the view reads the database from its own threads, see offload.py)
+    '''
+
+    SETTINGS = {'INGEST_NORMALIZE': False, 'PDF_IMAGE_WORKERS': 1}
+    SCRAPBOOK_NAME = 'Graduation'
+    SCRAPBOOK_THEME = 'template2'
+
+    def setUp(self):
+        super().setUp()
+        self.media = Media.objects.create(scrapbook=self.scrapbook, caption='caps', image=small_jpeg(1))
+        self.url = f'/Scrapbook_project/{self.scrapbook.scrapbook_code}/'
+
+    def tearDown(self):
+        offload.shutdown()
+
+    def test_etag(self):
+        client = Client()
+        response = client.get(self.url + 'save/?profile=draft')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming) # sent from the cached file in chunks
+        self.assertEqual(b''.join(response.streaming_content)[:4], b'%PDF')
+        self.assertEqual(response['Cache-Control'], 'no-cache')
+        etag = response['ETag']
+        self.assertTrue(etag.endswith('-draft"'))
+
+        response = client.get(self.url + 'save/?profile=draft', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+        # a new caption is a new pdf
+        client.post(self.url + f'{self.media.pk}/', {'caption': 'caps in the air'})
+        response = client.get(self.url + 'save/?profile=draft', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        response.close()
+
+    def test_unknown_profile(self):
+        response = Client().get(self.url + 'save/?profile=poster')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn(b'Unknown profile', response.content)
+
+
+class PdfCacheTests(ScrapbookFoldersMixin, TestCase):
+    '''
+    Edits should only delete cached pdfs of older revisions, and pdfs stored at the same time shouldn't fail
+    '''
+
+    SETTINGS = {'INGEST_NORMALIZE': False}
+
+    def store(self, render=lambda pdf_file: pdf_file.write(b'%PDF')):
+        '''
+        :return: path of the cached pdf of the scrapbook's current revision
+        '''
+        revision = pdf_cache.scrapbook_revision(self.scrapbook)
+        return pdf_cache.store_pdf(self.scrapbook, revision, profiles['draft'], render)
+
+    def test_invalidate(self):
+        Media.objects.create(scrapbook=self.scrapbook, caption='cake', image=small_jpeg(1))
+        old_path = self.store()
+        self.scrapbook.media_set.update(caption='more cake')
+        current_path = self.store() # e.g. an export that started after the edit
+        pdf_cache.invalidate(self.scrapbook)
+        self.assertFalse(os.path.exists(old_path))
+        self.assertTrue(os.path.exists(current_path))
+
+        pdf_cache.invalidate(self.scrapbook, deleted=True)
+        self.assertFalse(pdf_cache.scrapbook_cache_dir(self.scrapbook).exists())
+
+    def test_store_while_invalidated(self):
+        def render(pdf_file):
+            pdf_file.write(b'%PDF')
+            pdf_cache.invalidate(self.scrapbook, deleted=True) # removes the folder while the pdf is rendered
+
+        path = self.store(render)
+        with open(path, 'rb') as pdf_file:
+            self.assertEqual(pdf_file.read(), b'%PDF')
+        self.assertEqual([path.name for path in pdf_cache.pdf_cache_root().glob('*.tmp')], [])
+
+
+class PdfJobTests(ScrapbookFoldersMixin, TestCase):
+    '''
+    Background pdf jobs should render into the pdf cache and not show users what went wrong inside the server
+    '''
+
+    SETTINGS = {'PDF_IMAGE_WORKERS': 1}
+    SCRAPBOOK_NAME = 'Wedding'
+    SCRAPBOOK_THEME = 'template2'
+
+    def setUp(self):
+        super().setUp()
+        Media(scrapbook=self.scrapbook, caption='first dance', image=small_jpeg(1)).save()
+
+    def test_job_renders_the_pdf(self):
+        job = jobs.enqueue(self.scrapbook, profiles['draft'])
+        self.assertEqual(jobs.enqueue(self.scrapbook, profiles['draft']), job) # the same revision isn't queued twice
+        jobs.run_job(jobs.claim_next_job())
+        job.refresh_from_db()
+        self.assertEqual(job.status, PdfJob.DONE)
+        with open(job.pdf_path, 'rb') as pdf_file:
+            self.assertEqual(pdf_file.read(4), b'%PDF')
+
+        response = Client().get(f'/Scrapbook_project/{self.scrapbook.scrapbook_code}/save/{job.job_id}/download/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['ETag'], f'"{job.revision}-draft"')
+
+    def test_failed_job_hides_the_error(self):
+        job = jobs.enqueue(self.scrapbook, profiles['draft'])
+        with mock.patch.object(jobs, 'render_scrapbook_pdf', side_effect=OSError('/srv/secret/cache/1.pdf')), \
+                self.assertLogs('scrapbooks.jobs', 'ERROR') as logs:
+            jobs.run_job(jobs.claim_next_job())
+        self.assertIn('/srv/secret/cache/1.pdf', '\n'.join(logs.output))
+
+        response = Client().get(f'/Scrapbook_project/{self.scrapbook.scrapbook_code}/save/{job.job_id}/')
+        self.assertEqual(response.json()['status'], PdfJob.FAILED)
+        self.assertEqual(response.json()['error'], jobs.JOB_FAILED_MESSAGE)
+
+    def test_pool_starts_again_after_stopping(self):
+        pool = jobs.WorkerPool(1, poll_interval=60)
+        pool.start()
+        pool.stop()
+        pool.start()
+        try:
+            time.sleep(0.2)
+            self.assertTrue(pool._threads and all(thread.is_alive() for thread in pool._threads))
+        finally:
+            pool.stop()
+
+
+class ChunkedUploadTests(ScrapbookFoldersMixin, TestCase):
+    '''
+    Resumable uploads should only take the chunk that comes next and check the whole file when they are finished
+    '''
+
+    SCRAPBOOK_NAME = 'Graduation'
+
+    def setUp(self):
+        super().setUp()
+        self.url = f'/Scrapbook_project/{self.scrapbook.scrapbook_code}/uploads/'
+        self.data = small_jpeg(7).read()
+        self.client = Client()
+
+    def start(self):
+        '''
+        :return: the upload details json
+        '''
+        response = self.client.post(self.url, {'file_name': 'diploma.jpg', 'size': len(self.data), 'caption': 'done!'})
+        self.assertEqual(response.status_code, 201)
+        return response.json()
+
+    def put(self, upload, offset, data):
+        return self.client.put(f'{upload["upload_url"]}?offset={offset}', data, content_type='application/octet-stream')
+
+    def test_upload_in_chunks(self):
+        upload = self.start()
+        half = len(self.data) // 2
+        self.assertEqual(self.put(upload, 0, self.data[:half]).json()['offset'], half)
+
+        # a chunk sent again (e.g. the response was lost) or out of order is refused with where to carry on from
+        response = self.put(upload, 0, self.data[:half])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['offset'], half)
+        self.assertEqual(self.client.post(upload['finalize_url']).status_code, 409) # not everything has arrived
+
+        self.assertEqual(self.put(upload, half, self.data[half:]).json()['offset'], len(self.data))
+        response = self.client.post(upload['finalize_url'], {'sha256': '0' * 64})
+        self.assertEqual(response.status_code, 400)
+
+        checksum = hashlib.sha256(self.data).hexdigest()
+        response = self.client.post(upload['finalize_url'], {'sha256': checksum})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['sha256'], checksum)
+        media = Media.objects.get(pk=response.json()['media_id'])
+        self.assertEqual(media.caption, 'done!')
+        self.assertTrue(os.path.isfile(media.image.path))
+        self.assertFalse(UploadSession.objects.exists())
+        self.assertEqual(os.listdir(chunked_uploads.partial_uploads_root()), [])
+
+    def test_checksum_of_chunks_from_other_processes(self):
+        upload = self.start()
+        upload_id = UploadSession.objects.get().upload_id
+        third = len(self.data) // 3
+        self.put(upload, 0, self.data[:third])
+        self.assertEqual(chunked_uploads._hashers[upload_id][1], third) # worked out as the chunk was written
+        chunked_uploads._hashers.clear() # the next chunk goes to another process
+        self.put(upload, third, self.data[third:2 * third])
+        self.put(upload, 2 * third, self.data[2 * third:])
+
+        checksum = hashlib.sha256(self.data).hexdigest()
+        with mock.patch('scrapbooks.chunked_uploads.image_dimensions') as image_dimensions:
+            response = self.client.post(upload['finalize_url'], {'sha256': checksum})
+        self.assertEqual(response.status_code, 201)
+        image_dimensions.assert_not_called() # prepare_image() got the size when it opened it
+        media = Media.objects.get(pk=response.json()['media_id'])
+        self.assertEqual((media.image_width, media.image_height), (32, 32))
+        self.assertNotIn(upload_id, chunked_uploads._hashers)
+
+    def test_chunk_saved_at_the_same_time(self):
+        upload = self.start()
+        session = UploadSession.objects.get()
+        half = len(self.data) // 2
+
+        class OtherRequestStream(io.BytesIO):
+            # another request (e.g. on a server that doesn't share the file lock) saves the chunk first
+            def read(stream, size=-1):
+                UploadSession.objects.filter(pk=session.pk).update(received=half)
+                return super().read(size)
+
+        with self.assertRaises(chunked_uploads.ChunkError) as raised:
+            chunked_uploads.append_chunk(session, 0, OtherRequestStream(self.data[:half]), half)
+        self.assertEqual(raised.exception.status, 409)
+        self.assertEqual(UploadSession.objects.get().received, half) # counted once
+
+        self.assertEqual(self.put(upload, half, self.data[half:]).json()['offset'], len(self.data))
+        self.assertEqual(self.client.post(upload['finalize_url']).status_code, 201)
+        self.assertEqual(self.put(upload, 0, self.data[:half]).status_code, 404) # it has been finished
+
+    def test_abandoned_uploads_are_collected(self):
+        upload = self.start()
+        self.put(upload, 0, self.data[:10])
+        UploadSession.objects.update(updated=timezone.now() - timedelta(seconds=settings.CHUNKED_UPLOAD_EXPIRE_SECONDS + 1))
+        call_command('collect_garbage', stdout=io.StringIO())
+        self.assertFalse(UploadSession.objects.exists())
+        self.assertEqual(os.listdir(chunked_uploads.partial_uploads_root()), [])
+
+
+class BulkUploadTests(ScrapbookFoldersMixin, TestCase):
+    '''
+    Many images should be uploaded in one request, with a result for each file
+    '''
+
+    SETTINGS = {'INGEST_NORMALIZE': False}
+    SCRAPBOOK_NAME = 'Road trip'
+
+    def setUp(self):
+        super().setUp()
+        self.url = f'/Scrapbook_project/{self.scrapbook.scrapbook_code}/upload/'
+
+    def test_bulk_upload(self):
+        not_an_image = SimpleUploadedFile('notes.jpg', b'not a jpeg', content_type='image/jpeg')
+        response = Client().post(self.url, {'images': [small_jpeg(1), not_an_image, small_jpeg(2)],
+                                            'captions': ['desert', 'notes', 'canyon']})
+        self.assertEqual(response.status_code, 201)
+        details = response.json()
+        self.assertEqual(details['created'], 2)
+        self.assertEqual([result['ok'] for result in details['results']], [True, False, True])
+        self.assertTrue(details['results'][1]['errors'])
+
+        media = list(self.scrapbook.media_set.order_by('id'))
+        self.assertEqual([m.caption for m in media], ['desert', 'canyon'])
+        self.assertEqual([details['results'][0]['media_id'], details['results'][2]['media_id']], [m.pk for m in media])
+
+    def test_nothing_valid(self):
+        response = Client().post(self.url, {'images': [SimpleUploadedFile('a.jpg', b'nope')]})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Client().post(self.url, {}).status_code, 400)
+        self.assertEqual(Client().get(self.url).status_code, 405)
+
+    def test_limits(self):
+        with override_settings(BULK_UPLOAD_MAX_FILES=2):
+            response = Client().post(self.url, {'images': [small_jpeg(n) for n in range(3)]})
+        self.assertEqual(response.status_code, 413)
+        with override_settings(BULK_UPLOAD_MAX_BYTES=100):
+            response = Client().post(self.url, {'images': [small_jpeg(1)]})
+        self.assertEqual(response.status_code, 413)
+        self.assertFalse(self.scrapbook.media_set.exists())
+
+
+class MediaPageTests(ScrapbookFoldersMixin, TransactionTestCase):
+    '''
+    Scrapbook pages should show a page of media at a time, each page starting after the last media id of the one before
+    (a TransactionTestCase because the page is made in another thread, see offload.py)
+    '''
+
+    SETTINGS = {'INGEST_NORMALIZE': False, 'MEDIA_PAGE_SIZE': 2}
+    SCRAPBOOK_NAME = 'Camping'
+
+    def setUp(self):
+        super().setUp()
+        self.media = [Media.objects.create(scrapbook=self.scrapbook, caption=f'tent {n}', image=small_jpeg(n))
+                      for n in range(5)]
+        self.url = f'/Scrapbook_project/{self.scrapbook.scrapbook_code}/'
+
+    def tearDown(self):
+        offload.shutdown()
+
+    def test_pages(self):
+        response = Client().get(self.url)
+        self.assertEqual([m.caption for m in response.context['scrapbook_media']], ['tent 0', 'tent 1'])
+        self.assertEqual(response.context['next_after'], self.media[1].pk)
+        self.assertContains(response, f'media/?after={self.media[1].pk}')
+
+        # the rows loaded by "Show more"
+        response = Client().get(self.url + f'media/?after={self.media[1].pk}')
+        self.assertEqual([m.caption for m in response.context['scrapbook_media']], ['tent 2', 'tent 3'])
+        self.assertContains(response, 'tent 3')
+        self.assertNotContains(response, 'tent 1')
+
+        # deleting media on an earlier page doesn't move the later ones
+        self.media[0].delete()
+        response = Client().get(self.url + f'?after={self.media[3].pk}')
+        self.assertEqual([m.caption for m in response.context['scrapbook_media']], ['tent 4'])
+        self.assertIsNone(response.context['next_after'])
+        self.assertNotContains(response, 'Show more')
+
+    def test_bad_after(self):
+        self.assertEqual(Client().get(self.url + '?after=-1').status_code, 400)
+        self.assertEqual(Client().get(self.url + 'media/?after=abc').status_code, 400)
+
+
+class ContentAddressedStorageTests(ScrapbookFoldersMixin, TestCase):
+    '''
+    Identical uploads should share one file, which is only deleted once nothing uses it, even if the
+    same photo is being uploaded while it is deleted
+    '''
+
+    SETTINGS = {'INGEST_NORMALIZE': False}
+    SCRAPBOOK_NAME = 'Reunion'
+
+    def setUp(self):
+        super().setUp()
+        self.storage = Media._meta.get_field('image').storage
+
+    def test_identical_uploads_share_a_file(self):
+        first = Media.objects.create(scrapbook=self.scrapbook, caption='a', image=small_jpeg(1))
+        second = Media.objects.create(scrapbook=self.scrapbook, caption='b', image=small_jpeg(1))
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertRegex(first.image.name, r'^images/[0-9a-f]{2}/[0-9a-f]{64}\.jpg$')
+
+        first.delete()
+        self.assertFalse(OrphanedFile.objects.exists()) # second still uses it
+        second.delete()
+        self.assertEqual(garbage.collect(min_age=0), (1, 0))
+        self.assertFalse(os.path.exists(second.image.path))
+        self.assertFalse(OrphanedFile.objects.exists())
+
+    def test_recently_reused_file_is_kept(self):
+        media = Media.objects.create(scrapbook=self.scrapbook, caption='a', image=small_jpeg(1))
+        media.delete()
+        # an upload of the same photo has reused the file but its Media object isn't saved yet
+        self.assertEqual(self.storage.save('images/again.jpg', small_jpeg(1)), media.image.name)
+        self.assertEqual(garbage.collect(min_age=60), (0, 0))
+        self.assertTrue(os.path.isfile(media.image.path))
+        self.assertTrue(OrphanedFile.objects.exists()) # tried again next time
+
+        Media.objects.create(scrapbook=self.scrapbook, caption='b', image=media.image.name)
+        self.assertEqual(garbage.collect(min_age=0), (0, 1))
+        self.assertTrue(os.path.isfile(media.image.path))
+
+    def test_upload_while_deleting_keeps_the_file(self):
+        media = Media.objects.create(scrapbook=self.scrapbook, caption='a', image=small_jpeg(1))
+
+        def upload_same_photo():
+            # runs after the file has been moved out of the way, like an upload at just the wrong moment
+            self.storage.save('images/again.jpg', small_jpeg(1))
+            return False # its Media object isn't saved yet
+
+        self.storage.delete_unused(media.image.name, 0, upload_same_photo)
+        self.assertTrue(os.path.isfile(media.image.path))
+        self.assertEqual([name for name in os.listdir(os.path.dirname(media.image.path)) if 'deleting' in name], [])
+
+    def test_dedupe_media(self):
+        data = small_jpeg(3).read()
+        for name in ('images/beach.jpg', 'images/beach_copy.jpg'):
+            os.makedirs(os.path.join(self.media_root, 'images'), exist_ok=True)
+            with open(os.path.join(self.media_root, name), 'wb') as image_file:
+                image_file.write(data)
+            Media.objects.create(scrapbook=self.scrapbook, caption=name, image=name)
+
+        out = io.StringIO()
+        call_command('dedupe_media', stdout=out)
+        self.assertIn('1 file(s) renamed, 1 duplicate(s) removed', out.getvalue())
+        names = set(Media.objects.values_list('image', flat=True))
+        self.assertEqual(len(names), 1)
+        self.assertTrue(self.storage.exists(names.pop()))
+        self.assertEqual(os.listdir(os.path.join(self.media_root, 'images')), [hashlib.sha256(data).hexdigest()[:2]])
+
+
+class GarbageCollectionTests(ScrapbookFoldersMixin, TestCase):
+    '''
+    Deleting a scrapbook should be one quick query, with its files deleted in batches by collect_garbage
+    '''
+
+    SETTINGS = {'INGEST_NORMALIZE': False}
+    SCRAPBOOK_NAME = 'Camping trip'
+
+    def setUp(self):
+        super().setUp()
+        self.media = [Media.objects.create(scrapbook=self.scrapbook, caption=str(n), image=small_jpeg(n))
+                      for n in range(5)]
+
+    def test_delete_scrapbook_then_collect(self):
+        # another scrapbook has the same photo as the first one
+        other = Scrapbook.create_scrapbook('Camping trip (copy)')
+        shared = Media.objects.create(scrapbook=other, caption='copy', image=small_jpeg(0))
+
+        # the same number of queries however many photos the scrapbook has
+        with self.assertNumQueries(9):
+            response = Client().get(f'/Scrapbook_project/{self.scrapbook.scrapbook_code}/delete/')
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(Scrapbook.objects.filter(pk=self.scrapbook.pk).exists())
+        self.assertEqual(OrphanedFile.objects.count(), 5)
+        self.assertTrue(all(os.path.isfile(media.image.path) for media in self.media)) # not deleted yet
+
+        out = io.StringIO()
+        call_command('collect_garbage', '--batch-size', '2', '--min-age', '0', stdout=out)
+        self.assertIn('deleted 4 file(s), kept 1 that are used again', out.getvalue())
+        self.assertFalse(OrphanedFile.objects.exists())
+        self.assertEqual([os.path.isfile(media.image.path) for media in self.media], [True] + [False] * 4)
+        self.assertTrue(os.path.isfile(shared.image.path))
+
+    def test_reconcile_finds_leftover_files(self):
+        # e.g. left by a server that stopped between saving an upload and saving its Media object
+        data = small_jpeg(99).read()
+        checksum = hashlib.sha256(data).hexdigest()
+        leftover = os.path.join(self.media_root, 'images', checksum[:2], f'{checksum}.jpg')
+        os.makedirs(os.path.dirname(leftover), exist_ok=True)
+        with open(leftover, 'wb') as image_file:
+            image_file.write(data)
+        self.assertEqual(garbage.reconcile(min_age=30), 0) # it might still be getting saved
+
+        old = time.time() - 60
+        os.utime(leftover, (old, old))
+        self.assertEqual(garbage.reconcile(min_age=30), 1)
+        self.assertEqual(garbage.collect(min_age=30), (1, 0))
+        self.assertFalse(os.path.exists(leftover))
+        self.assertTrue(all(os.path.isfile(media.image.path) for media in self.media))
+
+
+class ThumbnailTests(ScrapbookFoldersMixin, TestCase):
+    '''
+    Thumbnails should be made in the cache folder and only kept by browsers while their url has the current image
+    '''
+
+    SETTINGS = {'INGEST_NORMALIZE': False}
+    SCRAPBOOK_NAME = 'Garden'
+
+    def setUp(self):
+        super().setUp()
+        self.media = Media.objects.create(scrapbook=self.scrapbook, caption='roses', image=small_jpeg(1))
+
+    def test_thumbnail(self):
+        response = Client().get(self.media.thumbnail_url(100), HTTP_ACCEPT='image/webp,*/*')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/webp')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000')
+        self.assertIn('Accept', response['Vary'])
+        with Image.open(io.BytesIO(b''.join(response.streaming_content))) as thumbnail:
+            self.assertEqual(thumbnail.size, (32, 32)) # smaller photos aren't made bigger
+        self.assertTrue((Path(self.folder) / 'cache' / 'thumbnails' / str(self.media.pk) / '100.webp').is_file())
+        self.assertEqual(os.listdir(Path(self.folder) / 'media'), ['images'])
+
+        self.assertEqual(Client().get(self.media.thumbnail_url(100)).status_code, 200)
+        self.assertEqual(Client().get(self.media.thumbnail_url(100).replace('/100/', '/150/')).status_code, 404)
+
+    def test_replaced_image_changes_the_url(self):
+        old_url = self.media.thumbnail_url()
+        self.media.image = small_jpeg(2)
+        self.media.save()
+        self.assertNotEqual(self.media.thumbnail_url(), old_url)
+        self.assertEqual(Client().get(old_url)['Cache-Control'], 'no-cache')
+
+
+class IngestTests(ScrapbookFoldersMixin, TestCase):
+    '''
+    New uploads should be turned the right way up and keep their colour profile but not their other metadata
+    '''
+
+    SETTINGS = {'INGEST_NORMALIZE': True, 'INGEST_ARCHIVE_ORIGINALS': False}
+    SCRAPBOOK_NAME = 'Road trip'
+
+    def sideways_jpeg(self):
+        '''
+        :return: uploaded 40x20 jpeg, red on the left & blue on the right, with an EXIF tag saying it
+        has to be turned 90 degrees clockwise (orientation 6) and an sRGB colour profile
+        '''
+        image_data = Image.new('RGB', (40, 20), (0, 0, 255))
+        image_data.paste((255, 0, 0), (0, 0, 20, 20))
+        exif = Image.Exif()
+        exif[0x0112] = 6
+        self.icc_profile = ImageCms.ImageCmsProfile(ImageCms.createProfile('sRGB')).tobytes()
+        image_file = io.BytesIO()
+        image_data.save(image_file, 'JPEG', quality=95, exif=exif.tobytes(), icc_profile=self.icc_profile)
+        return SimpleUploadedFile('phone.jpg', image_file.getvalue(), content_type='image/jpeg')
+
+    def test_exif_orientation(self):
+        media = Media.objects.create(scrapbook=self.scrapbook, caption='canyon', image=self.sideways_jpeg())
+        self.assertEqual((media.image_width, media.image_height), (20, 40))
+        with Image.open(media.image.path) as image_data:
+            self.assertEqual(image_data.size, (20, 40))
+            self.assertNotIn(0x0112, image_data.getexif())
+            # the left of the photo is now the top
+            top, bottom = image_data.getpixel((10, 5)), image_data.getpixel((10, 35))
+        self.assertGreater(top[0], 200)
+        self.assertLess(top[2], 60)
+        self.assertGreater(bottom[2], 200)
+        self.assertLess(bottom[0], 60)
+
+    def test_icc_profile_is_kept(self):
+        media = Media.objects.create(scrapbook=self.scrapbook, caption='desert', image=self.sideways_jpeg())
+        with Image.open(media.image.path) as image_data:
+            self.assertEqual(image_data.info.get('icc_profile'), self.icc_profile)
+            self.assertNotIn('exif', image_data.info)
+
+
+class NormalizeMediaTests(ScrapbookFoldersMixin, TestCase):
+    '''
+    normalize_media should replace images that new uploads would have changed, and everything made from them
+    '''
+
+    SETTINGS = {'INGEST_NORMALIZE': False}
+    SCRAPBOOK_NAME = 'Old photos'
+
+    def setUp(self):
+        super().setUp()
+        self.media = Media.objects.create(scrapbook=self.scrapbook, caption='1998', image=small_jpeg(1))
+
+    def normalize(self, *args):
+        '''
+        :return: the command's output
+        '''
+        out = io.StringIO()
+        with override_settings(INGEST_MAX_DIMENSION=16):
+            call_command('normalize_media', *args, stdout=out)
+        return out.getvalue()
+
+    def test_dry_run(self):
+        self.assertIn('dry run: 1 image(s) normalized', self.normalize('--dry-run'))
+        self.assertEqual(Media.objects.get(pk=self.media.pk).image.name, self.media.image.name)
+
+    def test_normalize(self):
+        revision = pdf_cache.scrapbook_revision(self.scrapbook)
+        thumbnail_url = self.media.thumbnail_url()
+
+        self.assertIn('1 image(s) normalized, 0 skipped', self.normalize())
+        media = Media.objects.get(pk=self.media.pk)
+        self.assertNotEqual(media.image.name, self.media.image.name)
+        self.assertEqual((media.image_width, media.image_height), (16, 16))
+        self.assertNotEqual(pdf_cache.scrapbook_revision(self.scrapbook), revision)
+        self.assertNotEqual(media.thumbnail_url(), thumbnail_url)
+        # the old file is deleted by collect_garbage
+        self.assertEqual(list(OrphanedFile.objects.values_list('image', flat=True)), [self.media.image.name])
+
+        self.assertIn('0 image(s) normalized', self.normalize()) # it is already small enough
+
+
+class CommandSmokeTests(ScrapbookFoldersMixin, TransactionTestCase):
+    '''
+    The benchmark commands should run on a migrated database with small arguments
+    (a TransactionTestCase because load_test sends its requests from other threads)
+    '''
+
+    SETTINGS = {'INGEST_NORMALIZE': False}
+
+    def tearDown(self):
+        offload.shutdown()
+
+    def run_command(self, *args):
+        '''
+        :return: the command's output
+        '''
+        out = io.StringIO()
+        call_command(*args, stdout=out)
+        return out.getvalue()
+
+    def test_seed_and_load_test(self):
+        with self.assertRaises(CommandError):
+            self.run_command('load_test', '--requests', '1')
+
+        output = self.run_command('seed_synthetic', '--scrapbooks', '3', '--media', '2', '--files', '2',
+                                  '--size', '32x24', '--seed', '1')
+        self.assertIn('added 3 scrapbooks', output)
+
+        self.assertIn('no requests finished', self.run_command('load_test', '--requests', '0'))
+        output_path = self.folder + '/load.json'
+        output = self.run_command('load_test', '--requests', '12', '--workers', '2', '--output', output_path)
+        self.assertIn('all', output)
+        with open(output_path) as output_file:
+            self.assertEqual(json.load(output_file)['routes']['all']['requests'], 12)
+
+        self.assertIn('deleted 3 scrapbooks', self.run_command('seed_synthetic', '--delete'))
+        self.assertTrue(Scrapbook.objects.filter(pk=self.scrapbook.pk).exists())
+
+    def test_bench_pdf(self):
+        output_path = self.folder + '/bench.json'
+        output = self.run_command('bench_pdf', '--images', '2', '--size', '64x48', '--themes', 'template1',
+                                  '--runs', '1', '--no-tracemalloc', '--output', output_path)
+        self.assertIn('template1 run 1', output)
+        with open(output_path) as output_file:
+            self.assertGreater(json.load(output_file)['themes']['template1']['pdf_bytes'], 0)
+        self.assertEqual(list(Scrapbook.objects.all()), [self.scrapbook]) # its scrapbook is rolled back
+
+        # comparing with itself finds no regressions
+        self.assertIn('no regressions', self.run_command(
+            'bench_pdf', '--images', '2', '--size', '64x48', '--themes', 'template1', '--runs', '1',
+            '--no-tracemalloc', '--compare', output_path, '--threshold', '1000'))
+
+
+class MetricsTests(TestCase):
+    '''
+    Requests should only be timed when METRICS_ENABLED is True
+    '''
+
+    def new_connection(self):
+        '''
+        :return: a new connection to the test database (closed when the test finishes)
+        '''
+        new = connections.create_connection('default')
+        new.ensure_connection()
+        self.addCleanup(new.close)
+        return new
+
+    def test_queries_are_only_timed_with_metrics(self):
+        with override_settings(METRICS_ENABLED=False):
+            self.assertNotIn(database.time_query, self.new_connection().execute_wrappers)
+        with override_settings(METRICS_ENABLED=True):
+            self.assertIn(database.time_query, self.new_connection().execute_wrappers)
+
+    def test_metrics_endpoint(self):
+        with override_settings(METRICS_ENABLED=False):
+            self.assertEqual(Client().get('/metrics').status_code, 404)
+        with override_settings(METRICS_ENABLED=True):
+            client = Client() # loads the middleware with the new setting
+            response = client.post('/', {'scrapcode': 'ZZZZZZ'}) # looks the code up in the test database
+            self.assertIn('total;dur=', response['Server-Timing'])
+            response = client.get('/metrics')
+            self.assertEqual(response.status_code, 200)
+            self.assertIn('scrapbook_requests_total{view="home",method="POST"', response.content.decode())
+
+    @override_settings(METRICS_ENABLED=True)
+    def test_async_middleware(self):
+        async def get_response(request):
+            return HttpResponse('hello')
+
+        middleware = metrics.MetricsMiddleware(get_response)
+        self.assertTrue(asyncio.iscoroutinefunction(middleware)) # so Django awaits it
+        request = RequestFactory().get('/')
+        request.resolver_match = None
+        response = async_to_sync(middleware)(request)
+        self.assertIn('total;dur=', response['Server-Timing'])
@@ -0,0 +1,88 @@
+'''
+Theme assets that are loaded once per process and reused by every pdf export
+History:
+Oct 18 2026 - file creation
+Oct 18 2026 - default_fonts moved to scrapbook_template_info.py (theme files are checked against it)
+Oct 18 2026 - background() gives the file of the background instead of a pdf image object
+
+Registering fonts, building paragraph styles and finding the background image for the pdf
+only depends on the theme (and export profile), so it is done the first time a theme is used
+(or when the server starts if SCRAPBOOK_WARM_THEMES is True) instead of in every export.
+'''
+
+import threading
+
+from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+
+from scrapbooks.derivatives import background_image
+from scrapbooks.export_profiles import profiles
+from scrapbooks.scrapbook_template_info import default_fonts, get_themes
+
+
+class ThemeAssets():
+    '''
+    Everything made from a Theme that is the same in every export
+    Attributes:
+        name (str): name of the theme
+        theme (Theme): the theme
+        caption_style (ParagraphStyle): formatting of captions
+        title_style (ParagraphStyle): formatting of the title
+    '''
+
+    def __init__(self, name, theme):
+        self.name = name
+        self.theme = theme
+
+        # register fonts
+        for font in (theme.title_font, theme.caption_font):
+            if font not in default_fonts and font not in pdfmetrics.getRegisteredFontNames():
+                pdfmetrics.registerFont(TTFont(font, f'{font}.ttf'))
+
+        # set up caption formatting
+        self.caption_style = getSampleStyleSheet()['Normal']
+        self.caption_style.wordWrap = 'CJK' # wrapping
+        self.caption_style.alignment = theme.caption_align
+        self.caption_style.fontName = theme.caption_font
+        self.caption_style.fontSize = theme.caption_size
+
+        # set up title formatting
+        self.title_style = getSampleStyleSheet()['Normal']
+        self.title_style.wordWrap = 'CJK' # wrapping
+        self.title_style.alignment = theme.title_align
+        self.title_style.fontName = theme.title_font
+        self.title_style.fontSize = theme.title_size
+
+    def background(self, profile):
+        '''
+        Gets the background at the resolution of an export profile (it is resized the first time and saved
+        with the derivatives, see derivatives.background_image())
+        :param profile: the ExportProfile
+        :return: file path of the background image
+        '''
+        return background_image(self.theme, profile)
+
+
+_assets = {}
+_assets_lock = threading.Lock()
+
+def get_theme_assets(theme_name):
+    '''
+    :param theme_name: name of the theme (see scrapbook_template_info.py)
+    :return: the ThemeAssets of the theme (loaded the first time this is called)
+    '''
+    with _assets_lock:
+        if theme_name not in _assets:
+            _assets[theme_name] = ThemeAssets(theme_name, get_themes()[theme_name])
+        return _assets[theme_name]
+
+def warm_up():
+    '''
+    Loads the assets of every theme, including the backgrounds for every export profile
+    (called from ScrapbooksConfig.ready() if SCRAPBOOK_WARM_THEMES is True)
+    '''
+    for theme_name in get_themes():
+        assets = get_theme_assets(theme_name)
+        for profile in profiles.values():
+            assets.background(profile)
@@ -0,0 +1,117 @@
+'''
+Thumbnails of uploaded images for the scrapbook pages
+History:
+Oct 18 2026 - file creation
+Oct 18 2026 - thumbnails are saved in SCRAPBOOK_CACHE_ROOT instead of MEDIA_ROOT, which is served to anyone
+
+Thumbnails are made the first time they are asked for and saved in
+SCRAPBOOK_CACHE_ROOT/thumbnails/<media id>/<width>.<format> (like the pdf caches, and only sent by
+views.media_thumbnail()), so the pages don't have to send the full size photos just to show them 100 pixels wide.
+'''
+
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+from PIL import Image, ImageOps
+
+THUMBNAIL_WIDTHS = (100, 200, 400) # the only widths that are made (so the cache can't be filled with random sizes)
+
+# format name: (PIL format, file extension, content type)
+THUMBNAIL_FORMATS = {
+    'webp': ('WEBP', 'webp', 'image/webp'),
+    'jpeg': ('JPEG', 'jpg', 'image/jpeg'),
+}
+
+THUMBNAIL_QUALITY = 80
+
+# EXIF orientations where the image is turned sideways (width & height are swapped when it is displayed)
+SIDEWAYS_ORIENTATIONS = (5, 6, 7, 8)
+
+
+def thumbnails_root():
+    '''
+    :return: the folder where all thumbnails are stored
+    '''
+    return Path(settings.SCRAPBOOK_CACHE_ROOT) / 'thumbnails'
+
+def media_thumbnails_dir(media_id):
+    '''
+    :param media_id: primary key of a Media object
+    :return: the folder where the thumbnails of that Media object are stored
+    '''
+    return thumbnails_root() / str(media_id)
+
+def image_dimensions(image_file):
+    '''
+    Gets the size of an image the way browsers display it (with EXIF orientation applied)
+    without decoding the whole image
+    :param image_file: the image (file path or file object)
+    :return: (width, height)
+    '''
+    with Image.open(image_file) as image_data:
+        width, height = image_data.size
+        orientation = image_data.getexif().get(0x0112) # 0x0112 is the EXIF orientation tag
+    if orientation in SIDEWAYS_ORIENTATIONS:
+        return height, width
+    return width, height
+
+def accepted_format(request):
+    '''
+    :param request: the HttpRequest for a thumbnail
+    :return: 'webp' if the browser accepts webp images, otherwise 'jpeg'
+    '''
+    if 'image/webp' in request.META.get('HTTP_ACCEPT', ''):
+        return 'webp'
+    return 'jpeg'
+
+def get_thumbnail(media, width, thumbnail_format):
+    '''
+    Gets a thumbnail of a Media object's image, making it first if it doesn't exist
+    :param media: the Media object
+    :param width: one of THUMBNAIL_WIDTHS
+    :param thumbnail_format: one of THUMBNAIL_FORMATS
+    :return: file path of the thumbnail
+    '''
+    pil_format, extension, _ = THUMBNAIL_FORMATS[thumbnail_format]
+    folder = media_thumbnails_dir(media.id)
+    path = folder / f'{width}.{extension}'
+
+    if not path.is_file():
+        folder.mkdir(parents=True, exist_ok=True)
+        media.image.open('rb')
+        try:
+            with Image.open(media.image) as image_data:
+                image_data.draft('RGB', (width, width)) # jpegs can be decoded at a smaller size
+                image_data = ImageOps.exif_transpose(image_data) # so photos aren't sideways
+                if image_data.mode in ('RGBA', 'LA', 'P'):
+                    # jpeg can't be transparent, so put the image on a white background
+                    image_data = image_data.convert('RGBA')
+                    background = Image.new('RGBA', image_data.size, (255, 255, 255, 255))
+                    image_data = Image.alpha_composite(background, image_data)
+                image_data = image_data.convert('RGB')
+                if image_data.width > width:
+                    image_data = image_data.resize((width, max(1, round(image_data.height * width / image_data.width))),
+                                                   Image.LANCZOS)
+                # write to a temporary file first so a half-written thumbnail is never sent
+                fd, tmp_path = tempfile.mkstemp(dir=folder, suffix='.tmp')
+                try:
+                    with os.fdopen(fd, 'wb') as tmp_file:
+                        image_data.save(tmp_file, format=pil_format, quality=THUMBNAIL_QUALITY)
+                    os.replace(tmp_path, path)
+                except BaseException:
+                    os.remove(tmp_path)
+                    raise
+        finally:
+            media.image.close()
+
+    return str(path)
+
+def delete_thumbnails(media_id):
+    '''
+    Removes every thumbnail of a Media object
+    :param media_id: primary key of the Media object
+    '''
+    shutil.rmtree(media_thumbnails_dir(media_id), ignore_errors=True)
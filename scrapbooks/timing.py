@@ -0,0 +1,84 @@
+'''
+Recording how long each stage of some work takes
+History:
+Oct 18 2026 - file creation
+Oct 18 2026 - added SQL & STORE stages, recordings are also made for every request by metrics.py
+
+Code that does something worth measuring wraps it in stage() (e.g. with stage('resize'): ...).
+That does nothing unless a recording() is active in the same context, so it costs almost nothing
+normally. "python manage.py bench_pdf" records pdf exports this way, and MetricsMiddleware
+records every request when METRICS_ENABLED is True. The current recording is
+kept in a ContextVar, so separate threads and async tasks each see their own.
+'''
+
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# stages of a pdf export or an upload
+DECODE = 'decode' # reading an image file
+ROTATE = 'rotate'
+RESIZE = 'resize'
+ENCODE = 'encode' # saving a resized or normalized image (see derivatives.py & ingest.py)
+DRAW = 'draw' # putting images & text on the pdf pages
+SAVE = 'save' # writing the pdf
+STORE = 'store' # writing an uploaded image to storage
+SQL = 'sql' # database queries (timed by database.py)
+
+_current = ContextVar('scrapbook_timings', default=None)
+
+
+class StageTimings():
+    '''
+    Total wall time spent in each stage
+    Attributes:
+        seconds (dict): stage name: total seconds
+        counts (dict): stage name: number of times the stage was entered
+    '''
+    def __init__(self):
+        self.seconds = {}
+        self.counts = {}
+
+    def add(self, name, seconds):
+        '''
+        :param name: the stage
+        :param seconds: time spent in it
+        '''
+        self.seconds[name] = self.seconds.get(name, 0.0) + seconds
+        self.counts[name] = self.counts.get(name, 0) + 1
+
+
+@contextmanager
+def recording():
+    '''
+    Records the stages entered inside the with block
+    :return: the StageTimings (from "with recording() as timings:")
+    '''
+    timings = StageTimings()
+    token = _current.set(timings)
+    try:
+        yield timings
+    finally:
+        _current.reset(token)
+
+def current():
+    '''
+    :return: the StageTimings being recorded, or None
+    '''
+    return _current.get()
+
+@contextmanager
+def stage(name):
+    '''
+    Adds the time spent inside the with block to the current recording (if there is one)
+    :param name: the stage
+    '''
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, time.perf_counter() - start)
@@ -6,6 +6,11 @@ Mar 27 2024 - added "save/" path
 Apr 10 2024 – added "edit_media/" path
 Apr 12 2024 – added "confirm_delete/" and "delete/" paths for Media objects
 May 19 2024 - added "confirm_delete/" and "delete/" paths for Scrapbook objects
+Oct 18 2026 - added "save/<job_id>/" and "save/<job_id>/download/" paths for background pdf jobs
+Oct 18 2026 - added "<media_id>/thumbnail/<width>/" path
+Oct 18 2026 - added "media/" path
+Oct 18 2026 - added "upload/" path
+Oct 18 2026 - added "uploads/" paths for resumable uploads
 '''
 
 from django.urls import path
@@ -13,11 +18,19 @@ from . import views
 urlpatterns = [
     path("new/", views.new_scrapbook_project, name="new_scrapbook"), # the view where the user enters information to create a new scrapbook project
     path("<str:scrapbook_id>/", views.scrapbook_project, name="scrapbook_project"), # the view where the user can upload content to a scrapbook progect
+    path("<str:scrapbook_id>/upload/", views.bulk_upload, name="bulk_upload"), # upload many images at once
+    path("<str:scrapbook_id>/uploads/", views.start_chunked_upload, name="start_chunked_upload"), # start a resumable upload
+    path("<str:scrapbook_id>/uploads/<uuid:upload_id>/", views.chunked_upload, name="chunked_upload"), # send a chunk of a resumable upload
+    path("<str:scrapbook_id>/uploads/<uuid:upload_id>/finalize/", views.finish_chunked_upload, name="finish_chunked_upload"), # finish a resumable upload
+    path("<str:scrapbook_id>/media/", views.scrapbook_media_rows, name="scrapbook_media_rows"), # more rows of the media table (?after=<media id>)
     path("<str:scrapbook_id>/save/", views.create_pdf, name="create_pdf"), #the view which allows the user to create a pdf of their images_in_static and text
+    path("<str:scrapbook_id>/save/<uuid:job_id>/", views.pdf_job_status, name="pdf_job_status"), # status of a background pdf job
+    path("<str:scrapbook_id>/save/<uuid:job_id>/download/", views.download_pdf_job, name="download_pdf_job"), # download the pdf made by a background job
     path("<str:scrapbook_id>/edit/", views.edit_scrapbook, name="edit_scrapbook"), # the view where the user can edit the settings of a scrapbook project
     path("<str:scrapbook_id>/confirm_delete/", views.confirm_delete_scrapbook, name="confirm_delete_scrapbook"), # view to confirm delete of scrapbook project
     path("<str:scrapbook_id>/delete/", views.delete_scrapbook, name="delete_scrapbook"), # delete scrapbook project
     path("<str:scrapbook_id>/<int:media_id>/", views.edit_media, name="edit_media"), # the view where the user can edit a media object
     path("<str:scrapbook_id>/<int:media_id>/confirm_delete/", views.confirm_delete_media, name="confirm_delete_media"), # the view where the user can delete a media object
     path("<str:scrapbook_id>/<int:media_id>/delete/", views.delete_media, name="delete_media"), # the view where the user can delete a media object
+    path("<str:scrapbook_id>/<int:media_id>/thumbnail/<int:width>/", views.media_thumbnail, name="media_thumbnail"), # a small version of a media object's image
 ]
\ No newline at end of file
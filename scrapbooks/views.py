@@ -24,39 +24,94 @@ May 19 2024 - caption field in media upload form in scrapbook_project() clears a
               added confirm_delete_scrapbook() and delete_scrapbook()
 May 22 2024 - nonexistent Scrapbook or Media now raises a 404 error instead of 500
 May 23 2024 - updated to reflect changes to names of html files
+Oct 18 2026 - create_pdf() gets rotated & resized images from the derivative cache instead of making them every time
+Oct 18 2026 - moved pdf drawing to pdf_export.py, create_pdf() now streams the pdf from a temporary file
+Oct 18 2026 - create_pdf() reuses cached pdfs and supports ETag/If-None-Match, edits clear the cached pdfs
+Oct 18 2026 - create_pdf() can queue a background job (?job=1), added pdf_job_status() and download_pdf_job()
+Oct 18 2026 - deleting a scrapbook deletes all its cached pdfs, edits only the ones of older revisions
+Oct 18 2026 - create_pdf() takes an export profile (?profile=draft, screen or print)
+Oct 18 2026 - added media_thumbnail()
+Oct 18 2026 - new_scrapbook_project() uses Scrapbook.create_scrapbook() so codes are never reused
+Oct 18 2026 - scrapbook_project() shows media in pages (?after=<media id>), added scrapbook_media_rows()
+Oct 18 2026 - added bulk_upload()
+Oct 18 2026 - added start_chunked_upload(), chunked_upload() and finish_chunked_upload() for resumable uploads
+Oct 18 2026 - delete_scrapbook() deletes the media rows together and leaves the files for collect_garbage
+Oct 18 2026 - bulk_upload() normalizes images like single uploads (see ingest.py)
+Oct 18 2026 - scrapbook_project(), edit_media(), the confirm delete views and create_pdf() are async and do
+              their work in thread pools (see offload.py)
+Oct 18 2026 - added prometheus_metrics()
+Oct 18 2026 - new_scrapbook_project() and edit_scrapbook() show the sample picture of every theme
+Oct 18 2026 - bulk_upload() changes the scrapbook's updated_at (bulk_create() doesn't send post_save)
+Oct 18 2026 - bulk_upload() records the files of rows that weren't saved in OrphanedFile instead of deleting them
+Oct 18 2026 - media_thumbnail() only lets browsers keep a thumbnail for a year if its url has the current image version
+Oct 18 2026 - delete_scrapbook() also deletes the scrapbook's cached pdf pages (see page_cache.py)
 '''
 
 # for page rendering & similar
 from django.shortcuts import render, Http404, HttpResponseRedirect
-from django.http import HttpResponse, HttpResponseNotFound
+from django.http import HttpResponse, HttpResponseNotFound, HttpResponseBadRequest, HttpResponseNotAllowed, FileResponse, JsonResponse
+from django.conf import settings
 
 # forms & models
-from .models import Scrapbook, Media
-from scrapbooks.forms import UploadContentForm, InfoForm, EditCaptionForm
-
-# miscellaneous pdf generation stuff
-from reportlab.lib.pagesizes import A4
-from reportlab.lib.utils import ImageReader, simpleSplit
-from reportlab.lib.units import inch, cm
-from reportlab.pdfgen import canvas
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.platypus import Paragraph, Frame, KeepInFrame
-from scrapbooks.scrapbook_template_info import Box, Theme, themes
-from PIL import Image
-
-# ReportLab - fonts
-import reportlab.rl_config
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
-
-# debugging
-from pprint import pprint
-
-reportlab.rl_config.warnOnMissingFontGlyphs = 0 # to avoid making reportlab angry
+from .models import Scrapbook, Media, OrphanedFile, PdfJob, UploadSession
+from scrapbooks.forms import UploadContentForm, InfoForm, EditCaptionForm, BulkMediaForm
+from django.db import transaction
+from django.views.decorators.http import require_POST
+from scrapbooks.ingest import ingest_media
+from scrapbooks import chunked_uploads, garbage, offload
+from scrapbooks.scrapbook_template_info import get_themes
+
+# pdf generation
+from django.utils.cache import get_conditional_response
+from scrapbooks import pdf_cache, page_cache, jobs
+from scrapbooks.pdf_export import render_scrapbook_pdf, pdf_file_name
+from scrapbooks.export_profiles import profiles
+
+# thumbnails
+from django.utils.cache import patch_vary_headers
+from scrapbooks.thumbnails import THUMBNAIL_WIDTHS, THUMBNAIL_FORMATS, accepted_format, get_thumbnail
+
+# instrumentation
+from scrapbooks import metrics
+
+def media_page(user_scrapbook, after):
+    '''
+    Gets a page of a scrapbook's media in upload order. Pages start after a media id instead of at an
+    offset, so later pages are as quick to find as the first one and don't shift when media is added or deleted.
+    :param user_scrapbook: the Scrapbook object
+    :param after: id of the last Media object on the previous page (0 for the first page)
+    :return: (list of Media objects, id to get the next page with or None if this is the last page)
+    '''
+    page_size = settings.MEDIA_PAGE_SIZE
+    # get one extra to know if there is another page
+    media = list(user_scrapbook.media_set.filter(id__gt=after).order_by('id')[:page_size + 1])
+    if len(media) > page_size:
+        return media[:page_size], media[page_size - 1].id
+    return media, None
+
+def get_after(request):
+    '''
+    :param request:
+    :return: the ?after= media id of a request (0 if there isn't one), or None if it isn't a valid id
+    '''
+    after = request.GET.get('after', '0')
+    if not after.isdigit():
+        return None
+    return int(after)
 
-def scrapbook_project(request, scrapbook_id):
+async def scrapbook_project(request, scrapbook_id):
     '''
     The main page for a scrapbook project, where the user can upload media
+    (made by scrapbook_project_page() in a page thread, see offload.py)
+    :param request:
+    :param scrapbook_id: the scrapbook code of the scrapbook project the user is accessing
+    :return:
+    '''
+    return await offload.run(offload.PAGES, scrapbook_project_page, request, scrapbook_id)
+
+def scrapbook_project_page(request, scrapbook_id):
+    '''
+    Does the work of scrapbook_project()
     :param request:
     :param scrapbook_id: the scrapbook code of the scrapbook project the user is accessing
     :return:
@@ -67,12 +122,17 @@ def scrapbook_project(request, scrapbook_id):
     except Scrapbook.DoesNotExist:
         raise Http404()
 
+    after = get_after(request) # the media shown start after this id
+    if after is None:
+        return HttpResponseBadRequest('after must be a media id')
+
     # save the media if POST
     if request.method == "POST":
         form = UploadContentForm(request.POST, request.FILES)
         if form.is_valid():
             new_media = Media(scrapbook=user_scrapbook, image=form.cleaned_data['image'], caption=form.cleaned_data['caption'])
             new_media.save()
+            pdf_cache.invalidate(user_scrapbook)
             print(f'image location:{new_media.image}')
             form = UploadContentForm()
         else:
@@ -82,14 +142,228 @@ def scrapbook_project(request, scrapbook_id):
     else:
         form = UploadContentForm()
 
+    scrapbook_media, next_after = media_page(user_scrapbook, after)
+
     context = {
         "scrapbook": user_scrapbook,
         "form": form,
-        "scrapbook_media": user_scrapbook.media_set.all()
+        "scrapbook_media": scrapbook_media,
+        "after": after,
+        "next_after": next_after
     }
 
     return render(request, "scrapbooks/scrapbook_project.html", context)
 
+@require_POST
+def bulk_upload(request, scrapbook_id):
+    '''
+    Uploads many images to a scrapbook in one request. The images are sent as "images" and the
+    optional captions as "captions" (in the same order). Every image is checked first, then all
+    the valid ones are saved together.
+    :param request:
+    :param scrapbook_id: the scrapbook code of the scrapbook project
+    :return: JSON with a result for each file
+    '''
+
+    # check the size before reading the upload
+    try:
+        content_length = int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        return HttpResponseBadRequest('invalid Content-Length')
+    if content_length > settings.BULK_UPLOAD_MAX_BYTES:
+        return JsonResponse({'error': f'uploads can be at most {settings.BULK_UPLOAD_MAX_BYTES} bytes'}, status=413)
+
+    try:
+        user_scrapbook = Scrapbook.objects.get(scrapbook_code=scrapbook_id) # the scrapbook project being accessed
+    except Scrapbook.DoesNotExist:
+        raise Http404()
+
+    images = request.FILES.getlist('images')
+    captions = request.POST.getlist('captions')
+    if not images:
+        return JsonResponse({'error': 'no images were sent'}, status=400)
+    if len(images) > settings.BULK_UPLOAD_MAX_FILES:
+        return JsonResponse({'error': f'at most {settings.BULK_UPLOAD_MAX_FILES} images can be uploaded at once'},
+                            status=413)
+    if sum(image.size for image in images) > settings.BULK_UPLOAD_MAX_BYTES:
+        return JsonResponse({'error': f'uploads can be at most {settings.BULK_UPLOAD_MAX_BYTES} bytes'}, status=413)
+
+    # check every file before saving any of them
+    results = []
+    new_media = []
+    for n, image in enumerate(images):
+        caption = captions[n] if n < len(captions) else ''
+        form = BulkMediaForm({'caption': caption}, {'image': image})
+        if not form.is_valid():
+            results.append({'file': image.name, 'ok': False,
+                            'errors': [error for errors in form.errors.values() for error in errors]})
+            continue
+
+        media = Media(scrapbook=user_scrapbook, image=form.cleaned_data['image'], caption=form.cleaned_data['caption'])
+        # bulk_create() doesn't send pre_save, so normalize the image & set its size here
+        ingest_media(media)
+        results.append({'file': image.name, 'ok': True})
+        new_media.append((len(results) - 1, media))
+
+    if new_media:
+        try:
+            with transaction.atomic():
+                # the image files are saved to storage as the rows are inserted
+                Media.objects.bulk_create([media for n, media in new_media])
+                Scrapbook.mark_updated(user_scrapbook.pk)
+
+                # some databases (SQLite) don't give back the ids of inserted rows. Nothing else can insert
+                # while this transaction is writing there, so the rows are the newest ones, in order.
+                if any(media.pk is None for n, media in new_media):
+                    ids = user_scrapbook.media_set.order_by('-id').values_list('id', flat=True)[:len(new_media)]
+                    for (n, media), media_id in zip(new_media, reversed(ids)):
+                        media.pk = media_id
+        except Exception:
+            # don't leave files behind for rows that weren't saved (collect_garbage deletes them unless
+            # something uses them, they can be shared, see storage.py)
+            OrphanedFile.objects.bulk_create([OrphanedFile(image=media.image.name if media.image._committed else '',
+                                                           original=media.original.name or '')
+                                              for n, media in new_media])
+            raise
+
+        for n, media in new_media:
+            results[n]['media_id'] = media.pk
+        pdf_cache.invalidate(user_scrapbook)
+
+    return JsonResponse({'created': len(new_media), 'results': results}, status=201 if new_media else 400)
+
+def upload_details(session):
+    '''
+    :param session: an UploadSession object
+    :return: dictionary describing the upload (sent as JSON)
+    '''
+    return {
+        'upload_id': str(session.upload_id),
+        'size': session.size,
+        'offset': session.received,
+        'upload_url': f'/Scrapbook_project/{session.scrapbook.scrapbook_code}/uploads/{session.upload_id}/',
+        'finalize_url': f'/Scrapbook_project/{session.scrapbook.scrapbook_code}/uploads/{session.upload_id}/finalize/'
+    }
+
+@require_POST
+def start_chunked_upload(request, scrapbook_id):
+    '''
+    Starts a resumable upload (see chunked_uploads.py). Takes "file_name", "size" and optionally "caption".
+    :param request:
+    :param scrapbook_id: the scrapbook code of the scrapbook project
+    :return: JSON with the upload id and urls to send the file to
+    '''
+
+    try:
+        user_scrapbook = Scrapbook.objects.get(scrapbook_code=scrapbook_id) # the scrapbook project being accessed
+    except Scrapbook.DoesNotExist:
+        raise Http404()
+
+    file_name = request.POST.get('file_name', '')
+    size = request.POST.get('size', '')
+    caption = request.POST.get('caption', '')
+    if not file_name or not size.isdigit() or int(size) == 0:
+        return JsonResponse({'error': 'file_name and size are needed'}, status=400)
+    if int(size) > settings.CHUNKED_UPLOAD_MAX_BYTES:
+        return JsonResponse({'error': f'files can be at most {settings.CHUNKED_UPLOAD_MAX_BYTES} bytes'}, status=413)
+    if len(caption) > 400:
+        return JsonResponse({'error': 'captions can be at most 400 characters'}, status=400)
+
+    session = chunked_uploads.start_upload(user_scrapbook, file_name, int(size), caption)
+    return JsonResponse(upload_details(session), status=201)
+
+def chunked_upload(request, scrapbook_id, upload_id):
+    '''
+    GET: how much of a resumable upload has been received
+    PUT: sends the next chunk of the file (the request body) starting at ?offset=
+    :param request:
+    :param scrapbook_id: the scrapbook code of the scrapbook project
+    :param upload_id: upload_id of the UploadSession
+    :return: JSON with the offset the next chunk starts at
+    '''
+
+    try:
+        session = UploadSession.objects.select_related('scrapbook').get(upload_id=upload_id,
+                                                                        scrapbook__scrapbook_code=scrapbook_id)
+    except UploadSession.DoesNotExist:
+        raise Http404()
+
+    if request.method == 'GET':
+        return JsonResponse(upload_details(session))
+    if request.method != 'PUT':
+        return HttpResponseNotAllowed(['GET', 'PUT'])
+
+    offset = request.GET.get('offset', '')
+    length = request.META.get('CONTENT_LENGTH', '')
+    if not offset.isdigit() or not length.isdigit():
+        return JsonResponse({'error': 'offset and Content-Length are needed'}, status=400)
+    if int(length) > settings.CHUNKED_UPLOAD_MAX_CHUNK_BYTES:
+        return JsonResponse({'error': f'chunks can be at most {settings.CHUNKED_UPLOAD_MAX_CHUNK_BYTES} bytes'},
+                            status=413)
+
+    try:
+        # the body is read a bit at a time straight into the file
+        chunked_uploads.append_chunk(session, int(offset), request, int(length))
+    except chunked_uploads.ChunkError as e:
+        details = upload_details(session)
+        details['error'] = e.message
+        return JsonResponse(details, status=e.status)
+    return JsonResponse(upload_details(session))
+
+@require_POST
+def finish_chunked_upload(request, scrapbook_id, upload_id):
+    '''
+    Finishes a resumable upload once every chunk has been sent and adds the image to the scrapbook.
+    Optionally takes "sha256", the checksum of the whole file, to check nothing was corrupted.
+    :param request:
+    :param scrapbook_id: the scrapbook code of the scrapbook project
+    :param upload_id: upload_id of the UploadSession
+    :return: JSON with the id of the new Media object
+    '''
+
+    try:
+        session = UploadSession.objects.select_related('scrapbook').get(upload_id=upload_id,
+                                                                        scrapbook__scrapbook_code=scrapbook_id)
+    except UploadSession.DoesNotExist:
+        raise Http404()
+
+    try:
+        new_media, checksum = chunked_uploads.finish_upload(session, request.POST.get('sha256', ''))
+    except chunked_uploads.ChunkError as e:
+        details = upload_details(session)
+        details['error'] = e.message
+        return JsonResponse(details, status=e.status)
+
+    pdf_cache.invalidate(session.scrapbook)
+    return JsonResponse({'media_id': new_media.id, 'sha256': checksum}, status=201)
+
+def scrapbook_media_rows(request, scrapbook_id):
+    '''
+    Just the rows of the media table for a page of media, so scrapbook_project.html can load more without reloading
+    :param request:
+    :param scrapbook_id: the scrapbook code of the scrapbook project
+    :return:
+    '''
+
+    try:
+        user_scrapbook = Scrapbook.objects.get(scrapbook_code=scrapbook_id) # the scrapbook project being accessed
+    except Scrapbook.DoesNotExist:
+        raise Http404()
+
+    after = get_after(request)
+    if after is None:
+        return HttpResponseBadRequest('after must be a media id')
+
+    scrapbook_media, next_after = media_page(user_scrapbook, after)
+
+    context = {
+        "scrapbook": user_scrapbook,
+        "scrapbook_media": scrapbook_media,
+        "next_after": next_after
+    }
+
+    return render(request, "scrapbooks/media_rows.html", context)
+
 def edit_scrapbook(request, scrapbook_id):
     '''
     The page where the user can edit the settings of a scrapbook project
@@ -114,6 +388,7 @@ def edit_scrapbook(request, scrapbook_id):
             user_scrapbook.scrapbook_name = form.cleaned_data['scrapbook_name']
             user_scrapbook.scrapbook_theme = form.cleaned_data['scrapbook_theme']
             user_scrapbook.save()
+            pdf_cache.invalidate(user_scrapbook)
             print(f"AFTER SAVING: name: {user_scrapbook.scrapbook_name}, theme: {user_scrapbook.scrapbook_theme}")
     # if a GET (or any other method), prepopulate the form with details from user_scrapbook
     else:
@@ -121,18 +396,28 @@ def edit_scrapbook(request, scrapbook_id):
 
     context = {
         "scrapbook": user_scrapbook,
-        "form": form
+        "form": form,
+        "themes": get_themes().values()
     }
 
     return render(request, "scrapbooks/edit_scrapbook_details.html", context)
 
-def confirm_delete_scrapbook(request, scrapbook_id):
+async def confirm_delete_scrapbook(request, scrapbook_id):
     '''
-    view to confirm delete of a scrapbook project
+    view to confirm delete of a scrapbook project (made by confirm_delete_scrapbook_page() in a page thread)
     :param request:
     :param scrapbook_id: scrapbook code of Scrapbook object to be deleted
     :return:
 
+    '''
+    return await offload.run(offload.PAGES, confirm_delete_scrapbook_page, request, scrapbook_id)
+
+def confirm_delete_scrapbook_page(request, scrapbook_id):
+    '''
+    Does the work of confirm_delete_scrapbook()
+    :param request:
+    :param scrapbook_id: scrapbook code of Scrapbook object to be deleted
+    :return:
     '''
 
     try:
@@ -159,8 +444,10 @@ def delete_scrapbook(request, scrapbook_id):
     except Scrapbook.DoesNotExist:
         raise Http404()
 
-    # delete the object and redirect to homepage
-    user_scrapbook.delete()
+    # delete the object and redirect to homepage (the image files are deleted later by "manage.py collect_garbage")
+    pdf_cache.invalidate(user_scrapbook, deleted=True)
+    page_cache.delete_pages(user_scrapbook)
+    garbage.delete_scrapbook(user_scrapbook)
     return HttpResponseRedirect("/")
 
 def new_scrapbook_project(request):
@@ -175,9 +462,8 @@ def new_scrapbook_project(request):
         form = InfoForm(request.POST)
         # check whether it's valid:
         if form.is_valid():
-            created_scrapbook = Scrapbook.new_scrapbook(form.cleaned_data['scrapbook_name'], form.cleaned_data['scrapbook_theme']) # when InfoForm was a normal Form: Scrapbook.new_scrapbook(form.scrapbook_name, form.scrapbook_theme)
+            created_scrapbook = Scrapbook.create_scrapbook(form.cleaned_data['scrapbook_name'], form.cleaned_data['scrapbook_theme']) # when InfoForm was a normal Form: Scrapbook.new_scrapbook(form.scrapbook_name, form.scrapbook_theme)
             print(f"newly created scrapbook {created_scrapbook}: name = {created_scrapbook.scrapbook_name}, theme = {created_scrapbook.scrapbook_theme}")
-            created_scrapbook.save()
             # redirect to the page for uploading to the scrapbook corresponding to the entered code
             return HttpResponseRedirect(f"/Scrapbook_project/{created_scrapbook.scrapbook_code}/")
 
@@ -186,130 +472,151 @@ def new_scrapbook_project(request):
         form = InfoForm()
 
     context = {
-        "form" : form
+        "form" : form,
+        "themes": get_themes().values()
     }
 
     return render(request, "scrapbooks/new_scrapbook.html", context)
 
-def create_pdf(request, scrapbook_id):
+async def create_pdf(request, scrapbook_id):
     '''
-    Makes a pdf from a scrapbook's media
+    Makes a pdf from a scrapbook's media. Everything except drawing the pdf is done in a page thread,
+    and a pdf that isn't cached yet is drawn in an export thread (see offload.py).
     :param request:
     :param scrapbook_id: the id of the scrapbook
     :return: the scrapbook pdf
     '''
-    user_scrapbook = Scrapbook.objects.get(scrapbook_code=scrapbook_id)  # the scrapbook project being accessed
-    response = HttpResponse(content_type='application/pdf')
-    new_file_name = user_scrapbook.scrapbook_name.replace(' ', '_')
-    response['Content-Disposition'] = f'attachment; filename="{new_file_name}.pdf"'
-
-    user_scrapbook.scrapbook_name.replace(' ', '_') # name of pdf from scrapbook title
-
-    theme = themes[user_scrapbook.scrapbook_theme]
-
-    pdf_canvas = canvas.Canvas(response, pagesize=A4, pageCompression=1)
-
-    # register fonts
-    default_fonts = ['Courier', 'Courier-Bold', 'Courier-Oblique', 'Courier-BoldOblique',
-    'Helvetica', 'Helvetica-Bold', 'Helvetica-Oblique', 'Helvetica-BoldOblique',
-    'Times-Roman', 'Times-Bold', 'Times-Italic', 'Times-BoldItalic', 'Symbol','ZapfDingbats']
-
-    if theme.title_font not in default_fonts:
-        pdfmetrics.registerFont(TTFont(theme.title_font, f'{theme.title_font}.ttf'))
-    if theme.caption_font not in default_fonts:
-        pdfmetrics.registerFont(TTFont(theme.caption_font, f'{theme.caption_font}.ttf'))
-
-    # set up caption formatting
-    caption_style = getSampleStyleSheet()['Normal']
-    caption_style.wordWrap = 'CJK' # wrapping
-    caption_style.alignment = theme.caption_align
-    caption_style.fontName = theme.caption_font
-    caption_style.fontSize = theme.caption_size
-
-    # set up title formatting
-    title_style = getSampleStyleSheet()['Normal']
-    title_style.wordWrap = 'CJK' # wrapping
-    title_style.alignment = theme.title_align
-    title_style.fontName = theme.title_font
-    title_style.fontSize = theme.title_size
-
-    # draw background & title on first page
-    # background
-    bg = ImageReader(theme.bg)
-    pdf_canvas.drawImage(bg, 0, 0, 21 * cm, 29.7 * cm)
-
-    # title
-    title_pos = theme.title_pos
-    title_frame = Frame(title_pos.x * cm, title_pos.y * cm, title_pos.width * cm, title_pos.height * cm,
-                  id='normal')
-    title = [Paragraph(user_scrapbook.scrapbook_name, title_style)]
-    title_inframe = KeepInFrame(title_pos.width*cm, title_pos.height*cm, title)
-    title_frame.addFromList([title_inframe], pdf_canvas)
-
-    # pprint(vars(caption_style)) # prints all the attributes of caption_style for debugging
-
-    for i in range(user_scrapbook.media_set.count()):
-        # new page
-        if i % theme.media_num == 0 and i != 0:
-            pdf_canvas.showPage()
-            # add background and title
-            pdf_canvas.drawImage(bg, 0, 0, 21 * cm, 29.7 * cm)
-            title_frame = Frame(title_pos.x * cm, title_pos.y * cm, title_pos.width * cm, title_pos.height * cm,
-                          id='normal')
-            title_frame.addFromList([title_inframe], pdf_canvas)
-
-        # get dimensions for this image
-        dimensions = theme.image_pos_list[i % theme.media_num]
-
-        # convert image to usable format
-        m = user_scrapbook.media_set.all()[i]
-        image_data = Image.open(m.image)
-
-        # for rotation of images - from https://stackoverflow.com/questions/5252170/specify-image-filling-color-when-rotating-in-python-with-pil-and-setting-expand
-        #image_data = image_data.rotate(dimensions.rotation, expand=True)
-        # converted to have an alpha layer
-        im2 = image_data.convert('RGBA')
-        # rotated image
-        rot = im2.rotate(dimensions.rotation, expand=1)
-        # a transparent image same size as rotated image
-        all_transparent = Image.new('RGBA', rot.size, (0,) * 4)
-        # create a composite image using the alpha layer of rot as a mask
-        image_data = Image.composite(rot, all_transparent, rot)
-
-        image_original_size = image_data.size # size of original image (rotated)
-
-        # scale image
-        width_factor = dimensions.width * cm / image_original_size[0]
-        height_factor = dimensions.height * cm / image_original_size[1]
-        scaling_factor = min(width_factor, height_factor)
-        resolution_factor = 3 # set higher resolution factor for higher resolution images
-
-        image_data = image_data.resize((int(image_original_size[0] * scaling_factor * resolution_factor), int(image_original_size[1] * scaling_factor * resolution_factor)), Image.ANTIALIAS)
-
-        img = ImageReader(image_data)
-
-
-        # draw image and caption on canvas
-        pdf_canvas.drawImage(img, dimensions.x * cm + (dimensions.width * cm - img.getSize()[0] / resolution_factor) / 2,
-                             dimensions.y * cm + (dimensions.height * cm - img.getSize()[1] / resolution_factor) / 2,
-                             (img.getSize()[0] / resolution_factor), (img.getSize()[1] / resolution_factor), mask='auto')
-
-        # draw caption
-        caption_pos = theme.captions_pos_list[i % theme.media_num]
-        caption_frame = Frame(caption_pos.x * cm, caption_pos.y * cm, caption_pos.width * cm, caption_pos.height * cm,
-                      id='normal')
-        caption_text = [Paragraph(m.caption, caption_style)]
-        caption_inframe = KeepInFrame(caption_pos.width * cm, caption_pos.height * cm, caption_text, mode='overflow')
-        caption_frame.addFromList([caption_inframe], pdf_canvas)
-        # frame.drawBoundary(pdf_canvas) # for debugging
-
-    pdf_canvas.save()
+    response = await offload.run(offload.PAGES, pdf_response, request, scrapbook_id, False)
+    if response is None:
+        response = await offload.run(offload.EXPORTS, pdf_response, request, scrapbook_id, True)
+    return response
+
+def pdf_response(request, scrapbook_id, draw):
+    '''
+    Does the work of create_pdf()
+    :param request:
+    :param scrapbook_id: the id of the scrapbook
+    :param draw: whether to draw the pdf if it isn't in the cache
+    :return: the response, or None if the pdf would have to be drawn and draw is False
+    '''
+
+    try:
+        user_scrapbook = Scrapbook.objects.get(scrapbook_code=scrapbook_id)  # the scrapbook project being accessed
+    except Scrapbook.DoesNotExist:
+        raise Http404()
 
+    # quality of the pdf (?profile=draft, screen or print)
+    profile_name = request.GET.get('profile', settings.PDF_DEFAULT_PROFILE)
+    if profile_name not in profiles:
+        return HttpResponseBadRequest(f"Unknown profile – use one of: {', '.join(profiles)}")
+    profile = profiles[profile_name]
+
+    # job mode (?job=1): render in the background and give back a job id instead of the pdf
+    if request.GET.get('job'):
+        job = jobs.enqueue(user_scrapbook, profile)
+        return JsonResponse(job_details(job), status=202)
+
+    # if the browser already has this revision of the pdf, tell it to use that
+    revision = pdf_cache.scrapbook_revision(user_scrapbook)
+    etag = f'"{revision}-{profile.name}"'
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is not None:
+        not_modified['ETag'] = etag
+        return not_modified
+
+    # use the cached pdf if there is one, otherwise draw it into the cache
+    # (either way the pdf is sent from a file in chunks)
+    pdf_path = pdf_cache.cached_pdf_path(user_scrapbook, revision, profile)
+    if pdf_path is None:
+        if not draw:
+            return None
+        pdf_path = pdf_cache.store_pdf(user_scrapbook, revision, profile,
+                                       lambda pdf_file: render_scrapbook_pdf(user_scrapbook, pdf_file, profile))
+
+    # name of pdf from scrapbook title
+    response = FileResponse(open(pdf_path, 'rb'), as_attachment=True, filename=pdf_file_name(user_scrapbook),
+                            content_type='application/pdf')
+    response['ETag'] = etag
+    response['Cache-Control'] = 'no-cache' # browsers have to check the ETag before reusing their copy
     return response
 
-def edit_media(request, scrapbook_id, media_id):
+def job_details(job):
+    '''
+    Information about a pdf job for the job status views
+    :param job: a PdfJob object
+    :return: dictionary that is sent as json
+    '''
+    code = job.scrapbook.scrapbook_code
+    details = {
+        "job_id": str(job.job_id),
+        "status": job.status,
+        "profile": job.profile,
+        "status_url": f"/Scrapbook_project/{code}/save/{job.job_id}/",
+    }
+    if job.status == PdfJob.DONE:
+        details["download_url"] = f"/Scrapbook_project/{code}/save/{job.job_id}/download/"
+    if job.status == PdfJob.FAILED:
+        details["error"] = job.error
+    return details
+
+def pdf_job_status(request, scrapbook_id, job_id):
+    '''
+    View to check on a background pdf job
+    :param request:
+    :param scrapbook_id: scrapbook_code of the Scrapbook object being exported
+    :param job_id: job_id of the PdfJob object
+    :return: json with the status of the job
+    '''
+
+    try:
+        job = PdfJob.objects.select_related('scrapbook').get(job_id=job_id, scrapbook__scrapbook_code=scrapbook_id)
+    except PdfJob.DoesNotExist:
+        raise Http404()
+
+    return JsonResponse(job_details(job))
+
+def download_pdf_job(request, scrapbook_id, job_id):
     '''
-    View to edit a Media object
+    View to download the pdf made by a background pdf job
+    :param request:
+    :param scrapbook_id: scrapbook_code of the Scrapbook object being exported
+    :param job_id: job_id of the PdfJob object
+    :return: the scrapbook pdf, or json with the status of the job if it isn't finished
+    '''
+
+    try:
+        job = PdfJob.objects.select_related('scrapbook').get(job_id=job_id, scrapbook__scrapbook_code=scrapbook_id)
+    except PdfJob.DoesNotExist:
+        raise Http404()
+
+    if job.status != PdfJob.DONE:
+        return JsonResponse(job_details(job), status=409)
+
+    try:
+        pdf_file = open(job.pdf_path, 'rb')
+    except FileNotFoundError:
+        # the pdf was removed from the cache (the scrapbook was edited or the cache was full) so make it again
+        job = jobs.enqueue(job.scrapbook, profiles[job.profile])
+        return JsonResponse(job_details(job), status=202)
+
+    response = FileResponse(pdf_file, as_attachment=True, filename=pdf_file_name(job.scrapbook),
+                            content_type='application/pdf')
+    response['ETag'] = f'"{job.revision}-{job.profile}"'
+    return response
+
+async def edit_media(request, scrapbook_id, media_id):
+    '''
+    View to edit a Media object (made by edit_media_page() in a page thread)
+    :param request:
+    :param scrapbook_id: scrapbook_code of associated Scrapbook object
+    :param media_id: primary key of Media object to be edited
+    :return:
+    '''
+    return await offload.run(offload.PAGES, edit_media_page, request, scrapbook_id, media_id)
+
+def edit_media_page(request, scrapbook_id, media_id):
+    '''
+    Does the work of edit_media()
     :param request:
     :param scrapbook_id: scrapbook_code of associated Scrapbook object
     :param media_id: primary key of Media object to be edited
@@ -337,6 +644,7 @@ def edit_media(request, scrapbook_id, media_id):
             print(f"BEFORE SAVING: caption: {this_media.caption}")
             this_media.caption = form.cleaned_data['caption']
             this_media.save()
+            pdf_cache.invalidate(user_scrapbook)
             print(f"AFTER SAVING: caption: {this_media.caption}")
     # if a GET (or any other method), prepopulate the form with the existing caption
     else:
@@ -350,9 +658,19 @@ def edit_media(request, scrapbook_id, media_id):
 
     return render(request, "scrapbooks/edit_media.html", context)
 
-def confirm_delete_media(request, scrapbook_id, media_id):
+async def confirm_delete_media(request, scrapbook_id, media_id):
+    '''
+    view to confirm delete of a Media object (made by confirm_delete_media_page() in a page thread)
+    :param request:
+    :param scrapbook_id: scrapbook_code of associated Scrapbook object
+    :param media_id: primary key of Media object to be deleted
+    :return:
+    '''
+    return await offload.run(offload.PAGES, confirm_delete_media_page, request, scrapbook_id, media_id)
+
+def confirm_delete_media_page(request, scrapbook_id, media_id):
     '''
-    view to confirm delete of a Media object
+    Does the work of confirm_delete_media()
     :param request:
     :param scrapbook_id: scrapbook_code of associated Scrapbook object
     :param media_id: primary key of Media object to be deleted
@@ -398,4 +716,50 @@ def delete_media(request, scrapbook_id, media_id):
     # delete the object and redirect to the main scrapbook page
     else:
         this_media.delete()
+        pdf_cache.invalidate(user_scrapbook)
         return HttpResponseRedirect(f"/Scrapbook_project/{user_scrapbook.scrapbook_code}/")
+
+def media_thumbnail(request, scrapbook_id, media_id, width):
+    '''
+    Sends a thumbnail of a Media object's image (webp if the browser accepts it, otherwise jpeg)
+    :param request:
+    :param scrapbook_id: scrapbook_code of associated Scrapbook object
+    :param media_id: primary key of the Media object
+    :param width: width of the thumbnail (one of thumbnails.THUMBNAIL_WIDTHS)
+    :return:
+    '''
+
+    if width not in THUMBNAIL_WIDTHS:
+        raise Http404()
+
+    try:
+        this_media = Media.objects.get(id=media_id, scrapbook__scrapbook_code=scrapbook_id)  # the Media object
+    except Media.DoesNotExist:
+        raise Http404()
+
+    thumbnail_format = accepted_format(request)
+    try:
+        thumbnail_path = get_thumbnail(this_media, width, thumbnail_format)
+    except (OSError, ValueError):
+        raise Http404() # the image file is missing or broken
+
+    response = FileResponse(open(thumbnail_path, 'rb'), content_type=THUMBNAIL_FORMATS[thumbnail_format][2])
+    if request.GET.get('v') == this_media.thumbnail_version:
+        # the url has the image's version (see Media.thumbnail_url()), so it always shows the same picture
+        response['Cache-Control'] = 'public, max-age=31536000'
+    else:
+        response['Cache-Control'] = 'no-cache' # an old url, or one without a version, has to be checked again
+    patch_vary_headers(response, ['Accept'])
+    return response
+
+def prometheus_metrics(request):
+    '''
+    The request totals recorded by metrics.MetricsMiddleware, for Prometheus to collect
+    :param request:
+    :return: the totals in the Prometheus text format (404 if METRICS_ENABLED is False)
+    '''
+
+    if not settings.METRICS_ENABLED:
+        raise Http404()
+
+    return HttpResponse(metrics.registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')